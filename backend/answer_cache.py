@@ -0,0 +1,227 @@
+"""Cache of tutor answers to context-free first questions.
+
+Questions are normalized (Unicode NFKC, case folding, punctuation and
+politeness fillers removed) and keyed together with a detected language,
+so "Can you explain photosynthesis?" and "explain photosynthesis please"
+share an answer but a Hindi question never gets an English one.
+
+Two tiers:
+
+* exact: normalized text + language;
+* near-duplicate: a 64-bit SimHash over word unigrams and bigrams,
+  indexed in eight 8-bit bands (hashes within 7 bits always share a
+  band, most within 10 do), with candidates confirmed by token Jaccard
+  similarity and identical numbers and operators so "2+2" never
+  answers "2+3".
+
+Entries expire after a TTL and the least recently used ones are evicted
+past `maxsize`. The cache is per process.
+"""
+import hashlib
+import time
+import unicodedata
+from collections import OrderedDict, defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+SIMHASH_BITS = 64
+BANDS = 8
+BAND_BITS = SIMHASH_BITS // BANDS
+
+FILLERS = {
+    'please', 'pls', 'plz', 'kindly', 'hey', 'hi', 'hello', 'can', 'could', 'would', 'you', 'u',
+    'me', 'tell', 'briefly', 'simply', 'quick', 'quickly', 'a', 'an', 'the', 'about',
+}
+CONTRACTIONS = {"what's": "what is", "whats": "what is", "how's": "how is", "who's": "who is",
+                "where's": "where is", "why's": "why is", "isn't": "is not", "doesn't": "does not"}
+# Leading phrases that all ask for a definition
+DEFINITION_PREFIXES = (('what', 'is'), ('what', 'are'), ('explain',), ('define',), ('describe',), ('meaning', 'of'))
+# Math operators stay tokens so "2+2" and "2*2" never share a key
+OPERATORS = set('+-*/^=<>%×÷√∑∫')
+
+# Script ranges checked before falling back to Latin-script stopwords
+SCRIPTS = (
+    ('hi', 0x0900, 0x097F), ('bn', 0x0980, 0x09FF), ('pa', 0x0A00, 0x0A7F), ('gu', 0x0A80, 0x0AFF),
+    ('ta', 0x0B80, 0x0BFF), ('te', 0x0C00, 0x0C7F), ('kn', 0x0C80, 0x0CFF), ('ml', 0x0D00, 0x0D7F),
+    ('ar', 0x0600, 0x06FF), ('ru', 0x0400, 0x04FF), ('el', 0x0370, 0x03FF), ('he', 0x0590, 0x05FF),
+    ('th', 0x0E00, 0x0E7F), ('ko', 0xAC00, 0xD7AF), ('ja', 0x3040, 0x30FF), ('zh', 0x4E00, 0x9FFF),
+)
+LATIN_STOPWORDS = {
+    'en': {'what', 'is', 'the', 'how', 'why', 'does', 'of', 'and', 'explain', 'are', 'do', 'in', 'to'},
+    'es': {'qué', 'que', 'es', 'el', 'la', 'cómo', 'como', 'por', 'los', 'las', 'de', 'y', 'explica'},
+    'fr': {'qu', 'est', 'ce', 'le', 'la', 'les', 'comment', 'pourquoi', 'de', 'et', 'explique', 'des'},
+    'de': {'was', 'ist', 'der', 'die', 'das', 'wie', 'warum', 'und', 'erkläre', 'ein', 'eine'},
+    'pt': {'o', 'que', 'é', 'a', 'como', 'por', 'os', 'as', 'de', 'e', 'explique', 'qual'},
+}
+
+
+def detect_language(text: str) -> str:
+    """Best-effort language code from the script, then Latin stopword overlap"""
+    counts: Dict[str, int] = defaultdict(int)
+    for char in text:
+        code = ord(char)
+        if code < 0x0370:
+            continue
+        for language, low, high in SCRIPTS:
+            if low <= code <= high:
+                counts[language] += 1
+                break
+    if counts:
+        # Kana marks Japanese even when mixed with kanji
+        if counts.get('ja'):
+            return 'ja'
+        return max(counts, key=counts.get)
+    words = set(_expanded_words(text))
+    scores = {language: len(words & stopwords) for language, stopwords in LATIN_STOPWORDS.items()}
+    best = max(scores, key=scores.get)
+    return best if scores[best] else 'und'
+
+
+def _words(text: str) -> List[str]:
+    """Split into runs of letters, combining marks and digits (so Indic words stay whole) and operators"""
+    words, current = [], []
+    for char in text:
+        category = unicodedata.category(char)[0]
+        if category in 'LMN' or (char == "'" and current):
+            current.append(char)
+            continue
+        if current:
+            words.append(''.join(current).strip("'"))
+            current = []
+        if char in OPERATORS:
+            words.append(char)
+    if current:
+        words.append(''.join(current).strip("'"))
+    return [word for word in words if word]
+
+
+def _expanded_words(text: str) -> List[str]:
+    text = unicodedata.normalize('NFKC', text).casefold().replace('’', "'")
+    return [part for word in _words(text) for part in CONTRACTIONS.get(word, word).split()]
+
+
+def normalize_question(text: str) -> List[str]:
+    tokens = [word for word in _expanded_words(text) if word not in FILLERS]
+    for prefix in DEFINITION_PREFIXES:
+        if tuple(tokens[:len(prefix)]) == prefix:
+            tokens = ['define'] + tokens[len(prefix):]
+            break
+    return tokens
+
+
+def _numbers(tokens: List[str]) -> Tuple[str, ...]:
+    return tuple(token for token in tokens if token in OPERATORS or any(char.isdigit() for char in token))
+
+
+def _feature_hash(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def simhash(tokens: List[str]) -> int:
+    features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    weights = [0] * SIMHASH_BITS
+    for feature in features:
+        value = _feature_hash(feature)
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def _bands(fingerprint: int, language: str) -> List[Tuple[str, int, int]]:
+    mask = (1 << BAND_BITS) - 1
+    return [(language, band, fingerprint >> (band * BAND_BITS) & mask) for band in range(BANDS)]
+
+
+class _Entry:
+    __slots__ = ('answer', 'expires_at', 'fingerprint', 'tokens', 'numbers', 'language')
+
+    def __init__(self, answer, expires_at, fingerprint, tokens, numbers, language):
+        self.answer = answer
+        self.expires_at = expires_at
+        self.fingerprint = fingerprint
+        self.tokens = tokens
+        self.numbers = numbers
+        self.language = language
+
+
+class TutorAnswerCache:
+    def __init__(self, maxsize: int = 5000, ttl: float = 86400, max_distance: int = 10,
+                 min_similarity: float = 0.75, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.min_similarity = min_similarity
+        self.clock = clock
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bands: Dict[Tuple[str, int, int], Set[str]] = defaultdict(set)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key_for(question: str, language: Optional[str] = None) -> Tuple[str, List[str], str]:
+        """Cache key, tokens and language; an explicit language wins over detection"""
+        tokens = normalize_question(question)
+        language = language or detect_language(question)
+        return f"{language}:{' '.join(tokens)}", tokens, language
+
+    def get(self, question: str, language: Optional[str] = None) -> Tuple[Optional[str], str]:
+        """Return (answer, tier) where tier is 'exact', 'near' or 'miss'"""
+        key, tokens, language = self.key_for(question, language)
+        if not tokens:
+            return None, 'miss'
+        entry = self._live(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry.answer, 'exact'
+
+        fingerprint = simhash(tokens)
+        numbers = _numbers(tokens)
+        token_set = set(tokens)
+        candidates = set()
+        for band in _bands(fingerprint, language):
+            candidates.update(self._bands.get(band, ()))
+        best_key, best_similarity = None, 0.0
+        for candidate_key in candidates:
+            candidate = self._live(candidate_key)
+            if candidate is None or candidate.numbers != numbers:
+                continue
+            if bin(candidate.fingerprint ^ fingerprint).count('1') > self.max_distance:
+                continue
+            similarity = len(token_set & candidate.tokens) / len(token_set | candidate.tokens)
+            if similarity >= self.min_similarity and similarity > best_similarity:
+                best_key, best_similarity = candidate_key, similarity
+        if best_key is None:
+            return None, 'miss'
+        self._entries.move_to_end(best_key)
+        return self._entries[best_key].answer, 'near'
+
+    def put(self, question: str, answer: str, language: Optional[str] = None):
+        key, tokens, language = self.key_for(question, language)
+        if not tokens:
+            return
+        self._remove(key)
+        fingerprint = simhash(tokens)
+        self._entries[key] = _Entry(answer, self.clock() + self.ttl, fingerprint, set(tokens),
+                                    _numbers(tokens), language)
+        for band in _bands(fingerprint, language):
+            self._bands[band].add(key)
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+
+    def _live(self, key: str) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= self.clock():
+            self._remove(key)
+            return None
+        return entry
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for band in _bands(entry.fingerprint, entry.language):
+            keys = self._bands.get(band)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._bands[band]
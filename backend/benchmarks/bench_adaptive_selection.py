@@ -0,0 +1,74 @@
+"""Benchmark adaptive quiz selection against a bank built from 1M results.
+
+Simulates graded submissions with a 2PL model, folds them into the same
+running sums that quiz_item_stats keeps, then times parameter estimation and
+item selection. Run from the backend directory:
+
+    python benchmarks/bench_adaptive_selection.py --results 1000000
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from item_stats import item_parameters, select_items  # noqa: E402
+
+
+def simulate_sums(rng, results, items, questions_per_quiz):
+    true_a = rng.uniform(0.5, 2.0, items)
+    true_b = rng.normal(0.0, 1.0, items)
+    theta = rng.normal(0.0, 1.0, results)
+    chosen = rng.integers(0, items, size=(results, questions_per_quiz))
+
+    prob = 1.0 / (1.0 + np.exp(-true_a[chosen] * (theta[:, None] - true_b[chosen])))
+    correct = (rng.random(prob.shape) < prob).astype(np.float64)
+    score = correct.mean(axis=1, keepdims=True) * np.ones_like(correct)
+
+    flat = chosen.ravel()
+    sums = [
+        np.bincount(flat, minlength=items),
+        np.bincount(flat, weights=correct.ravel(), minlength=items),
+        np.bincount(flat, weights=score.ravel(), minlength=items),
+        np.bincount(flat, weights=(score ** 2).ravel(), minlength=items),
+        np.bincount(flat, weights=(score * correct).ravel(), minlength=items),
+    ]
+    return sums, true_b
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--results', type=int, default=1_000_000)
+    parser.add_argument('--items', type=int, default=5_000)
+    parser.add_argument('--selections', type=int, default=1_000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    start = time.perf_counter()
+    sums, true_b = simulate_sums(rng, args.results, args.items, 5)
+    simulate_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    discrimination, difficulty = item_parameters(*sums)
+    estimate_ms = (time.perf_counter() - start) * 1000
+
+    thetas = rng.normal(0.0, 1.0, args.selections)
+    start = time.perf_counter()
+    for theta in thetas:
+        select_items(theta, discrimination, difficulty, 5)
+    select_us = (time.perf_counter() - start) / args.selections * 1e6
+
+    correlation = np.corrcoef(difficulty, true_b)[0, 1]
+    print(f"results simulated   {args.results:>12,}  ({simulate_s:.2f} s)")
+    print(f"items in bank       {args.items:>12,}")
+    print(f"parameter estimate  {estimate_ms:12.2f} ms")
+    print(f"select 5 items      {select_us:12.1f} us/quiz")
+    print(f"difficulty vs truth {correlation:12.3f} corr")
+
+
+if __name__ == '__main__':
+    main()
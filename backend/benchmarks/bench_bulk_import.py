@@ -0,0 +1,121 @@
+"""Benchmark onboarding a school roster: bulk import vs one registration per student.
+
+Builds a CSV roster of --students rows, a --with-passwords share of them
+carrying an initial password (the rest get setup tokens), plus a few
+deliberately broken rows, and uploads it to /api/teacher/import/students.
+For comparison it registers --register-sample students through
+/api/auth/register one at a time and extrapolates that to the whole
+roster. Also times /api/classes/import with a term's worth of NDJSON
+classes. mongomock's unique and TTL index checks grow with collection
+size, so pass --mongo-url for numbers that reflect production. Run from
+the backend directory:
+
+    python benchmarks/bench_bulk_import.py --students 5000 --with-passwords 0.1 --mongo-url mongodb://localhost:27017
+"""
+import argparse
+import asyncio
+import io
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from harness import FakeLlmConfig, Recorder, Workload, build_fake_llm, fake_database, import_server  # noqa: E402
+
+
+def roster(students: int, with_passwords: float, broken: int, rng: random.Random) -> str:
+    out = io.StringIO()
+    out.write("email,name,password\n")
+    for i in range(students):
+        password = f"initial-{i}" if rng.random() < with_passwords else ""
+        out.write(f"student{i}@school.example,Student {i},{password}\n")
+    for i in range(broken):
+        out.write(f"not-an-email-{i},Broken {i},\n")
+    return out.getvalue()
+
+
+def schedule(classes: int) -> str:
+    start = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+    return '\n'.join(json.dumps({
+        "title": f"Class {i}",
+        "description": "Weekly session",
+        "scheduled_time": (start + timedelta(hours=i)).isoformat(),
+        "duration_minutes": 45
+    }) for i in range(classes))
+
+
+async def run(args):
+    server = import_server(*build_fake_llm(FakeLlmConfig()))
+    if args.mongo_url:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        server.db = AsyncIOMotorClient(args.mongo_url, tz_aware=True)['eduntra_bench_import']
+        for name in ('users', 'password_resets', 'live_classes'):
+            await server.db[name].drop()
+    else:
+        server.db = fake_database('eduntra_bench_import')
+    await server.create_indexes()
+    rng = random.Random(args.seed)
+
+    import httpx
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=3600) as client:
+        workload = Workload(client, Recorder(), [])
+        await workload.setup(1)
+        headers = workload.users[0]['headers']
+        response = await client.post('/api/auth/register', json={
+            "email": "teacher@school.example", "name": "Teacher", "password": "bench-password", "role": "teacher"
+        })
+        teacher = {"Authorization": f"Bearer {response.json()['token']}"}
+
+        start = time.perf_counter()
+        for i in range(args.register_sample):
+            await client.post('/api/auth/register', json={
+                "email": f"one-by-one{i}@school.example", "name": f"One {i}", "password": "initial", "role": "student"
+            })
+        per_register = (time.perf_counter() - start) / max(args.register_sample, 1)
+
+        body = roster(args.students, args.with_passwords, args.broken, rng)
+        start = time.perf_counter()
+        response = await client.post('/api/teacher/import/students', headers=teacher,
+                                     files={"file": ("roster.csv", body, "text/csv")})
+        import_seconds = time.perf_counter() - start
+        response.raise_for_status()
+        report = response.json()
+
+        start = time.perf_counter()
+        classes = await client.post('/api/classes/import', headers=teacher,
+                                    files={"file": ("term.ndjson", schedule(args.classes), "application/x-ndjson")})
+        class_seconds = time.perf_counter() - start
+        classes.raise_for_status()
+        student = await client.post('/api/teacher/import/students', headers=headers,
+                                    files={"file": ("roster.csv", "email,name\n", "text/csv")})
+
+    hashed = sum(1 for item in report['items'] if 'setup_token' not in item)
+    print(f"roster: {args.students} students ({hashed} with passwords), {args.broken} broken rows, "
+          f"{len(body) / 1024:.0f} KiB CSV")
+    print(f"bulk import:     {import_seconds:8.2f} s  {report['created']} created, {report['rejected']} rejected "
+          f"({args.students / import_seconds:.0f} students/s)")
+    print(f"one by one:      {per_register * args.students:8.2f} s  estimated from {args.register_sample} "
+          f"registrations at {per_register * 1000:.0f} ms each")
+    print(f"class schedule:  {class_seconds:8.2f} s  {classes.json()['created']} classes")
+    print(f"student upload rejected with {student.status_code}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--with-passwords', type=float, default=0.1, help='share of rows with an initial password')
+    parser.add_argument('--broken', type=int, default=20)
+    parser.add_argument('--classes', type=int, default=500)
+    parser.add_argument('--register-sample', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--mongo-url', help="real MongoDB to benchmark against instead of mongomock")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
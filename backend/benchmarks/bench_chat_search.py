@@ -0,0 +1,132 @@
+"""Benchmark tutor history search for one user with a large history.
+
+Seeds one student's chat_messages with synthetic English, Hindi and
+Chinese tutor turns (term frequencies follow a Zipf curve, so some
+words appear in most messages and others in a handful), builds the
+search index the app creates at startup and times ChatSearch.search
+for common, rare, multi-term, phrase, Devanagari, CJK and unmatched
+queries. Against a real MongoDB (--mongo-url) it also reports keys and
+documents examined from explain(); without one it falls back to
+mongomock, which scans every document in Python, so use fewer
+messages there. Run from the backend directory:
+
+    python benchmarks/bench_chat_search.py --messages 100000 --mongo-url mongodb://localhost:27017
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from chat_search import ChatSearch, indexed  # noqa: E402
+from harness import fake_database  # noqa: E402
+from text_index import query_terms  # noqa: E402
+
+VOCABULARY = (
+    "answer step example value number problem equation solve function graph energy force cell water light "
+    "reaction atom molecule triangle angle fraction percent probability vector matrix derivative integral "
+    "photosynthesis mitochondria osmosis enzyme chromosome velocity acceleration momentum friction circuit "
+    "resistance voltage magnet wavelength refraction isotope catalyst polymer hypotenuse parabola logarithm "
+    "quadratic binomial permutation theorem axiom sonnet metaphor democracy parliament monsoon glacier"
+).split()
+HINDI = "प्रकाश संश्लेषण ऊर्जा कोशिका पानी समीकरण भिन्न त्रिभुज गुरुत्वाकर्षण अणु".split()
+CHINESE = ["光合作用", "细胞", "能量", "方程", "三角形", "分数", "重力", "分子", "电路", "速度"]
+QUERIES = {
+    "common term": "answer",
+    "rare term": "hypotenuse",
+    "two terms": "quadratic equation",
+    "phrase": "photosynthesis light energy",
+    "devanagari": "संश्लेषण",
+    "cjk": "光合作用",
+    "no match": "zeppelin",
+}
+
+
+def message_text(rng: random.Random) -> str:
+    """A synthetic tutor turn; most are English, some Hindi or Chinese"""
+    words = rng.choices(VOCABULARY, weights=[1 / (rank + 1) for rank in range(len(VOCABULARY))],
+                        k=rng.randint(8, 120))
+    roll = rng.random()
+    if roll < 0.1:
+        words += rng.sample(HINDI, 3)
+    elif roll < 0.2:
+        words.append(''.join(rng.sample(CHINESE, 3)))
+    return ' '.join(words).capitalize() + '.'
+
+
+async def seed(db, messages: int, rng: random.Random):
+    await db.chat_messages.drop()
+    await db.chat_archives.drop()
+    await db.chat_messages.create_index([("user_id", 1), ("search_terms", 1), ("timestamp", -1)])
+    await db.chat_archives.create_index([("user_id", 1), ("search_terms", 1)])
+    now = datetime.now(timezone.utc)
+    for offset in range(0, messages, 5000):
+        await db.chat_messages.insert_many([indexed({
+            "id": f"m{i}",
+            "user_id": "u0",
+            "session_id": f"s{i // 20}",
+            "role": "user" if i % 2 else "assistant",
+            "content": message_text(rng),
+            "timestamp": now - timedelta(minutes=messages - i)
+        }) for i in range(offset, min(offset + 5000, messages))])
+
+
+async def explain(db, search: ChatSearch, query: str):
+    cursor = db.chat_messages.find(
+        {"user_id": "u0", "search_terms": {"$all": query_terms(query)}}
+    ).sort("timestamp", -1).limit(search.candidates)
+    try:
+        plan = await cursor.explain()
+    except Exception:
+        return None
+    stats = plan.get('executionStats', {})
+    return stats.get('totalKeysExamined'), stats.get('totalDocsExamined')
+
+
+async def run(args):
+    if args.mongo_url:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        db = AsyncIOMotorClient(args.mongo_url, tz_aware=True)['eduntra_bench_search']
+    else:
+        db = fake_database('eduntra_bench_search')
+    start = time.perf_counter()
+    await seed(db, args.messages, random.Random(args.seed))
+    print(f"seeded {args.messages} messages in {time.perf_counter() - start:.1f} s\n")
+
+    search = ChatSearch()
+    print(f"{'query':<14} {'p50 ms':>8} {'p95 ms':>8} {'results':>8} {'keys/docs examined':>20}")
+    for name, query in QUERIES.items():
+        timings, results = [], []
+        for _ in range(args.rounds):
+            start = time.perf_counter()
+            results = await search.search(db, "u0", query, limit=args.limit)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        examined = await explain(db, search, query)
+        print(f"{name:<14} {statistics.median(timings):>8.2f} {timings[int(0.95 * (len(timings) - 1))]:>8.2f} "
+              f"{len(results):>8} {'-' if examined is None else f'{examined[0]}/{examined[1]}':>20}")
+    if args.show:
+        for result in await search.search(db, "u0", QUERIES["two terms"], limit=3):
+            print(f"\n{result['session_id']} {result['score']}: {result['snippet']}\n  highlights {result['highlights']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=100_000)
+    parser.add_argument('--rounds', type=int, default=50)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--show', action='store_true', help="print the top results of one query")
+    parser.add_argument('--mongo-url', help="real MongoDB to benchmark against instead of mongomock")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
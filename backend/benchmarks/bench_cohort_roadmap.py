@@ -0,0 +1,106 @@
+"""Benchmark putting a class on one roadmap: per-student create-path vs cohort assignment.
+
+Registers --students students and a teacher on an in-memory database
+with the fake LLM, then gives the class the same roadmap two ways: every
+student calling /api/learning/create-path, and the teacher calling
+/api/teacher/roadmaps/assign once. Reports wall time, LLM calls and the
+BSON bytes stored in learning_paths (plus roadmap_templates) for each,
+and the latency of the students' /api/learning/my-paths reads, which
+hydrate assigned paths from the cached template. Run from the backend
+directory:
+
+    python benchmarks/bench_cohort_roadmap.py --students 200 --llm-latency 2.0
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import bson
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from harness import FakeLlmConfig, Recorder, Workload, build_fake_llm, fake_database, import_server  # noqa: E402
+
+ROADMAP = {"subject": "Python", "skill_level": "beginner", "timeline": "4 weeks"}
+
+
+async def stored_bytes(db, collection: str, query: dict) -> int:
+    return sum(len(bson.encode(doc)) for doc in await db[collection].find(query).to_list(None))
+
+
+async def read_paths(client, users) -> float:
+    """Median ms of each student's full my-paths read"""
+    timings = []
+    for user in users:
+        start = time.perf_counter()
+        response = await client.get('/api/learning/my-paths', headers=user['headers'])
+        timings.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+    return statistics.median(timings)
+
+
+async def run(args):
+    config = FakeLlmConfig(latency=args.llm_latency, token_rate=args.token_rate, seed=args.seed)
+    server = import_server(*build_fake_llm(config))
+    server.db = fake_database('eduntra_bench_cohort')
+    await server.create_indexes()
+
+    import httpx
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=600) as client:
+        workload = Workload(client, Recorder(), [])
+        await workload.setup(args.students)
+        response = await client.post('/api/auth/register', json={
+            "email": "teacher@bench.example", "name": "Teacher", "password": "bench-password", "role": "teacher"
+        })
+        teacher = {"Authorization": f"Bearer {response.json()['token']}"}
+        student_ids = [(await client.get('/api/auth/me', headers=user['headers'])).json()['id']
+                       for user in workload.users]
+
+        calls = len(config.calls)
+        start = time.perf_counter()
+        await asyncio.gather(*(client.post('/api/learning/create-path', json=ROADMAP, headers=user['headers'])
+                               for user in workload.users))
+        individual = {
+            "seconds": time.perf_counter() - start,
+            "llm_calls": len(config.calls) - calls,
+            "bytes": await stored_bytes(server.db, 'learning_paths', {"template_id": {"$exists": False}}),
+            "read_ms": await read_paths(client, workload.users),
+        }
+        await server.db.learning_paths.delete_many({})
+
+        calls = len(config.calls)
+        start = time.perf_counter()
+        response = await client.post('/api/teacher/roadmaps/assign', json={**ROADMAP, "student_ids": student_ids},
+                                     headers=teacher)
+        response.raise_for_status()
+        cohort = {
+            "seconds": time.perf_counter() - start,
+            "llm_calls": len(config.calls) - calls,
+            "bytes": await stored_bytes(server.db, 'learning_paths', {}) +
+            await stored_bytes(server.db, 'roadmap_templates', {}),
+            "read_ms": await read_paths(client, workload.users),
+        }
+
+    print(f"{args.students} students, fake LLM latency {args.llm_latency * 1000:.0f} ms, "
+          f"{response.json()['assigned']} paths assigned")
+    print(f"{'approach':<12} {'wall s':>8} {'LLM calls':>10} {'stored KB':>10} {'my-paths p50 ms':>16}")
+    for name, stats in (("per-student", individual), ("cohort", cohort)):
+        print(f"{name:<12} {stats['seconds']:>8.2f} {stats['llm_calls']:>10} {stats['bytes'] / 1024:>10.1f} "
+              f"{stats['read_ms']:>16.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=100)
+    parser.add_argument('--llm-latency', type=float, default=2.0, help='fake LLM base latency in seconds')
+    parser.add_argument('--token-rate', type=float, default=400.0, help='fake LLM tokens generated per second')
+    parser.add_argument('--seed', type=int, default=7)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Benchmark fallback catalog loading and lookups.
+
+Loads the offline catalog, prints which entry a set of free-text subjects
+and career inputs resolve to, and times roadmap, lesson and career
+lookups: exact subjects, fuzzy subjects (first sight and repeated),
+subjects that fall through to the generic template, and careers. Run from
+the backend directory:
+
+    python benchmarks/bench_fallback_catalog.py --lookups 20000
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fallback_catalog import FallbackCatalog  # noqa: E402
+
+SUBJECTS = [
+    "Python", "pyton", "Learn Python 3", "javascript", "Java", "web dev", "python for data science",
+    "intro to machine lerning", "Organic Chemistry", "maths", "NEET biology", "spoken english", "figma",
+    "computer science", "Underwater basket weaving",
+]
+CAREER_INPUTS = [
+    (["coding", "music"], ["python"]),
+    (["art", "drawing"], ["photoshop"]),
+    (["biology"], ["lab work", "writing"]),
+    ([], []),
+]
+
+
+def timed(label: str, lookups: int, call):
+    start = time.perf_counter()
+    for i in range(lookups):
+        call(i)
+    print(f"{label:<32} {(time.perf_counter() - start) / lookups * 1e6:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lookups', type=int, default=20_000)
+    parser.add_argument('--path', help="catalog JSON (default data/fallback_catalog.json)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    catalog = FallbackCatalog.load(args.path)
+    print(f"loaded {len(catalog.subjects)} subjects and {len(catalog.careers)} careers "
+          f"in {(time.perf_counter() - start) * 1000:.1f} ms\n")
+
+    for subject in SUBJECTS:
+        print(f"{subject!r:<30} -> {catalog.match_subject(subject) or '(generic)'}")
+    for interests, skills in CAREER_INPUTS:
+        titles = [career['title'] for career in catalog.careers_for(interests, skills)]
+        print(f"{interests!r} + {skills!r} -> {', '.join(titles)}")
+
+    print(f"\n{'lookup':<32} {'us/call':>9}")
+    n = args.lookups
+    timed("roadmap, exact subject", n, lambda i: catalog.roadmap("Python", "beginner", "4 weeks"))
+    timed("roadmap, fuzzy subject (cold)", min(n, 2000),
+          lambda i: catalog.roadmap(f"intro to machine lerning {i}", "advanced", "6 weeks"))
+    timed("roadmap, fuzzy subject (cached)", n, lambda i: catalog.roadmap("intro to machine lerning", "advanced", "6 weeks"))
+    timed("roadmap, generic template", n, lambda i: catalog.roadmap("Underwater basket weaving", "beginner", "4 weeks"))
+    timed("lessons, exact subject", n, lambda i: catalog.lessons("Physics", "intermediate"))
+    timed("careers", n, lambda i: catalog.careers_for(["coding", "design"], ["python"]))
+
+
+if __name__ == '__main__':
+    main()
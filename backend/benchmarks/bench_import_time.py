@@ -0,0 +1,86 @@
+"""Profile `import server`, the part of a worker boot spent before the lifespan runs.
+
+Imports the module in fresh interpreters with `-X importtime` and reports
+the median total, the slowest direct imports and which of the heavy
+integrations (loaded lazily on first use or by PREWARM=true) were pulled
+in anyway. Run from the backend directory:
+
+    python benchmarks/bench_import_time.py --runs 7 --top 15
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Loaded on first use, so they should not show up after a plain import
+LAZY_MODULES = ('emergentintegrations', 'passlib', 'bcrypt', 'motor', 'dotenv', 'aiohttp')
+
+REPORT = ("import sys; import {module}; "
+          "print(','.join(m for m in {lazy!r} if m in sys.modules))")
+
+
+def parse_importtime(stderr: str):
+    """[(name, depth, self_us, cumulative_us)] from -X importtime output"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        rows.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return rows
+
+
+def profile_once(module: str):
+    env = dict(os.environ)
+    env.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+    env.setdefault('DB_NAME', 'eduntra_bench')
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', REPORT.format(module=module, lazy=LAZY_MODULES)],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - start
+    if proc.returncode:
+        raise SystemExit(proc.stderr.strip().splitlines()[-1])
+    return wall, parse_importtime(proc.stderr), [m for m in proc.stdout.strip().split(',') if m]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--module', default='server')
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    walls, totals = [], []
+    direct = defaultdict(list)
+    eager = set()
+    for _ in range(args.runs):
+        wall, rows, loaded = profile_once(args.module)
+        walls.append(wall)
+        eager.update(loaded)
+        root = next(row for row in rows if row[0] == args.module and row[1] == 0)
+        totals.append(root[3])
+        for name, depth, _, cumulative in rows:
+            if depth == 1:
+                direct[name].append(cumulative)
+
+    print(f"import {args.module}: median {statistics.median(totals) / 1000:.1f} ms "
+          f"(min {min(totals) / 1000:.1f}), interpreter wall median {statistics.median(walls) * 1000:.1f} ms "
+          f"over {args.runs} runs")
+    print(f"{'direct import':<40} {'median ms':>10}")
+    ranked = sorted(direct.items(), key=lambda item: -statistics.median(item[1]))
+    for name, samples in ranked[:args.top]:
+        print(f"{name:<40} {statistics.median(samples) / 1000:>10.1f}")
+    print(f"lazy integrations imported eagerly: {', '.join(sorted(eager)) or 'none'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Benchmark the tutor's local math solver on a recorded question corpus.
+
+Sends every question in benchmarks/corpus/tutor_questions.jsonl through
+/api/tutor/chat twice, once with MATH_SOLVER=off and once with auto.
+Each run uses the fake LLM and an in-memory database, and the tutor
+answer cache is disabled. It reports latency, LLM calls and direct
+answers for each run. It also checks the solver's results against the
+expected answers recorded in the corpus. Entries marked "needs": "sympy"
+are only checked when SymPy is installed. Run from the backend
+directory:
+
+    python benchmarks/bench_math_fast_path.py --rounds 3 --llm-latency 0.8
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from harness import FakeLlmConfig, Recorder, Workload, build_fake_llm, fake_database, import_server, percentile  # noqa: E402
+
+CORPUS = Path(__file__).resolve().parent / 'corpus' / 'tutor_questions.jsonl'
+
+
+def load_corpus(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def check_answers(math_solver, corpus):
+    """(correct, wrong, missed, skipped) for corpus entries with an expected answer"""
+    correct, wrong, missed, skipped = 0, [], [], 0
+    for entry in corpus:
+        if 'expect' not in entry:
+            continue
+        if entry.get('needs') == 'sympy' and not math_solver.symbolic:
+            skipped += 1
+            continue
+        solution = await math_solver.solve(entry['message'])
+        if solution is None:
+            missed.append(entry['message'])
+        elif entry['expect'] in solution.statement:
+            correct += 1
+        else:
+            wrong.append(f"{entry['message']} -> {solution.statement}")
+    return correct, wrong, missed, skipped
+
+
+async def run_mode(server, config, client, user, corpus, mode, rounds):
+    from math_solver import MathSolver
+
+    server.math_solver = MathSolver(mode=mode)
+    await server.math_solver.prewarm()
+    calls_before = len(config.calls)
+    latencies = []
+    solutions = [await server.math_solver.solve(entry['message']) for entry in corpus]
+    direct = rounds * sum(1 for solution in solutions if solution is not None and solution.direct)
+    for round_number in range(rounds):
+        for i, entry in enumerate(corpus):
+            start = time.perf_counter()
+            response = await client.post('/api/tutor/chat', headers=user['headers'], json={
+                "message": entry['message'], "session_id": f"{mode}-{round_number}-{i}"
+            })
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+    server.math_solver.close()
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "llm_calls": len(config.calls) - calls_before,
+        "direct": direct,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+    }
+
+
+async def run(args):
+    config = FakeLlmConfig(latency=args.llm_latency, token_rate=args.token_rate, seed=args.seed)
+    server = import_server(*build_fake_llm(config))
+    server.db = fake_database()
+    server.tutor_answer_cache = None
+    corpus = load_corpus(args.corpus)
+
+    import httpx
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=120) as client:
+        workload = Workload(client, Recorder(), [])
+        await workload.setup(1)
+        results = {mode: await run_mode(server, config, client, workload.users[0], corpus, mode, args.rounds)
+                   for mode in ('off', 'auto')}
+
+    from math_solver import MathSolver
+    checker = MathSolver(mode='auto')
+    correct, wrong, missed, skipped = await check_answers(checker, corpus)
+    checker.close()
+
+    print(f"{len(corpus)} questions x {args.rounds} rounds, fake LLM latency {args.llm_latency * 1000:.0f} ms, "
+          f"SymPy {'installed' if checker.symbolic else 'not installed'}")
+    print(f"{'solver':<8} {'requests':>9} {'LLM calls':>10} {'direct':>7} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    for mode, stats in results.items():
+        print(f"{mode:<8} {stats['requests']:>9} {stats['llm_calls']:>10} {stats['direct']:>7} "
+              f"{stats['mean_ms']:>9.1f} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f}")
+    saved = 1 - results['auto']['llm_calls'] / max(results['off']['llm_calls'], 1)
+    print(f"LLM calls saved: {saved:.1%}")
+    print(f"solver answers: {correct} correct, {len(wrong)} wrong, {len(missed)} not recognized, "
+          f"{skipped} skipped (need SymPy)")
+    for line in wrong:
+        print(f"  wrong: {line}")
+    for message in missed:
+        print(f"  not recognized: {message}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--corpus', default=str(CORPUS))
+    parser.add_argument('--rounds', type=int, default=1)
+    parser.add_argument('--llm-latency', type=float, default=0.8, help='fake LLM base latency in seconds')
+    parser.add_argument('--token-rate', type=float, default=400.0, help='fake LLM tokens generated per second')
+    parser.add_argument('--seed', type=int, default=7)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Benchmark /learning/my-paths payload size and serialization time.
+
+Compares the full roadmap documents against the summary projection used by
+the dashboard cards. Run from the backend directory:
+
+    python benchmarks/bench_my_paths.py --paths 20
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'eduntra_bench')
+
+import server  # noqa: E402
+
+
+def build_path(idx):
+    lessons, overview, final_checklist, next_steps = server.generate_fallback_roadmap(
+        f"Subject {idx}", "beginner", "4 weeks"
+    )
+    # LLM roadmaps are several times larger than the fallback one
+    lessons = [dict(lesson, description=lesson['description'] * 8) for lesson in lessons * 3]
+    return {
+        "id": f"path-{idx}",
+        "user_id": "bench-user",
+        "subject": f"Subject {idx}",
+        "lessons": lessons,
+        "progress": 25,
+        "created_at": datetime(2025, 1, 1, tzinfo=timezone.utc),
+        "overview": overview,
+        "final_checklist": final_checklist,
+        "next_steps": next_steps,
+        "skill_level": "beginner",
+        "timeline": "4 weeks",
+        "completed_phases": [1],
+    }
+
+
+def summarize(doc):
+    """Python equivalent of server.PATH_SUMMARY_PROJECTION"""
+    summary = {
+        key: doc[key]
+        for key, spec in server.PATH_SUMMARY_PROJECTION.items()
+        if spec == 1 and key in doc
+    }
+    summary['phase_count'] = len(doc.get('lessons') or [])
+    return summary
+
+
+def measure(payload, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        body = json.dumps(payload, separators=(',', ':'), default=server.json_default)
+    elapsed = (time.perf_counter() - start) / rounds
+    return len(body.encode('utf-8')), elapsed * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--paths', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+
+    docs = [build_path(i) for i in range(args.paths)]
+    full_bytes, full_ms = measure({"paths": docs}, args.rounds)
+    summary_bytes, summary_ms = measure({"paths": [summarize(d) for d in docs]}, args.rounds)
+
+    print(f"paths per user: {args.paths}")
+    print(f"full     {full_bytes / 1024:10.1f} KB  {full_ms:8.3f} ms/encode")
+    print(f"summary  {summary_bytes / 1024:10.1f} KB  {summary_ms:8.3f} ms/encode")
+    print(f"reduction {full_bytes / max(summary_bytes, 1):9.1f}x bytes  {full_ms / max(summary_ms, 1e-9):8.1f}x time")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Benchmark prompt rendering and report how much of each prompt is a stable prefix.
+
+Renders every registered template with two different sets of request
+values, times the renders and measures the prefix the two prompts share,
+which is what a provider-side prefix cache can reuse. Run from the backend
+directory:
+
+    python benchmarks/bench_prompt_build.py --renders 100000
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from llm_budget import estimate_tokens  # noqa: E402
+from prompts import PROMPTS, cacheable_tokens  # noqa: E402
+
+SAMPLES = {
+    "tutor_question": ({"message": "What is photosynthesis?"},
+                       {"message": "¿Qué es la fotosíntesis y por qué importa?"}),
+    "tutor_followup": ({"context": "Student: What is a cell?\nTutor: The basic unit of life.\n", "message": "And a nucleus?"},
+                       {"context": "Student: What is 2+2?\nTutor: 4.\n", "message": "Why?"}),
+    "roadmap": ({"subject": "Python", "skill_level": "beginner", "final_goal": "Get a job", "daily_time": "1 hour",
+                 "timeline": "4 weeks", "detail_level": "well-structured"},
+                {"subject": "Organic Chemistry", "skill_level": "advanced", "final_goal": "Pass exams",
+                 "daily_time": "3 hours", "timeline": "8 weeks", "detail_level": "deeply detailed"}),
+    "phase_quiz": ({"phase": 1, "title": "Foundations", "topics": "a, b, c", "objectives": "x, y"},
+                   {"phase": 3, "title": "Design Patterns", "topics": "d, e", "objectives": "z"}),
+    "career_analysis": ({"interests": "coding, music", "skills": "python"},
+                        {"interests": "biology", "skills": "lab work, writing"}),
+    "job_listings": ({"job_type": "job", "location": "India"}, {"job_type": "internship", "location": "Pune"}),
+}
+
+
+def shared_prefix(first: str, second: str) -> int:
+    size = 0
+    for a, b in zip(first, second):
+        if a != b:
+            break
+        size += 1
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--renders', type=int, default=100_000)
+    args = parser.parse_args()
+
+    print(f"{'template':<18} {'us/render':>10} {'tokens':>7} {'shared':>7} {'shared %':>9} {'cacheable':>10}  version")
+    for name, (first_values, second_values) in SAMPLES.items():
+        template = PROMPTS.get(name)
+        start = time.perf_counter()
+        for _ in range(args.renders):
+            template.render(**first_values)
+        render_us = (time.perf_counter() - start) / args.renders * 1e6
+
+        first = template.render(**first_values)
+        second = template.render(**second_values)
+        first_text = first.system + '\n' + first.user
+        shared = estimate_tokens(first_text[:shared_prefix(first_text, second.system + '\n' + second.user)])
+        print(f"{name:<18} {render_us:>10.2f} {first.total_tokens:>7} {shared:>7} "
+              f"{shared / first.total_tokens:>9.1%} {cacheable_tokens(shared):>10}  {first.version}")
+    print(f"cacheable assumes a {os.environ.get('PROMPT_CACHE_MIN_TOKENS', '1024')}-token provider minimum")
+
+
+if __name__ == '__main__':
+    main()
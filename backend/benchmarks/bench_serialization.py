@@ -0,0 +1,158 @@
+"""Benchmark response encoding and bytes on the wire for the heaviest endpoints.
+
+Seeds one student with --paths roadmaps from the fake LLM, graded quizzes
+and a --messages turn tutor session, then calls each endpoint once and
+captures the payload the handler handed to the encoder. For every
+payload it times FastAPI's default path (jsonable_encoder, then
+json.dumps as JSONResponse does) against the orjson encoder the API now
+uses and MessagePack, and reports the body size raw, gzipped and
+brotli-compressed as the compression middleware would send it. orjson,
+msgpack and brotli are optional; columns for the ones not installed are
+left blank. Run from the backend directory:
+
+    python benchmarks/bench_serialization.py --paths 5 --messages 100 --rounds 200
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from harness import FakeLlmConfig, Recorder, Workload, build_fake_llm, fake_database, import_server  # noqa: E402
+
+
+def fastapi_encode(payload) -> bytes:
+    """What a handler returning a dict cost before: jsonable_encoder, then JSONResponse.render"""
+    from fastapi.encoders import jsonable_encoder
+    return json.dumps(jsonable_encoder(payload), ensure_ascii=False, allow_nan=False, indent=None,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def time_per_call(encode, payload, rounds: int) -> float:
+    """Median microseconds per encode"""
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        encode(payload)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2] * 1e6
+
+
+def cell(value, width: int, fmt: str) -> str:
+    return f"{'-':>{width}}" if value is None else f"{value:>{width}{fmt}}"
+
+
+async def seed(server, client, headers, args):
+    paths = []
+    for i in range(args.paths):
+        response = await client.post('/api/learning/create-path', headers=headers, json={
+            "subject": ["Python", "Algebra", "Biology", "Chemistry", "World History"][i % 5],
+            "skill_level": "beginner", "timeline": "8 weeks"
+        })
+        response.raise_for_status()
+        paths.append(response.json()['id'])
+    for phase in (1, 2):
+        quiz = (await client.post(f'/api/learning/generate-quiz/{paths[0]}/{phase}', headers=headers)).json()
+        await client.post(f"/api/learning/submit-quiz/{quiz['id']}", headers=headers,
+                          json={"answers": ["A"] * len(quiz['questions'])})
+    user_id = (await client.get('/api/auth/me', headers=headers)).json()['id']
+    now = datetime.now(timezone.utc)
+    await server.db.chat_messages.insert_many([{
+        "id": f"m{i}",
+        "user_id": user_id,
+        "session_id": "bench",
+        "role": "user" if i % 2 == 0 else "assistant",
+        "content": ("What is the difference between mitosis and meiosis?" if i % 2 == 0 else
+                    "Mitosis makes two identical cells for growth and repair, while meiosis makes four "
+                    "genetically different gametes with half the chromosomes. " * 3),
+        "timestamp": now - timedelta(minutes=args.messages - i)
+    } for i in range(args.messages)])
+    return paths
+
+
+async def run(args):
+    server = import_server(*build_fake_llm(FakeLlmConfig(latency=0.0)))
+    server.db = fake_database('eduntra_bench_serialization')
+    await server.create_indexes()
+
+    async def no_live_jobs(job_type, location):
+        return []
+    server.fetch_real_time_jobs = no_live_jobs
+
+    import serialization
+    captured = {}
+    encode = serialization.encode
+
+    def capturing_encode(payload, fmt=None):
+        captured['payload'] = payload
+        return encode(payload, fmt)
+    serialization.encode = server.encode = capturing_encode
+
+    import httpx
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=600) as client:
+        workload = Workload(client, Recorder(), [])
+        await workload.setup(1)
+        headers = workload.users[0]['headers']
+        paths = await seed(server, client, headers, args)
+        endpoints = {
+            "POST create-path": ('POST', '/api/learning/create-path', {"subject": "Physics"}),
+            "GET my-paths": ('GET', '/api/learning/my-paths', None),
+            "GET my-paths summary": ('GET', '/api/learning/my-paths?view=summary', None),
+            "GET analytics": ('GET', f'/api/learning/analytics/{paths[0]}', None),
+            "GET jobs": ('GET', '/api/jobs', None),
+            "GET tutor history": ('GET', '/api/tutor/history/bench', None),
+            "GET tutor sessions": ('GET', '/api/tutor/sessions', None),
+            "GET auth/me": ('GET', '/api/auth/me', None),
+        }
+        payloads = {}
+        for name, (method, url, body) in endpoints.items():
+            captured.clear()
+            response = await client.request(method, url, headers=headers, json=body)
+            response.raise_for_status()
+            payloads[name] = captured['payload']
+    serialization.encode = server.encode = encode
+
+    # The levels the middleware uses, from RESPONSE_GZIP_LEVEL and RESPONSE_BROTLI_QUALITY
+    compression = serialization.CompressionMiddleware(None)
+    gzip_level, brotli_quality = compression.gzip_level, compression.brotli_quality
+    print(f"orjson {'on' if serialization.orjson else 'not installed'}, "
+          f"msgpack {'on' if serialization.msgpack else 'not installed'}, "
+          f"brotli {'on' if serialization.brotli else 'not installed'}; "
+          f"gzip level {gzip_level}, brotli quality {brotli_quality}; median of {args.rounds} encodes\n")
+    print(f"{'endpoint':<22} {'fastapi us':>11} {'orjson us':>10} {'msgpack us':>11} "
+          f"{'json B':>9} {'gzip B':>9} {'br B':>9} {'msgpack B':>10} {'mp+gzip B':>10}")
+    for name, payload in payloads.items():
+        body = serialization.dumps(payload)
+        row = {
+            "fastapi": time_per_call(fastapi_encode, payload, args.rounds),
+            "orjson": time_per_call(serialization.dumps, payload, args.rounds) if serialization.orjson else None,
+            "msgpack_us": time_per_call(serialization.packb, payload, args.rounds) if serialization.msgpack else None,
+            "json": len(body),
+            "gzip": len(gzip.compress(body, compresslevel=gzip_level)),
+            "br": len(serialization.brotli.compress(body, quality=brotli_quality)) if serialization.brotli else None,
+        }
+        packed = serialization.packb(payload) if serialization.msgpack else None
+        row["msgpack"] = len(packed) if packed is not None else None
+        row["msgpack_gzip"] = len(gzip.compress(packed, compresslevel=gzip_level)) if packed is not None else None
+        print(f"{name:<22} {cell(row['fastapi'], 11, '.1f')} {cell(row['orjson'], 10, '.1f')} "
+              f"{cell(row['msgpack_us'], 11, '.1f')} {cell(row['json'], 9, ',')} {cell(row['gzip'], 9, ',')} "
+              f"{cell(row['br'], 9, ',')} {cell(row['msgpack'], 10, ',')} {cell(row['msgpack_gzip'], 10, ',')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--paths', type=int, default=5, help='roadmaps created for the student')
+    parser.add_argument('--messages', type=int, default=100, help='turns in the tutor session read back')
+    parser.add_argument('--rounds', type=int, default=200)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Benchmark time-window queries on ISO-string vs native BSON date timestamps.
+
+Seeds the same chat messages and quiz results twice, once with the old
+`.isoformat()` strings and once with native dates, builds the indexes the
+app creates at startup and times recent-chat, last-week and quiz-history
+queries on both. Against a real MongoDB (--mongo-url) it also reports keys
+and documents examined from explain() and the index sizes; without one it
+falls back to mongomock, which only gives timings. Run from the backend
+directory:
+
+    python benchmarks/bench_time_queries.py --users 200 --messages 200 --mongo-url mongodb://localhost:27017
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from harness import fake_database  # noqa: E402
+
+LAYOUTS = ('string', 'date')
+
+
+def stamp(value: datetime, layout: str):
+    return value.isoformat() if layout == 'string' else value
+
+
+async def seed(db, layout: str, users: int, messages: int, rng: random.Random):
+    now = datetime.now(timezone.utc)
+    chats, results = db[f"bench_chat_{layout}"], db[f"bench_results_{layout}"]
+    await chats.drop()
+    await results.drop()
+    await chats.create_index([("user_id", 1), ("session_id", 1), ("timestamp", 1)])
+    await chats.create_index([("user_id", 1), ("timestamp", -1)])
+    await results.create_index([("user_id", 1), ("path_id", 1), ("completed_at", -1)])
+    for user in range(users):
+        await chats.insert_many([{
+            "user_id": f"u{user}",
+            "session_id": f"s{i % 5}",
+            "role": "user" if i % 2 else "assistant",
+            "content": "message " * 20,
+            "timestamp": stamp(now - timedelta(minutes=rng.randint(0, 90 * 24 * 60)), layout)
+        } for i in range(messages)])
+        await results.insert_many([{
+            "user_id": f"u{user}",
+            "path_id": f"p{i % 3}",
+            "score": rng.randint(0, 5),
+            "total_questions": 5,
+            "completed_at": stamp(now - timedelta(hours=rng.randint(0, 90 * 24)), layout)
+        } for i in range(messages // 4)])
+
+
+def queries(db, layout: str, user: str):
+    since = stamp(datetime.now(timezone.utc) - timedelta(days=7), layout)
+    chats, results = db[f"bench_chat_{layout}"], db[f"bench_results_{layout}"]
+    return {
+        "recent chat (10)": lambda: chats.find({"user_id": user, "session_id": "s1"}).sort("timestamp", -1).limit(10),
+        "last 7 days": lambda: chats.find({"user_id": user, "timestamp": {"$gte": since}}).sort("timestamp", -1),
+        "quiz history (50)": lambda: results.find({"user_id": user, "path_id": "p1"}).sort("completed_at", -1).limit(50),
+    }
+
+
+async def explain(cursor):
+    try:
+        plan = await cursor.explain()
+    except Exception:
+        return None
+    stats = plan.get('executionStats', {})
+    return stats.get('totalKeysExamined'), stats.get('totalDocsExamined')
+
+
+async def index_size(db, name: str):
+    try:
+        return (await db.command("collStats", name)).get('totalIndexSize')
+    except Exception:
+        return None
+
+
+async def run(args):
+    if args.mongo_url:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        db = AsyncIOMotorClient(args.mongo_url, tz_aware=True)['eduntra_bench']
+    else:
+        db = fake_database()
+    rng = random.Random(args.seed)
+    for layout in LAYOUTS:
+        await seed(db, layout, args.users, args.messages, random.Random(args.seed))
+
+    print(f"{'query':<20} {'layout':<7} {'p50 ms':>8} {'p99 ms':>8} {'docs':>6} {'keys/docs examined':>20}")
+    for name in queries(db, 'date', 'u0'):
+        for layout in LAYOUTS:
+            timings, returned = [], 0
+            for _ in range(args.rounds):
+                user = f"u{rng.randrange(args.users)}"
+                start = time.perf_counter()
+                docs = await queries(db, layout, user)[name]().to_list(None)
+                timings.append((time.perf_counter() - start) * 1000)
+                returned = len(docs)
+            timings.sort()
+            examined = await explain(queries(db, layout, 'u0')[name]())
+            print(f"{name:<20} {layout:<7} {statistics.median(timings):>8.2f} "
+                  f"{timings[int(0.99 * (len(timings) - 1))]:>8.2f} {returned:>6} "
+                  f"{'-' if examined is None else f'{examined[0]}/{examined[1]}':>20}")
+    for layout in LAYOUTS:
+        size = await index_size(db, f"bench_chat_{layout}")
+        if size is not None:
+            print(f"chat index size ({layout}): {size / 1024:.0f} KiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--mongo-url', help="real MongoDB to benchmark against instead of mongomock")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""Benchmark voice questions: spooled uploads, the transcription pool and event loop headroom.
+
+Sends --clips WAV recordings of --seconds each to /api/tutor/voice,
+--concurrency at a time, streamed in 64 KiB chunks, with the stub
+transcriber burning --rtf seconds of CPU per second of audio in
+--workers pool processes and the fake LLM answering the transcript.
+Meanwhile a probe calls /api/health/live every 50 ms; its latency shows
+whether the API worker's event loop stays responsive while clips are
+transcribed. Reports voice question latency, the deepest transcription
+queue seen, and the peak memory of spooling one --upload-mb recording
+compared with buffering it and base64-encoding it into a JSON body.
+Run from the backend directory:
+
+    python benchmarks/bench_voice.py --clips 40 --concurrency 8 --workers 2 --rtf 0.2
+"""
+import argparse
+import asyncio
+import base64
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import wave
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from harness import FakeLlmConfig, Recorder, Workload, build_fake_llm, fake_database, import_server, percentile  # noqa: E402
+
+CHUNK = 64 * 1024
+
+
+def recording(seconds: float) -> bytes:
+    """16 kHz 16-bit mono WAV of a repeating waveform"""
+    out = io.BytesIO()
+    with wave.open(out, 'wb') as audio:
+        audio.setnchannels(1)
+        audio.setsampwidth(2)
+        audio.setframerate(16000)
+        audio.writeframes(bytes(range(256)) * int(16000 * 2 * seconds / 256))
+    return out.getvalue()
+
+
+async def stream(data: bytes):
+    for offset in range(0, len(data), CHUNK):
+        yield data[offset:offset + CHUNK]
+
+
+async def upload_memory(spool_class, megabytes: int):
+    """Peak traced bytes to spool a recording vs to hold it and base64 it for a JSON body"""
+    data = os.urandom(megabytes * 1024 * 1024)
+    spool = spool_class(max_bytes=len(data) + 1)
+    tracemalloc.start()
+    path, _ = await spool.write(stream(data), '.wav')
+    spooled = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    spool.discard(path)
+
+    tracemalloc.start()
+    body = bytearray()
+    async for chunk in stream(data):
+        body += chunk
+    encoded = base64.b64encode(bytes(body)).decode('ascii')
+    buffered = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del body, encoded
+    return spooled, buffered
+
+
+async def run(args):
+    os.environ.update({
+        "TRANSCRIBER": "stub",
+        "TRANSCRIBER_STUB_RTF": str(args.rtf),
+        "TRANSCRIBER_WORKERS": str(args.workers),
+        "TRANSCRIBER_MAX_PENDING": str(max(args.concurrency, 1)),
+        "VOICE_UPLOAD_DIR": tempfile.mkdtemp(prefix='bench-voice-'),
+    })
+    server = import_server(*build_fake_llm(FakeLlmConfig(latency=args.llm_latency, seed=args.seed)))
+    server.db = fake_database('eduntra_bench_voice')
+    await server.create_indexes()
+    from metrics import TRANSCRIPTION_QUEUE_DEPTH
+    from voice import VoiceSpool
+
+    clip = recording(args.seconds)
+    import httpx
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=600) as client:
+        workload = Workload(client, Recorder(), [])
+        await workload.setup(args.concurrency)
+        # The first clip starts the pool processes; keep that out of the timings
+        await server.transcriber.prewarm()
+
+        latencies, statuses, probes = [], [], []
+        deepest = 0
+        done = asyncio.Event()
+
+        async def probe():
+            nonlocal deepest
+            while not done.is_set():
+                start = time.perf_counter()
+                await client.get('/api/health/live')
+                probes.append(time.perf_counter() - start)
+                deepest = max(deepest, int(TRANSCRIPTION_QUEUE_DEPTH.value()))
+                await asyncio.sleep(0.05)
+
+        async def student(index: int, clips: int):
+            user = workload.users[index]
+            for _ in range(clips):
+                start = time.perf_counter()
+                response = await client.post(f'/api/tutor/voice?session_id=voice-{index}', content=stream(clip),
+                                             headers={**user['headers'], 'Content-Type': 'audio/wav'})
+                latencies.append(time.perf_counter() - start)
+                statuses.append(response.status_code)
+
+        prober = asyncio.create_task(probe())
+        start = time.perf_counter()
+        share, extra = divmod(args.clips, args.concurrency)
+        await asyncio.gather(*(student(i, share + (i < extra)) for i in range(args.concurrency)))
+        wall = time.perf_counter() - start
+        done.set()
+        await prober
+        server.transcriber.close()
+
+    spooled, buffered = await upload_memory(VoiceSpool, args.upload_mb)
+    latencies.sort()
+    probes.sort()
+    ok = sum(1 for status in statuses if status == 200)
+    print(f"{args.clips} clips of {args.seconds:.0f} s ({len(clip) / 1024:.0f} KiB), {args.concurrency} at a time, "
+          f"transcription workers {args.workers}, stub RTF {args.rtf}, fake LLM {args.llm_latency * 1000:.0f} ms")
+    print(f"wall {wall:.2f} s, {ok / wall:.2f} questions/s, {ok} ok, {len(statuses) - ok} failed")
+    print(f"voice question  p50 {statistics.median(latencies) * 1000:8.1f} ms   "
+          f"p95 {percentile(latencies, 95) * 1000:8.1f} ms")
+    print(f"health probe    p50 {statistics.median(probes) * 1000:8.1f} ms   "
+          f"p99 {percentile(probes, 99) * 1000:8.1f} ms   ({len(probes)} probes)")
+    print(f"deepest transcription queue {deepest}")
+    print(f"{args.upload_mb} MiB upload peak memory: spooled {spooled / 1024:.0f} KiB, "
+          f"buffered + base64 {buffered / 1024:.0f} KiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clips', type=int, default=40)
+    parser.add_argument('--seconds', type=float, default=5.0, help='length of each recording')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=1, help='transcription processes')
+    parser.add_argument('--rtf', type=float, default=0.2, help='stub CPU seconds per second of audio')
+    parser.add_argument('--llm-latency', type=float, default=0.2, help='fake LLM base latency in seconds')
+    parser.add_argument('--upload-mb', type=int, default=8, help='recording size for the memory comparison')
+    parser.add_argument('--seed', type=int, default=7)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
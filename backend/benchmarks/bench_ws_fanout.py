@@ -0,0 +1,104 @@
+"""Load test for the class room hub with thousands of simulated sockets.
+
+Two hubs share one broker to stand in for two uvicorn workers. A fraction of
+the sockets are slow so the backpressure path is exercised. Run from the
+backend directory:
+
+    python benchmarks/bench_ws_fanout.py --sockets 5000 --messages 200
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from realtime import ClassRoomHub, InMemoryBroker  # noqa: E402
+
+
+class FakeSocket:
+    def __init__(self, delay):
+        self.delay = delay
+        self.received = 0
+        self.latencies = []
+
+    async def send_json(self, message):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.received += 1
+        sent_at = message.get('sent_at')
+        if sent_at is not None:
+            self.latencies.append(time.perf_counter() - sent_at)
+
+    async def close(self, code=1000):
+        pass
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def run(args):
+    broker = InMemoryBroker()
+    workers = [ClassRoomHub(broker, queue_size=args.queue_size) for _ in range(args.workers)]
+    rooms = [f"class-{i}" for i in range(args.rooms)]
+    rng = random.Random(args.seed)
+
+    sockets = []
+    connections = []
+    start = time.perf_counter()
+    for idx in range(args.sockets):
+        hub = workers[idx % len(workers)]
+        room = rooms[idx % len(rooms)]
+        socket = FakeSocket(args.slow_delay if rng.random() < args.slow_fraction else 0)
+        conn = hub.connection(socket, f"user-{idx}", 'student')
+        await hub.connect(room, conn)
+        sockets.append(socket)
+        connections.append((hub, room, conn))
+    connect_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for idx in range(args.messages):
+        hub = workers[idx % len(workers)]
+        await hub.publish(rooms[idx % len(rooms)], {"type": "chat", "text": f"message {idx}", "sent_at": time.perf_counter()})
+        await asyncio.sleep(0)
+    publish_s = time.perf_counter() - start
+    await asyncio.sleep(args.drain)
+
+    latencies = [lat for socket in sockets for lat in socket.latencies]
+    delivered = sum(hub.delivered for hub in workers)
+    dropped = sum(hub.dropped for hub in workers)
+    presence = sum([len(await workers[0].presence(room)) for room in rooms])
+
+    for hub, room, conn in connections:
+        await hub.disconnect(room, conn)
+
+    print(f"sockets            {args.sockets:>10,} across {args.workers} workers, {args.rooms} rooms")
+    print(f"connect            {connect_s * 1000:10.1f} ms total")
+    print(f"presence members   {presence:>10,}")
+    print(f"publish            {args.messages / publish_s:10.0f} msg/s")
+    print(f"queued deliveries  {delivered:>10,}  (dropped {dropped:,})")
+    print(f"delivery latency   p50 {percentile(latencies, 50) * 1000:.2f} ms  p99 {percentile(latencies, 99) * 1000:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sockets', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--rooms', type=int, default=10)
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--queue-size', type=int, default=100)
+    parser.add_argument('--slow-fraction', type=float, default=0.02)
+    parser.add_argument('--slow-delay', type=float, default=0.05)
+    parser.add_argument('--drain', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=7)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
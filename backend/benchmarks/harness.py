@@ -0,0 +1,403 @@
+"""Load benchmark harness for the FastAPI app.
+
+Boots `server.app` in-process with a deterministic fake LlmChat and an
+in-memory Mongo stand-in (mongomock-motor), drives a mixed workload through
+httpx's ASGI transport and reports throughput and p50/p99 per route.
+
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/harness.py --workload mixed --requests 2000 --save mixed
+    python benchmarks/harness.py --workload mixed --requests 2000 --compare results/mixed.json
+
+Results are written to benchmarks/results/<name>.json.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import types
+from collections import defaultdict
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+class FakeLlmConfig:
+    def __init__(self, latency=0.05, token_rate=400.0, jitter=0.2, seed=7, model_speedup=None, malformed=None,
+                 fault_rate=0.0, slow_rate=0.0, slow_factor=20.0):
+        self.latency = latency
+        self.token_rate = token_rate
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+        # Injected faults: share of calls that raise, and share that take slow_factor times longer
+        self.fault_rate = fault_rate
+        self.slow_rate = slow_rate
+        self.slow_factor = slow_factor
+        # model name -> speed multiplier, and model name -> share of replies that are not valid JSON
+        self.model_speedup = model_speedup if model_speedup is not None else {"gpt-4o-mini": 3.0}
+        self.malformed = malformed or {}
+        self.calls = []
+
+    def models(self):
+        counts = defaultdict(int)
+        for call in self.calls:
+            counts[call["model"]] += 1
+        return dict(counts)
+
+
+def canned_response(system_message, prompt):
+    """Deterministic JSON shaped like what each endpoint asks GPT-4o for"""
+    system_message = system_message or ''
+    if 'RoadmapGPT' in system_message:
+        return json.dumps({
+            "overview": {"total_duration": "4 weeks", "total_phases": 4, "estimated_hours": 60, "difficulty": "beginner"},
+            "lessons": [
+                {
+                    "phase": phase,
+                    "title": f"Phase {phase}",
+                    "duration": f"Week {phase}",
+                    "objectives": ["Understand the core ideas", "Practice daily"],
+                    "topics": [f"Topic {phase}.{i}" for i in range(1, 5)],
+                    "description": "A focused phase with explanations, exercises and a small project. " * 3,
+                    "practice": "Build a mini project",
+                    "resources": ["Official docs", "Video course"],
+                    "tools": ["Editor", "Notebook"],
+                    "common_mistakes": ["Skipping practice"],
+                    "success_metrics": ["Can explain the topic"],
+                    "duration_minutes": 300
+                }
+                for phase in range(1, 5)
+            ],
+            "final_checklist": ["Built a capstone project"],
+            "next_steps": ["Specialize"]
+        })
+    if 'assessment designer' in system_message:
+        return json.dumps({
+            "title": "Phase Quiz",
+            "questions": [
+                {
+                    "question": f"Question {i}?",
+                    "options": ["Option A", "Option B", "Option C", "Option D"],
+                    "correct_answer": "ABCD"[i % 4],
+                    "explanation": "Because the concept says so."
+                }
+                for i in range(5)
+            ]
+        })
+    if 'career counselor' in system_message:
+        return json.dumps({"careers": [
+            {
+                "title": f"Career {i}",
+                "description": "Work on interesting problems.",
+                "salary_range": "₹6-12 LPA",
+                "required_skills": ["Python", "Communication"],
+                "roadmap": ["Learn basics", "Build projects", "Apply"]
+            }
+            for i in range(5)
+        ]})
+    if 'job market' in system_message:
+        return json.dumps([
+            {
+                "title": f"Role {i}",
+                "company": "Acme",
+                "location": "India",
+                "required_skills": ["Python"],
+                "salary": "₹6-10 LPA",
+                "description": "A realistic role.",
+                "experience_level": "Entry"
+            }
+            for i in range(10)
+        ])
+    return "Here is a clear explanation with an example and a follow-up question. " * 6
+
+
+def build_fake_llm(config: FakeLlmConfig):
+    class UserMessage:
+        def __init__(self, text):
+            self.text = text
+
+    class FakeLlmChat:
+        """Stand-in for emergentintegrations' LlmChat with configurable latency"""
+
+        def __init__(self, api_key=None, session_id=None, system_message=None):
+            self.session_id = session_id
+            self.system_message = system_message
+            self.provider = None
+            self.model = None
+
+        def with_model(self, provider, model):
+            self.provider = provider
+            self.model = model
+            return self
+
+        async def send_message(self, message):
+            response = canned_response(self.system_message, message.text)
+            if response.startswith(('{', '[')) and config.rng.random() < config.malformed.get(self.model, 0.0):
+                response = response[:len(response) // 2]
+            tokens = len(response) // 4 + 1
+            speedup = config.model_speedup.get(self.model, 1.0)
+            delay = config.latency * (1 + config.rng.uniform(-config.jitter, config.jitter))
+            if config.rng.random() < config.slow_rate:
+                delay *= config.slow_factor
+            fault = config.rng.random() < config.fault_rate
+            await asyncio.sleep((max(0.0, delay) + tokens / config.token_rate) / speedup)
+            if fault:
+                config.calls.append({"model": self.model, "session_id": self.session_id, "tokens": 0, "fault": True})
+                raise ConnectionError("injected upstream failure")
+            config.calls.append({"model": self.model, "session_id": self.session_id, "tokens": tokens})
+            return response
+
+    return FakeLlmChat, UserMessage
+
+
+def import_server(fake_llm_chat, user_message):
+    os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+    os.environ.setdefault('DB_NAME', 'eduntra_bench')
+    # Simulated users would otherwise hit the per-user rate limits within seconds
+    os.environ.setdefault('LLM_BUDGETS_ENABLED', 'false')
+    try:
+        import emergentintegrations.llm.chat  # noqa: F401
+    except ImportError:
+        # The SDK is only needed for real GPT-4o calls; register the fake under its name
+        package = types.ModuleType('emergentintegrations')
+        llm = types.ModuleType('emergentintegrations.llm')
+        chat = types.ModuleType('emergentintegrations.llm.chat')
+        chat.LlmChat = fake_llm_chat
+        chat.UserMessage = user_message
+        sys.modules.update({
+            'emergentintegrations': package,
+            'emergentintegrations.llm': llm,
+            'emergentintegrations.llm.chat': chat,
+        })
+
+    import server
+    server.LlmChat = fake_llm_chat
+    server.UserMessage = user_message
+    return server
+
+
+def fake_database(name='eduntra_bench'):
+    try:
+        from mongomock_motor import AsyncMongoMockClient
+    except ImportError as e:
+        raise SystemExit("mongomock-motor is required: pip install -r benchmarks/requirements.txt") from e
+    return AsyncMongoMockClient()[name]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, route, seconds, ok):
+        self.latencies[route].append(seconds)
+        if not ok:
+            self.errors[route] += 1
+
+    def summary(self, wall_seconds):
+        routes = {}
+        for route, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            routes[route] = {
+                "requests": len(values),
+                "errors": self.errors[route],
+                "throughput_rps": round(len(values) / wall_seconds, 2),
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+            }
+        return routes
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+class Workload:
+    def __init__(self, client, recorder, users):
+        self.client = client
+        self.recorder = recorder
+        self.users = users
+        self.paths = {}
+        self.rng = random.Random(11)
+
+    async def call(self, route, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            ok = response.status_code < 400
+        except Exception:
+            response, ok = None, False
+        self.recorder.record(route, time.perf_counter() - start, ok)
+        return response
+
+    async def setup(self, count):
+        for i in range(count):
+            email = f"bench{i}@example.com"
+            response = await self.client.post('/api/auth/register', json={
+                "email": email, "name": f"Bench {i}", "password": "bench-password", "role": "student"
+            })
+            token = response.json()['token']
+            self.users.append({"email": email, "headers": {"Authorization": f"Bearer {token}"}})
+
+    async def login(self, user):
+        await self.call('POST /api/auth/login', 'POST', '/api/auth/login',
+                        json={"email": user['email'], "password": "bench-password"})
+
+    async def tutor_chat(self, user):
+        question = self.rng.choice(["What is photosynthesis?", "Explain recursion", "How do I solve 2x + 3 = 7?"])
+        await self.call('POST /api/tutor/chat', 'POST', '/api/tutor/chat', headers=user['headers'],
+                        json={"message": question, "session_id": f"s-{user['email']}"})
+
+    async def ensure_path(self, user):
+        path_id = self.paths.get(user['email'])
+        if path_id is None:
+            response = await self.call('POST /api/learning/create-path', 'POST', '/api/learning/create-path',
+                                       headers=user['headers'], json={"subject": "Python"})
+            if response is None or response.status_code >= 400:
+                return None
+            path_id = self.paths[user['email']] = response.json()['id']
+        return path_id
+
+    async def quiz(self, user):
+        path_id = await self.ensure_path(user)
+        if path_id is None:
+            return
+        response = await self.call('POST /api/learning/generate-quiz/{path_id}/{phase}', 'POST',
+                                   f'/api/learning/generate-quiz/{path_id}/1', headers=user['headers'])
+        if response is None or response.status_code >= 400:
+            return
+        quiz = response.json()
+        answers = [self.rng.choice("ABCD") for _ in quiz['questions']]
+        await self.call('POST /api/learning/submit-quiz/{quiz_id}', 'POST',
+                        f"/api/learning/submit-quiz/{quiz['id']}", headers=user['headers'], json={"answers": answers})
+
+    async def dashboard(self, user):
+        await self.call('GET /api/learning/my-paths', 'GET', '/api/learning/my-paths?view=summary',
+                        headers=user['headers'])
+
+
+WORKLOADS = {
+    "login-storm": {"login": 1.0},
+    "tutor": {"tutor_chat": 1.0},
+    "quiz": {"quiz": 0.8, "dashboard": 0.2},
+    "mixed": {"login": 0.15, "tutor_chat": 0.45, "quiz": 0.25, "dashboard": 0.15},
+}
+
+
+async def run(args):
+    config = FakeLlmConfig(latency=args.llm_latency, token_rate=args.token_rate, seed=args.seed,
+                           malformed={"gpt-4o-mini": args.small_malformed_rate},
+                           fault_rate=args.fault_rate, slow_rate=args.slow_rate, slow_factor=args.slow_factor)
+    fake_llm_chat, user_message = build_fake_llm(config)
+    server = import_server(fake_llm_chat, user_message)
+    import metrics
+    server.db = fake_database()
+
+    import httpx
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=120) as client:
+        recorder = Recorder()
+        workload = Workload(client, recorder, [])
+        await workload.setup(args.users)
+        recorder.latencies.clear()
+
+        weights = WORKLOADS[args.workload]
+        actions = list(weights)
+        rng = random.Random(args.seed)
+        plan = rng.choices(actions, weights=[weights[a] for a in actions], k=args.requests)
+        queue = asyncio.Queue()
+        for action in plan:
+            queue.put_nowait(action)
+
+        async def worker():
+            while not queue.empty():
+                action = queue.get_nowait()
+                await getattr(workload, action)(rng.choice(workload.users))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        wall = time.perf_counter() - start
+
+    result = {
+        "workload": args.workload,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "users": args.users,
+        "llm": {"latency": args.llm_latency, "token_rate": args.token_rate, "calls": len(config.calls),
+                "models": config.models()},
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(sum(len(v) for v in recorder.latencies.values()) / wall, 2),
+        "routes": recorder.summary(wall),
+        "resilience": {
+            "hedges": metrics.LLM_HEDGES.total(),
+            "hedge_wins": metrics.LLM_HEDGE_WINS.total(),
+            "retries": metrics.LLM_RETRIES.total(),
+            "fallbacks": sum(metrics.LLM_CALL_OUTCOMES.value(endpoint=endpoint, outcome="fallback")
+                             for endpoint in ("create_learning_path", "analyze_career")),
+        },
+    }
+    return result
+
+
+def print_report(result, baseline=None, threshold=0.10):
+    print(f"workload {result['workload']}: {result['throughput_rps']} req/s over {result['wall_seconds']} s, "
+          f"{result['llm']['calls']} LLM calls {result['llm'].get('models', {})}")
+    if 'resilience' in result:
+        print("resilience " + ", ".join(f"{name} {value:g}" for name, value in result['resilience'].items()))
+    print(f"{'route':<52} {'reqs':>6} {'err':>4} {'rps':>8} {'p50 ms':>9} {'p99 ms':>9}  delta p99")
+    regressions = []
+    for route, stats in result['routes'].items():
+        delta = ''
+        old = (baseline or {}).get('routes', {}).get(route)
+        if old and old['p99_ms']:
+            change = (stats['p99_ms'] - old['p99_ms']) / old['p99_ms']
+            delta = f"{change:+.1%}"
+            if change > threshold:
+                regressions.append(route)
+        print(f"{route:<52} {stats['requests']:>6} {stats['errors']:>4} {stats['throughput_rps']:>8} "
+              f"{stats['p50_ms']:>9} {stats['p99_ms']:>9}  {delta}")
+    if regressions:
+        print(f"p99 regressions over {threshold:.0%}: {', '.join(regressions)}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workload', choices=sorted(WORKLOADS), default='mixed')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--llm-latency', type=float, default=0.05, help='fake LLM base latency in seconds')
+    parser.add_argument('--fault-rate', type=float, default=0.0, help='share of fake LLM calls that raise')
+    parser.add_argument('--slow-rate', type=float, default=0.0, help='share of fake LLM calls that are slow')
+    parser.add_argument('--slow-factor', type=float, default=20.0, help='latency multiplier for slow calls')
+    parser.add_argument('--small-malformed-rate', type=float, default=0.0,
+                        help='share of small-tier JSON replies the fake truncates, to exercise escalation')
+    parser.add_argument('--token-rate', type=float, default=400.0, help='fake LLM tokens generated per second')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--save', help='write results to benchmarks/results/<name>.json')
+    parser.add_argument('--compare', help='baseline results file to compare p99 against')
+    parser.add_argument('--threshold', type=float, default=0.10, help='p99 regression threshold')
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    regressions = print_report(result, baseline, args.threshold)
+
+    if args.save:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        path = RESULTS_DIR / f"{args.save}.json"
+        path.write_text(json.dumps(result, indent=2))
+        print(f"saved {path}")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
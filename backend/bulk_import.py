@@ -0,0 +1,196 @@
+"""Streaming CSV and NDJSON imports for student rosters and class schedules.
+
+Uploads are read row by row from the spooled upload file and never held
+in memory whole: CSV through csv.DictReader (a header row is required;
+quoted fields may span lines), NDJSON as one JSON object per line. Rows
+reach the caller in chunks of IMPORT_CHUNK_SIZE, so each chunk is
+validated, prepared and written with a single insert_many. Initial
+passwords are hashed on a thread pool, since bcrypt releases the GIL
+while it works; students imported without one get a single-use setup
+token for the reset-password flow instead, which costs no hashing at
+all. Every rejected row is reported with its line number and
+reason, and the valid rows around it are still written.
+
+Configuration:
+    IMPORT_CHUNK_SIZE          rows validated and inserted per batch (default 500)
+    IMPORT_MAX_ROWS            rows accepted per upload (default 20000)
+    IMPORT_HASH_WORKERS        threads hashing initial passwords (default: CPU count)
+    IMPORT_MAX_ERRORS          rejected rows listed in a report (default 1000)
+    IMPORT_SETUP_TOKEN_DAYS    days an imported student's password setup token stays valid (default 7)
+"""
+import asyncio
+import csv
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+
+FORMATS = ('csv', 'ndjson')
+SETUP_TOKEN_TTL = timedelta(days=int(os.environ.get('IMPORT_SETUP_TOKEN_DAYS', '7')))
+DUPLICATE_KEY = 11000
+
+Row = Tuple[int, Union[Dict[str, Any], str]]
+
+
+def detect_format(requested: Optional[str], filename: Optional[str], content_type: Optional[str]) -> str:
+    """csv or ndjson, from an explicit choice, the file extension or the content type"""
+    if requested:
+        if requested not in FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+        return requested
+    name = (filename or '').lower()
+    if name.endswith(('.ndjson', '.jsonl')) or 'ndjson' in (content_type or '') or 'jsonl' in (content_type or ''):
+        return 'ndjson'
+    if name.endswith('.csv') or 'csv' in (content_type or ''):
+        return 'csv'
+    raise ValueError("Cannot tell the file format; upload a .csv or .ndjson file or pass format")
+
+
+def clean(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Lower-cased keys, stripped strings, and blank values dropped"""
+    cleaned = {}
+    for key, value in row.items():
+        if key is None:
+            continue
+        if isinstance(value, str):
+            value = value.strip()
+        if value not in (None, ''):
+            cleaned[key.strip().lower()] = value
+    return cleaned
+
+
+def _csv_rows(text: io.TextIOWrapper) -> Iterator[Row]:
+    reader = csv.DictReader(text)
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            yield reader.line_num, f"Unreadable CSV: {e}"
+            continue
+        if None in row:
+            yield reader.line_num, "More fields than the header row"
+            continue
+        yield reader.line_num, clean(row)
+
+
+def _ndjson_rows(text: io.TextIOWrapper) -> Iterator[Row]:
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(row, dict):
+            yield line_number, "Each line must be a JSON object"
+            continue
+        yield line_number, clean(row)
+
+
+def iter_rows(file: BinaryIO, fmt: str) -> Iterator[Row]:
+    """(line, row) pairs; a row that cannot be parsed comes through as an error message instead"""
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', errors='replace', newline='')
+    try:
+        yield from _csv_rows(text) if fmt == 'csv' else _ndjson_rows(text)
+    finally:
+        # The upload owns the underlying file and closes it after the request
+        text.detach()
+
+
+def describe(error: Exception) -> str:
+    """One-line reason for a rejected row"""
+    if isinstance(error, ValidationError):
+        return '; '.join(
+            f"{'.'.join(str(part) for part in detail['loc']) or 'row'}: {detail['msg']}" for detail in error.errors()
+        )
+    return str(error) or error.__class__.__name__
+
+
+class ImportReport:
+    def __init__(self, max_errors: int):
+        self.max_errors = max_errors
+        self.created: List[Dict[str, Any]] = []
+        self.errors: List[Dict[str, Any]] = []
+        self.rejected = 0
+
+    def reject(self, line: int, reason: str, **fields):
+        self.rejected += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"row": line, "error": reason, **fields})
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "created": len(self.created),
+            "rejected": self.rejected,
+            "items": self.created,
+            "errors": sorted(self.errors, key=lambda error: error['row']),
+            # Only the first IMPORT_MAX_ERRORS rejections are listed
+            "errors_truncated": self.rejected > len(self.errors)
+        }
+
+
+class BulkImporter:
+    def __init__(self, chunk_size: Optional[int] = None, max_rows: Optional[int] = None,
+                 hash_workers: Optional[int] = None, max_errors: Optional[int] = None):
+        self.chunk_size = chunk_size or int(os.environ.get('IMPORT_CHUNK_SIZE', '500'))
+        self.max_rows = max_rows or int(os.environ.get('IMPORT_MAX_ROWS', '20000'))
+        self.hash_workers = hash_workers or int(os.environ.get('IMPORT_HASH_WORKERS', str(os.cpu_count() or 1)))
+        self.max_errors = max_errors or int(os.environ.get('IMPORT_MAX_ERRORS', '1000'))
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def report(self) -> ImportReport:
+        return ImportReport(self.max_errors)
+
+    def chunks(self, file: BinaryIO, fmt: str, report: ImportReport) -> Iterator[List[Tuple[int, Dict[str, Any]]]]:
+        """Parsed rows in insert-sized chunks; unparseable rows and rows past IMPORT_MAX_ROWS go to the report"""
+        chunk, seen = [], 0
+        for line, row in iter_rows(file, fmt):
+            seen += 1
+            if seen > self.max_rows:
+                report.reject(line, f"Upload has more than {self.max_rows} rows; the rest were not imported")
+                break
+            if isinstance(row, str):
+                report.reject(line, row)
+                continue
+            chunk.append((line, row))
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    async def hash_all(self, hash_password: Callable[[str], str], passwords: List[str]) -> List[str]:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.hash_workers, thread_name_prefix='import-hash')
+        loop = asyncio.get_running_loop()
+        return await asyncio.gather(*(loop.run_in_executor(self._executor, hash_password, p) for p in passwords))
+
+    async def insert(self, collection, rows: List[Tuple[int, Dict[str, Any]]], report: ImportReport,
+                     duplicate: str) -> List[Tuple[int, Dict[str, Any]]]:
+        """insert_many one chunk unordered; returns the rows written, rejecting those the server refused"""
+        if not rows:
+            return []
+        try:
+            await collection.insert_many([doc for _, doc in rows], ordered=False)
+            failed = {}
+        except BulkWriteError as e:
+            failed = {error['index']: error for error in e.details.get('writeErrors', [])}
+        for index, error in failed.items():
+            line, _ = rows[index]
+            report.reject(line, duplicate if error.get('code') == DUPLICATE_KEY else error.get('errmsg', 'Write failed'))
+        for _, doc in rows:
+            doc.pop('_id', None)
+        return [row for index, row in enumerate(rows) if index not in failed]
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,114 @@
+"""Career recommendations shared by everyone with the same interests and skills.
+
+Interests and skills are canonicalized (Unicode NFKC, case folding,
+whitespace collapsed, duplicates dropped, sorted) and hashed into a key,
+so "Python, Music" and "music,python" share one `career_catalog` entry.
+Entries come from LLM answers and, once, from the recommendations already
+stored in `career_profiles`. An entry is served while it is younger than
+CAREER_CATALOG_MAX_AGE_DAYS (default 30) and was produced by the current
+career prompt; older entries are regenerated, but still answer when the
+LLM cannot.
+
+Each user keeps a single `career_profiles` document with their latest
+analysis; dedupe_profiles() collapses the copies earlier versions
+appended on every request.
+"""
+import hashlib
+import os
+import unicodedata
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from migrations import as_utc
+
+
+def canonical_terms(values: Union[str, Iterable[str], None]) -> List[str]:
+    if not values:
+        return []
+    if isinstance(values, str):
+        values = values.split(',')
+    terms = set()
+    for value in values:
+        term = ' '.join(unicodedata.normalize('NFKC', str(value)).casefold().split()).strip(' .;:')
+        if term:
+            terms.add(term)
+    return sorted(terms)
+
+
+def career_key(interests, skills) -> Tuple[str, List[str], List[str]]:
+    """(key, canonical interests, canonical skills)"""
+    interests, skills = canonical_terms(interests), canonical_terms(skills)
+    payload = '\x1f'.join(interests) + '\x1e' + '\x1f'.join(skills)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest(), interests, skills
+
+
+class CareerCatalog:
+    def __init__(self, max_age_days: Optional[float] = None):
+        if max_age_days is None:
+            max_age_days = float(os.environ.get('CAREER_CATALOG_MAX_AGE_DAYS', '30'))
+        self.max_age = timedelta(days=max_age_days)
+
+    def is_fresh(self, entry: Dict[str, Any], prompt_version: Optional[str]) -> bool:
+        if entry.get('prompt_version') and prompt_version and entry['prompt_version'] != prompt_version:
+            return False
+        updated_at = as_utc(entry.get('updated_at'))
+        return updated_at is not None and datetime.now(timezone.utc) - updated_at < self.max_age
+
+    async def lookup(self, db, key: str) -> Optional[Dict[str, Any]]:
+        return await db.career_catalog.find_one_and_update(
+            {"_id": key},
+            {"$inc": {"hits": 1}, "$set": {"last_hit_at": datetime.now(timezone.utc)}},
+            projection={"careers": 1, "prompt_version": 1, "updated_at": 1}
+        )
+
+    async def store(self, db, key: str, interests: List[str], skills: List[str], careers: List[Dict[str, Any]],
+                    prompt_version: Optional[str]):
+        now = datetime.now(timezone.utc)
+        await db.career_catalog.update_one(
+            {"_id": key},
+            {
+                "$set": {"careers": careers, "prompt_version": prompt_version, "source": "llm", "updated_at": now},
+                "$setOnInsert": {"interests": interests, "skills": skills, "created_at": now, "hits": 0}
+            },
+            upsert=True
+        )
+
+    async def build_from_profiles(self, db) -> int:
+        """Seed entries from stored profiles, newest first, without replacing existing ones"""
+        added = 0
+        cursor = db.career_profiles.find(
+            {"recommended_careers.0": {"$exists": True}},
+            {"_id": 0, "interests": 1, "skills": 1, "recommended_careers": 1, "created_at": 1}
+        ).sort("created_at", -1).batch_size(500)
+        async for profile in cursor:
+            key, interests, skills = career_key(profile.get('interests'), profile.get('skills'))
+            result = await db.career_catalog.update_one(
+                {"_id": key},
+                {"$setOnInsert": {
+                    "interests": interests,
+                    "skills": skills,
+                    "careers": profile['recommended_careers'],
+                    "source": "history",
+                    "hits": 0,
+                    "created_at": datetime.now(timezone.utc),
+                    "updated_at": as_utc(profile.get('created_at')) or datetime.now(timezone.utc)
+                }},
+                upsert=True
+            )
+            added += 1 if result.upserted_id is not None else 0
+        return added
+
+
+async def dedupe_profiles(db) -> int:
+    """Keep only the newest career profile per user, then enforce it with a unique index"""
+    removed = 0
+    duplicates = db.career_profiles.aggregate([
+        {"$sort": {"created_at": -1}},
+        {"$group": {"_id": "$user_id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ], allowDiskUse=True)
+    async for group in duplicates:
+        result = await db.career_profiles.delete_many({"_id": {"$in": group['ids'][1:]}})
+        removed += result.deleted_count
+    await db.career_profiles.create_index("user_id", unique=True)
+    return removed
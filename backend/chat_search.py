@@ -0,0 +1,155 @@
+"""Search across a user's tutor history, live and archived.
+
+Every chat message stores its `search_terms` (see text_index), and a
+multikey index on (user_id, search_terms, timestamp) turns a query into
+an index scan over that user's messages containing its most selective
+term, newest first, with the other terms checked on the same document.
+Archived sessions keep the union of their messages' terms on the archive
+document, so only archives that can match are decompressed.
+
+Matches are ranked BM25-style on term frequency with length
+normalization, plus a bonus when the whole query appears as a phrase;
+ties go to the newer message. Each result has a snippet of the message
+around its first match and the (start, end) offsets of the matched terms
+in that snippet, for the client to highlight.
+
+Messages and archives written before search existed, or indexed with an
+older text_index.TERMS_VERSION, are (re)indexed by CHAT_SEARCH_MIGRATIONS.
+
+Configuration:
+    CHAT_SEARCH_CANDIDATES       newest matching messages ranked per query (default 200)
+    CHAT_SEARCH_ARCHIVES         archived sessions searched per query (default 20)
+    CHAT_SEARCH_SNIPPET_CHARS    snippet length (default 160)
+"""
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from data_lifecycle import unpack_messages
+from migrations import Migration, as_utc
+from text_index import TERMS_VERSION, highlights, merged_terms, normalize, query_terms, search_terms
+
+# BM25 term saturation and length normalization
+K1 = 1.2
+B = 0.75
+OLDEST = datetime.min.replace(tzinfo=timezone.utc)
+
+
+def indexed(message: Dict[str, Any]) -> Dict[str, Any]:
+    """A chat message document with its search terms added, ready to insert"""
+    message['search_terms'] = search_terms(message.get('content') or '')
+    message['search_version'] = TERMS_VERSION
+    return message
+
+
+def _may_contain(text: str, terms: List[str]) -> bool:
+    """Cheap substring test before tokenizing; a folded term ending in y also stands for its -ies plural"""
+    return all(term in text or (term.endswith('y') and term[:-1] in text) for term in terms)
+
+
+class ChatSearch:
+    def __init__(self, candidates: Optional[int] = None, archives: Optional[int] = None,
+                 snippet_chars: Optional[int] = None):
+        self.candidates = candidates or int(os.environ.get('CHAT_SEARCH_CANDIDATES', '200'))
+        self.archives = archives or int(os.environ.get('CHAT_SEARCH_ARCHIVES', '20'))
+        self.snippet_chars = snippet_chars or int(os.environ.get('CHAT_SEARCH_SNIPPET_CHARS', '160'))
+
+    async def search(self, db, user_id: str, query: str, limit: int = 20,
+                     session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        terms = query_terms(query)
+        if not terms:
+            return []
+        match: Dict[str, Any] = {"user_id": user_id, "search_terms": {"$all": terms}}
+        if session_id is not None:
+            match["session_id"] = session_id
+        messages = await db.chat_messages.find(
+            match, {"_id": 0, "search_terms": 0}
+        ).sort("timestamp", -1).limit(self.candidates).to_list(self.candidates)
+        messages += await self._archived(db, match, terms)
+        return [self._result(message, score, terms) for score, message in self.rank(query, terms, messages)[:limit]]
+
+    async def _archived(self, db, match: Dict[str, Any], terms: List[str]) -> List[Dict[str, Any]]:
+        archives = await db.chat_archives.find(
+            match, {"data": 1, "codec": 1}
+        ).sort("last_timestamp", -1).limit(self.archives).to_list(self.archives)
+        wanted = set(terms)
+        return [
+            message for archive in archives for message in unpack_messages(archive)
+            if _may_contain(normalize(message.get('content') or ''), terms)
+            and wanted.issubset(search_terms(message['content']))
+        ]
+
+    def rank(self, query: str, terms: List[str], messages: List[Dict[str, Any]]) -> List[Tuple[float, Dict[str, Any]]]:
+        """(score, message) pairs, best first"""
+        if not messages:
+            return []
+        texts = [normalize(message.get('content') or '') for message in messages]
+        average = sum(len(text) for text in texts) / len(texts) or 1
+        phrase = ' '.join(normalize(query).split())
+        scored = []
+        for message, text in zip(messages, texts):
+            saturation = K1 * (1 - B + B * len(text) / average)
+            # Substring counts are cheap and only order messages already known to contain every term
+            score = sum(tf * (K1 + 1) / (tf + saturation) for tf in (text.count(term) for term in terms))
+            if len(terms) > 1 and phrase in text:
+                score += len(terms)
+            scored.append((score, message))
+        scored.sort(key=lambda pair: (pair[0], as_utc(pair[1].get('timestamp')) or OLDEST), reverse=True)
+        return scored
+
+    def snippet(self, content: str, terms: List[str]) -> Tuple[str, List[Tuple[int, int]]]:
+        """The part of `content` around its first match, and the highlighted spans in it"""
+        width = self.snippet_chars
+        if len(content) <= width:
+            return content, highlights(content, terms)
+        # Offsets into the original text: normalizing can change its length (ß, ligatures, full-width forms)
+        matches = highlights(content, terms)
+        first = matches[0][0] if matches else 0
+        start = max(0, min(first - width // 4, len(content) - width))
+        end = start + width
+        # Cut on whitespace so no word is split at either edge
+        if start > 0:
+            space = content.find(' ', start, first)
+            start = space + 1 if space != -1 else start
+        if end < len(content):
+            space = content.rfind(' ', first, end)
+            end = space if space > first else end
+        text = content[start:end].strip()
+        prefix = '…' if start > 0 else ''
+        suffix = '…' if end < len(content) else ''
+        spans = [(a + len(prefix), b + len(prefix)) for a, b in highlights(text, terms)]
+        return prefix + text + suffix, spans
+
+    def _result(self, message: Dict[str, Any], score: float, terms: List[str]) -> Dict[str, Any]:
+        snippet, spans = self.snippet(message.get('content') or '', terms)
+        return {
+            "message_id": message.get('id'),
+            "session_id": message.get('session_id'),
+            "role": message.get('role'),
+            "timestamp": message.get('timestamp'),
+            "score": round(score, 3),
+            "snippet": snippet,
+            "highlights": spans
+        }
+
+
+def _message_terms(doc: Dict[str, Any]) -> Dict[str, Any]:
+    return {"search_terms": search_terms(doc.get('content') or ''), "search_version": TERMS_VERSION}
+
+
+def _archive_terms(doc: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "search_terms": merged_terms(message.get('content') or '' for message in unpack_messages(doc)),
+        "search_version": TERMS_VERSION
+    }
+
+
+# The stored terms and version are read too: updates only apply while they are still what was read
+_STALE_TERMS = {"search_version": {"$ne": TERMS_VERSION}}
+
+CHAT_SEARCH_MIGRATIONS = [
+    Migration(f"search_terms_v{TERMS_VERSION}:chat_messages", "chat_messages", _STALE_TERMS,
+              ("content", "search_terms", "search_version"), _message_terms),
+    Migration(f"search_terms_v{TERMS_VERSION}:chat_archives", "chat_archives", _STALE_TERMS,
+              ("data", "codec", "search_terms", "search_version"), _archive_terms),
+]
@@ -0,0 +1,233 @@
+"""Retention for ephemeral data and a compressed cold archive for old chats.
+
+Ephemeral documents carry an `expires_at` date and are removed by TTL
+indexes: password reset tokens after an hour, generated quizzes after
+QUIZ_TTL_DAYS unless someone submits them (grading unsets the field, so
+quizzes with results and item-bank statistics are kept).
+
+Every chat turn moves its session's `last_timestamp` forward in
+`chat_sessions`, so finding sessions with no message for
+CHAT_ARCHIVE_AFTER_DAYS is a range scan over that small collection, never
+over old messages of sessions that are still active. The ChatArchiver
+packs each of them into one `chat_archives` document per session: the
+messages BSON-encoded and compressed with zstd when the `zstandard`
+package is installed, zlib otherwise. The live messages are deleted
+afterwards, which keeps the `chat_messages` working set to recent
+conversations. A session that is resumed later gets new live messages,
+and the next archive pass merges them into the existing blob. Archives
+keep the union of their messages' search terms so history search only
+decompresses sessions that can match.
+
+Configuration:
+    QUIZ_TTL_DAYS              days an unsubmitted quiz is kept (default 14, 0 keeps all)
+    CHAT_ARCHIVE_AFTER_DAYS    idle days before a session is archived (default 30, 0 disables)
+    CHAT_ARCHIVE_INTERVAL      seconds between archive passes (default 3600)
+    CHAT_ARCHIVE_CODEC         zstd or zlib (default zstd when available)
+"""
+import logging
+import os
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import bson
+from bson.binary import Binary
+from bson.codec_options import CodecOptions
+from pymongo import UpdateOne
+
+from text_index import TERMS_VERSION, merged_terms
+
+logger = logging.getLogger(__name__)
+
+QUIZ_TTL_DAYS = int(os.environ.get('QUIZ_TTL_DAYS', '14'))
+PASSWORD_RESET_TTL = timedelta(hours=1)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DECODE_OPTIONS = CodecOptions(tz_aware=True)
+
+
+def quiz_expiry(now: Optional[datetime] = None) -> Optional[datetime]:
+    """expires_at for a newly generated quiz, or None when quizzes are kept forever"""
+    if QUIZ_TTL_DAYS <= 0:
+        return None
+    return (now or datetime.now(timezone.utc)) + timedelta(days=QUIZ_TTL_DAYS)
+
+
+async def create_ttl_indexes(db):
+    await db.password_resets.create_index("expires_at", expireAfterSeconds=0)
+    await db.quizzes.create_index("expires_at", expireAfterSeconds=0)
+
+
+def default_codec() -> str:
+    codec = os.environ.get('CHAT_ARCHIVE_CODEC') or ('zstd' if zstandard else 'zlib')
+    if codec == 'zstd' and zstandard is None:
+        logger.warning("CHAT_ARCHIVE_CODEC=zstd but zstandard is not installed; using zlib")
+        return 'zlib'
+    return codec
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    if codec == 'zlib':
+        return zlib.compress(data, 9)
+    raise ValueError(f"Unsupported archive codec: {codec}")
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("This chat archive is zstd-compressed but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    raise ValueError(f"Unsupported archive codec: {codec}")
+
+
+def pack_messages(messages: List[Dict[str, Any]], codec: str) -> bytes:
+    # BSON keeps dates as dates, which JSON would turn into strings
+    return compress(bson.encode({"messages": messages}), codec)
+
+
+def unpack_messages(archive: Dict[str, Any]) -> List[Dict[str, Any]]:
+    raw = decompress(bytes(archive['data']), archive['codec'])
+    return bson.decode(raw, codec_options=DECODE_OPTIONS)['messages']
+
+
+async def load_archived_messages(db, user_id: str, session_id: str) -> List[Dict[str, Any]]:
+    archive = await db.chat_archives.find_one({"_id": archive_id(user_id, session_id)})
+    return unpack_messages(archive) if archive else []
+
+
+def archive_id(user_id: str, session_id: str) -> str:
+    return f"{user_id}:{session_id}"
+
+
+def _session_activity(user_id: str, session_id: str, timestamp: Any) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Filter and upsert moving a chat_sessions entry's last_timestamp forward"""
+    return (
+        {"_id": archive_id(user_id, session_id)},
+        {"$max": {"last_timestamp": timestamp}, "$setOnInsert": {"user_id": user_id, "session_id": session_id}}
+    )
+
+
+async def touch_session(db, user_id: str, session_id: str, timestamp: datetime):
+    """Record a message in a session, for the archiver's idle-session scan"""
+    await db.chat_sessions.update_one(*_session_activity(user_id, session_id, timestamp), upsert=True)
+
+
+async def backfill_sessions(db, batch_size: int = 1000) -> int:
+    """chat_sessions entries for the messages written before sessions were tracked"""
+    groups = db.chat_messages.aggregate([
+        {"$group": {
+            "_id": {"user_id": "$user_id", "session_id": "$session_id"},
+            "last_timestamp": {"$max": "$timestamp"}
+        }}
+    ])
+    updates, count = [], 0
+    async for group in groups:
+        updates.append(UpdateOne(
+            *_session_activity(group['_id']['user_id'], group['_id']['session_id'], group['last_timestamp']),
+            upsert=True
+        ))
+        if len(updates) >= batch_size:
+            await db.chat_sessions.bulk_write(updates, ordered=False)
+            count += len(updates)
+            updates = []
+    if updates:
+        await db.chat_sessions.bulk_write(updates, ordered=False)
+        count += len(updates)
+    return count
+
+
+class ChatArchiver:
+    def __init__(self, db, after_days: Optional[int] = None, codec: Optional[str] = None,
+                 sessions_per_pass: int = 500):
+        self.db = db
+        self.after_days = int(os.environ.get('CHAT_ARCHIVE_AFTER_DAYS', '30')) if after_days is None else after_days
+        self.codec = codec or default_codec()
+        self.sessions_per_pass = sessions_per_pass
+
+    async def idle_sessions(self, cutoff: datetime) -> List[Tuple[str, str]]:
+        """(user_id, session_id) of up to sessions_per_pass sessions with no message since cutoff
+
+        Candidates come from an index range scan over chat_sessions, which
+        only holds sessions with live messages. Each is then checked for a
+        newer message on the session index, in case one was written by a
+        worker that did not record it (during a rolling deploy); its
+        last_timestamp is moved forward instead. Comparing with a date skips
+        legacy string timestamps, which are archived once migrated.
+        """
+        candidates = await self.db.chat_sessions.find(
+            {"last_timestamp": {"$lt": cutoff}}, {"_id": 0, "user_id": 1, "session_id": 1}
+        ).sort("last_timestamp", 1).limit(self.sessions_per_pass).to_list(self.sessions_per_pass)
+        idle = []
+        for session in candidates:
+            user_id, session_id = session['user_id'], session['session_id']
+            recent = await self.db.chat_messages.find_one(
+                {"user_id": user_id, "session_id": session_id, "timestamp": {"$gte": cutoff}},
+                {"_id": 0, "timestamp": 1}, sort=[("timestamp", -1)]
+            )
+            if recent is None:
+                idle.append((user_id, session_id))
+            else:
+                await touch_session(self.db, user_id, session_id, recent['timestamp'])
+        return idle
+
+    async def archive_session(self, user_id: str, session_id: str) -> int:
+        messages = await self.db.chat_messages.find(
+            {"user_id": user_id, "session_id": session_id}
+        ).sort("timestamp", 1).to_list(None)
+        if not messages:
+            return 0
+        live_ids = [message.pop('_id') for message in messages]
+        for message in messages:
+            # The archive document carries the session's terms; the packed copies don't need them
+            message.pop('search_terms', None)
+            message.pop('search_version', None)
+
+        # Merge with an earlier archive of the same session; ids drop copies left by an interrupted pass
+        key = archive_id(user_id, session_id)
+        previous = await self.db.chat_archives.find_one({"_id": key})
+        archived = unpack_messages(previous) if previous else []
+        seen = {message.get('id') for message in archived}
+        archived.extend(message for message in messages if message.get('id') not in seen)
+
+        data = pack_messages(archived, self.codec)
+        last = archived[-1]
+        await self.db.chat_archives.replace_one({"_id": key}, {
+            "user_id": user_id,
+            "session_id": session_id,
+            "codec": self.codec,
+            "data": Binary(data),
+            "message_count": len(archived),
+            "first_timestamp": archived[0].get('timestamp'),
+            "last_timestamp": last.get('timestamp'),
+            "last_message": (last.get('content') or '')[:200],
+            "search_terms": merged_terms(message.get('content') or '' for message in archived),
+            "search_version": TERMS_VERSION,
+            "archived_at": datetime.now(timezone.utc)
+        }, upsert=True)
+        # Only after the archive is written, so a crash never loses messages
+        await self.db.chat_messages.delete_many({"_id": {"$in": live_ids}})
+        return len(messages)
+
+    async def run_once(self) -> Dict[str, int]:
+        if self.after_days <= 0:
+            return {"sessions": 0, "messages": 0}
+        cutoff = datetime.now(timezone.utc) - timedelta(days=self.after_days)
+        sessions = messages = 0
+        for user_id, session_id in await self.idle_sessions(cutoff):
+            messages += await self.archive_session(user_id, session_id)
+            sessions += 1
+            # Unless a message arrived meanwhile; the next pass picks that one up
+            await self.db.chat_sessions.delete_one(
+                {"_id": archive_id(user_id, session_id), "last_timestamp": {"$lt": cutoff}}
+            )
+        if sessions:
+            logger.info(f"Archived {messages} chat messages from {sessions} idle sessions")
+        return {"sessions": sessions, "messages": messages}
@@ -0,0 +1,351 @@
+"""Curated offline content served when the LLM cannot answer.
+
+data/fallback_catalog.json holds hand-written roadmaps for common
+subjects, generic roadmap and lesson templates for everything else, and
+career profiles tagged with keywords. The file is read once per worker
+and indexed: roadmaps by (subject, level), with each variant encoded as
+JSON ahead of time; subject names and aliases in a trigram index; and
+careers in an inverted keyword index. Lookups then only decode a
+prepared entry. Every call returns fresh objects that the caller may
+modify.
+
+Subjects match fuzzily. Trigrams are padded per word as in PostgreSQL's
+pg_trgm, and similarity is shared trigrams over all distinct trigrams.
+A query is compared window by window, up to three words at a time, so
+"pyton", "Learn Python 3" and "intro to machine learning" all find their
+entry. A window must have at least as many words as the alias it
+matches, so "computer science" does not fall into "data science", and
+a multi-word alias only matches when the window holds one of its
+distinctive words: words naming more than one subject ("data",
+"development") and generic study words ("programming", "design") do not
+count, so "game development" gets the generic roadmap, not Web Development.
+
+Configuration:
+    FALLBACK_CATALOG_PATH         catalog JSON to load (default data/fallback_catalog.json)
+    FALLBACK_SUBJECT_THRESHOLD    minimum similarity for a fuzzy subject match (default 0.4)
+"""
+import json
+import os
+import re
+import unicodedata
+from collections import defaultdict
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from career_catalog import canonical_terms
+
+DEFAULT_PATH = Path(__file__).parent / 'data' / 'fallback_catalog.json'
+SUBJECT_THRESHOLD = float(os.environ.get('FALLBACK_SUBJECT_THRESHOLD', '0.4'))
+CAREER_KEYWORD_THRESHOLD = 0.5
+
+LEVELS = ('beginner', 'intermediate', 'advanced')
+LEVEL_WORDS = {
+    'beginner': 'beginner', 'novice': 'beginner', 'basic': 'beginner', 'basics': 'beginner', 'new': 'beginner',
+    'intermediate': 'intermediate', 'medium': 'intermediate', 'moderate': 'intermediate',
+    'advanced': 'advanced', 'expert': 'advanced', 'pro': 'advanced',
+}
+PHASES_PER_ROADMAP = 4
+MAX_WINDOW_WORDS = 3
+MAX_QUERY_WORDS = 12
+
+_NON_WORD = re.compile(r'[\W_]+')
+_TIMELINE = re.compile(r'(\d+)\s*(day|week|month|year)', re.IGNORECASE)
+# Words that say what kind of study a subject is, not which subject
+GENERIC_WORDS = frozenset({
+    'basics', 'course', 'design', 'developer', 'development', 'engineering', 'fundamentals', 'intro',
+    'introduction', 'learn', 'learning', 'programming', 'science', 'skills',
+})
+
+
+def normalize(text: Any) -> str:
+    return ' '.join(_NON_WORD.sub(' ', unicodedata.normalize('NFKC', str(text or '')).casefold()).split())
+
+
+def trigrams(text: str) -> FrozenSet[str]:
+    grams = set()
+    for word in normalize(text).split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+def similarity(a: str, b: str) -> float:
+    first, second = trigrams(a), trigrams(b)
+    return len(first & second) / len(first | second) if first and second else 0.0
+
+
+class TrigramIndex:
+    """Inverted trigram index over short strings (subjects, aliases, keywords)"""
+
+    def __init__(self):
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        self._sizes: List[int] = []
+        self._words: List[int] = []
+        self._values: List[Any] = []
+
+    def add(self, text: str, value: Any):
+        grams = trigrams(text)
+        if not grams:
+            return
+        entry = len(self._values)
+        for gram in grams:
+            self._postings[gram].append(entry)
+        self._sizes.append(len(grams))
+        self._words.append(len(normalize(text).split()))
+        self._values.append(value)
+
+    def search(self, text: str, threshold: float, min_words: int = 0) -> List[Tuple[float, Any]]:
+        """(similarity, value) at or above threshold, best first; entries with more words than the query are skipped"""
+        grams = trigrams(text)
+        shared: Dict[int, int] = defaultdict(int)
+        for gram in grams:
+            for entry in self._postings.get(gram, ()):
+                shared[entry] += 1
+        words = min_words or len(normalize(text).split())
+        matches = []
+        for entry, count in shared.items():
+            if self._words[entry] > words:
+                continue
+            score = count / (len(grams) + self._sizes[entry] - count)
+            if score >= threshold:
+                matches.append((score, self._values[entry]))
+        matches.sort(key=lambda match: match[0], reverse=True)
+        return matches
+
+
+def level_of(skill_level: Any) -> str:
+    for word in normalize(skill_level).split():
+        if word in LEVEL_WORDS:
+            return LEVEL_WORDS[word]
+    return 'beginner'
+
+
+def phase_durations(timeline: Any, phases: int) -> List[str]:
+    """'Week 1', 'Weeks 2-3', ... spreading the learner's timeline evenly over the phases"""
+    match = _TIMELINE.search(str(timeline or ''))
+    count, unit = (int(match.group(1)), match.group(2).lower()) if match else (phases, 'week')
+    if unit == 'month':
+        count, unit = count * 4, 'week'
+    elif unit == 'year':
+        count, unit = count * 52, 'week'
+    count = max(count, 1)
+    labels = []
+    for phase in range(phases):
+        first = phase * count // phases + 1
+        last = max(first, (phase + 1) * count // phases)
+        name = unit.capitalize()
+        labels.append(f"{name} {first}" if first == last else f"{name}s {first}-{last}")
+    return labels
+
+
+def _encode(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+class FallbackCatalog:
+    def __init__(self, data: Dict[str, Any]):
+        self.version = data.get('version')
+        self.subjects: List[str] = []
+        self._exact: Dict[str, int] = {}
+        self._subject_index = TrigramIndex()
+        # (subject id, level) -> encoded (lessons, final_checklist, next_steps, estimated_hours)
+        self._roadmaps: Dict[Tuple[int, str], str] = {}
+        self._lessons: Dict[Tuple[int, str], str] = {}
+        # Learners ask for the same few subjects; remember where free-text queries landed
+        self._fuzzy_match = lru_cache(maxsize=4096)(self._fuzzy_match)
+
+        names: Dict[str, int] = {}
+        word_subjects: Dict[str, set] = defaultdict(set)
+        for roadmap in data['roadmaps']:
+            subject_id = len(self.subjects)
+            self.subjects.append(roadmap['subject'])
+            for name in [roadmap['subject'], *roadmap.get('aliases', [])]:
+                name = normalize(name)
+                self._exact.setdefault(name, subject_id)
+                self._subject_index.add(name, (subject_id, name))
+                names.setdefault(name, subject_id)
+                for word in name.split():
+                    word_subjects[word].add(subject_id)
+            for rank, level in enumerate(LEVELS):
+                phases = roadmap['phases'][rank:rank + PHASES_PER_ROADMAP]
+                if len(phases) < PHASES_PER_ROADMAP - 1:
+                    phases = roadmap['phases'][-(PHASES_PER_ROADMAP - 1):]
+                self._roadmaps[subject_id, level] = _encode(self._roadmap_entry(roadmap, phases))
+                self._lessons[subject_id, level] = _encode(self._lesson_entries(roadmap, phases))
+
+        shared = {word for word, subject_ids in word_subjects.items() if len(subject_ids) > 1}
+        # name -> the words that tell its subject apart, for multi-word names
+        self._distinctive: Dict[str, FrozenSet[str]] = {
+            name: frozenset(name.split()) - shared - GENERIC_WORDS for name in names if ' ' in name
+        }
+
+        generic = data['generic_roadmap']
+        self._generic_roadmap = _encode(self._roadmap_entry(generic, generic['phases']))
+        self._generic_lessons = _encode(data['generic_lessons'])
+
+        self.careers: List[str] = []
+        self._career_docs: List[str] = []
+        self._default_careers: List[int] = []
+        self._keywords: Dict[str, List[int]] = defaultdict(list)
+        self._keyword_index = TrigramIndex()
+        for career in data['careers']:
+            career_id = len(self.careers)
+            self.careers.append(career['title'])
+            self._career_docs.append(_encode({
+                key: value for key, value in career.items() if key not in ('keywords', 'default')
+            }))
+            if career.get('default'):
+                self._default_careers.append(career_id)
+            for keyword in career.get('keywords', []):
+                keyword = normalize(keyword)
+                if keyword not in self._keywords:
+                    self._keyword_index.add(keyword, keyword)
+                self._keywords[keyword].append(career_id)
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> 'FallbackCatalog':
+        path = path or os.environ.get('FALLBACK_CATALOG_PATH') or DEFAULT_PATH
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    @staticmethod
+    def _roadmap_entry(roadmap: Dict[str, Any], phases: List[Dict[str, Any]]) -> Dict[str, Any]:
+        lessons = []
+        for number, phase in enumerate(phases, 1):
+            lessons.append({
+                "phase": number,
+                "title": phase['title'],
+                "duration": f"Week {number}",
+                "objectives": phase['objectives'],
+                "topics": phase['topics'],
+                "description": phase['description'],
+                "practice": phase['practice'],
+                "resources": phase.get('resources', roadmap.get('resources', [])),
+                "tools": phase.get('tools', roadmap.get('tools', [])),
+                "common_mistakes": phase['common_mistakes'],
+                "success_metrics": phase['success_metrics'],
+                "duration_minutes": phase['hours'] * 60
+            })
+        return {
+            "lessons": lessons,
+            "final_checklist": roadmap['final_checklist'],
+            "next_steps": roadmap['next_steps'],
+            "estimated_hours": sum(phase['hours'] for phase in phases)
+        }
+
+    @staticmethod
+    def _lesson_entries(roadmap: Dict[str, Any], phases: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # Two lessons per phase: the concepts, then the hands-on practice
+        lessons = []
+        for number, phase in enumerate(phases, 1):
+            half = (len(phase['topics']) + 1) // 2
+            minutes = phase['hours'] * 30
+            lessons.append({
+                "title": phase['title'],
+                "description": phase['description'],
+                "duration_minutes": minutes,
+                "week": f"Week {number}",
+                "topics": phase['topics'][:half],
+                "resources": roadmap['resources'][:2],
+                "practice": phase['objectives'][0]
+            })
+            lessons.append({
+                "title": f"{phase['title']}: Practice",
+                "description": phase['practice'],
+                "duration_minutes": minutes,
+                "week": f"Week {number}",
+                "topics": phase['topics'][half:],
+                "resources": roadmap['resources'][2:] or roadmap['resources'][:1],
+                "practice": phase['practice']
+            })
+        return lessons
+
+    def match_subject(self, subject: Any) -> Optional[str]:
+        subject_id = self._match(subject)
+        return None if subject_id is None else self.subjects[subject_id]
+
+    def _match(self, subject: Any) -> Optional[int]:
+        query = normalize(subject)
+        if query in self._exact:
+            return self._exact[query]
+        return self._fuzzy_match(query)
+
+    def _fuzzy_match(self, query: str) -> Optional[int]:
+        words = query.split()[:MAX_QUERY_WORDS]
+        best, best_key = None, (0.0, 0)
+        for size in range(min(MAX_WINDOW_WORDS, len(words)), 0, -1):
+            for start in range(len(words) - size + 1):
+                window = ' '.join(words[start:start + size])
+                subject_id = self._exact.get(window)
+                if subject_id is not None:
+                    matches = [(1.0, subject_id)]
+                else:
+                    matches = [(score, subject_id) for score, (subject_id, name)
+                               in self._subject_index.search(window, SUBJECT_THRESHOLD, size)
+                               if self._names_subject(window, name)]
+                # Prefer the closest match, then the longer (more specific) window
+                if matches and (matches[0][0], size) > best_key:
+                    best, best_key = matches[0][1], (matches[0][0], size)
+        return best
+
+    def _names_subject(self, window: str, name: str) -> bool:
+        """Whether a fuzzy match of window on a multi-word name shares one of the name's distinctive words"""
+        distinctive = self._distinctive.get(name)
+        if not distinctive:
+            return True
+        return any(similarity(word, wanted) >= SUBJECT_THRESHOLD for word in window.split() for wanted in distinctive)
+
+    def roadmap(self, subject: Any, skill_level: Any, timeline: Any) -> Tuple[List[Dict[str, Any]], Dict[str, Any], List[str], List[str]]:
+        """(lessons, overview, final_checklist, next_steps), in the shape create-path stores"""
+        subject_id = self._match(subject)
+        if subject_id is None:
+            entry = json.loads(self._generic_roadmap.replace('{subject}', _encode(str(subject or 'this subject'))[1:-1]))
+        else:
+            entry = json.loads(self._roadmaps[subject_id, level_of(skill_level)])
+        lessons = entry['lessons']
+        for lesson, duration in zip(lessons, phase_durations(timeline, len(lessons))):
+            lesson['duration'] = duration
+        overview = {
+            "total_duration": timeline,
+            "total_phases": len(lessons),
+            "estimated_hours": entry['estimated_hours'],
+            "difficulty": skill_level
+        }
+        return lessons, overview, entry['final_checklist'], entry['next_steps']
+
+    def lessons(self, subject: Any, skill_level: Any) -> List[Dict[str, Any]]:
+        subject_id = self._match(subject)
+        if subject_id is None:
+            return json.loads(self._generic_lessons.replace('{subject}', _encode(str(subject or 'this subject'))[1:-1]))
+        return json.loads(self._lessons[subject_id, level_of(skill_level)])
+
+    def careers_for(self, interests: Any, skills: Any, limit: int = 5, minimum: int = 3) -> List[Dict[str, Any]]:
+        """Careers ranked by how many interests and skills hit their keywords, padded with the defaults"""
+        scores: Dict[int, float] = defaultdict(float)
+        for term in canonical_terms(interests) + canonical_terms(skills):
+            term = normalize(term)
+            hits = self._keyword_hits(term)
+            if not hits:
+                for word in term.split():
+                    hits.update(self._keyword_hits(word))
+            for career_id, weight in hits.items():
+                scores[career_id] += weight
+        ranked = sorted(scores, key=lambda career_id: (-scores[career_id], career_id))[:limit]
+        for career_id in self._default_careers:
+            if len(ranked) >= minimum:
+                break
+            if career_id not in ranked:
+                ranked.append(career_id)
+        return [json.loads(self._career_docs[career_id]) for career_id in ranked]
+
+    def _keyword_hits(self, term: str) -> Dict[int, float]:
+        if not term:
+            return {}
+        if term in self._keywords:
+            return {career_id: 1.0 for career_id in self._keywords[term]}
+        matches = self._keyword_index.search(term, CAREER_KEYWORD_THRESHOLD)
+        if not matches:
+            return {}
+        score, keyword = matches[0]
+        return {career_id: score for career_id in self._keywords[keyword]}
@@ -0,0 +1,102 @@
+"""Per-question statistics and adaptive quiz assembly.
+
+Every graded submission adds running sums to one `quiz_item_stats` document
+per question, so difficulty and discrimination can be recomputed at any time
+without rescanning `quiz_results`. Selection uses a two-parameter logistic
+(2PL) IRT model evaluated over the whole item bank with numpy.
+"""
+from typing import Iterable, List, Optional
+
+import numpy as np
+from pymongo import UpdateOne
+
+# Items need this many answers before their estimates are trusted
+MIN_ATTEMPTS = 5
+
+STAT_FIELDS = ("n", "correct", "sum_score", "sum_score_sq", "sum_correct_score")
+
+
+def item_id_for(quiz_id: str, index: int) -> str:
+    return f"{quiz_id}:{index}"
+
+
+def item_stat_updates(item_ids: List[str], subject: str, phase: int, correct_mask: int) -> List[UpdateOne]:
+    """Build $inc upserts that fold one graded submission into the item sums"""
+    total = len(item_ids)
+    if total == 0:
+        return []
+    score = correct_mask.bit_count() / total
+
+    updates = []
+    for idx, item_id in enumerate(item_ids):
+        correct = correct_mask >> idx & 1
+        quiz_id, _, index = item_id.rpartition(':')
+        updates.append(UpdateOne(
+            {"item_id": item_id},
+            {
+                "$inc": {
+                    "n": 1,
+                    "correct": correct,
+                    "sum_score": score,
+                    "sum_score_sq": score * score,
+                    "sum_correct_score": score * correct
+                },
+                "$setOnInsert": {"quiz_id": quiz_id, "index": int(index), "subject": subject, "phase": phase}
+            },
+            upsert=True
+        ))
+    return updates
+
+
+def item_parameters(n, correct, sum_score, sum_score_sq, sum_correct_score):
+    """Return (discrimination, difficulty) arrays from the running sums.
+
+    Difficulty is the logit of the smoothed failure rate. Discrimination is
+    the point-biserial correlation between the item and the total score,
+    mapped onto the 2PL slope scale.
+    """
+    n = np.asarray(n, dtype=np.float64)
+    correct = np.asarray(correct, dtype=np.float64)
+    safe_n = np.maximum(n, 1.0)
+
+    p_smoothed = (correct + 0.5) / (n + 1.0)
+    difficulty = np.log((1.0 - p_smoothed) / p_smoothed)
+
+    p = correct / safe_n
+    mean_score = np.asarray(sum_score, dtype=np.float64) / safe_n
+    var_score = np.asarray(sum_score_sq, dtype=np.float64) / safe_n - mean_score ** 2
+    covariance = np.asarray(sum_correct_score, dtype=np.float64) / safe_n - p * mean_score
+    denominator = np.sqrt(np.maximum(p * (1.0 - p) * var_score, 0.0))
+    r_pb = np.divide(covariance, denominator, out=np.zeros_like(covariance), where=denominator > 1e-9)
+    r_pb = np.clip(r_pb, -0.95, 0.95)
+    discrimination = np.clip(1.7 * r_pb / np.sqrt(1.0 - r_pb ** 2), 0.2, 3.0)
+
+    # Too few answers: neutral slope, keep the smoothed difficulty
+    discrimination = np.where(n >= MIN_ATTEMPTS, discrimination, 1.0)
+    return discrimination, difficulty
+
+
+def estimate_ability(score_fractions: Iterable[float]) -> float:
+    """Map recent quiz score fractions to an ability on the difficulty scale"""
+    scores = list(score_fractions)
+    if not scores:
+        return 0.0
+    p = (sum(scores) + 0.5) / (len(scores) + 1.0)
+    return float(np.log(p / (1.0 - p)))
+
+
+def select_items(theta: float, discrimination, difficulty, k: int,
+                 excluded: Optional[Iterable[bool]] = None) -> np.ndarray:
+    """Indices of the k items with the most Fisher information at theta"""
+    discrimination = np.asarray(discrimination, dtype=np.float64)
+    difficulty = np.asarray(difficulty, dtype=np.float64)
+    prob = 1.0 / (1.0 + np.exp(-discrimination * (theta - difficulty)))
+    information = discrimination ** 2 * prob * (1.0 - prob)
+    if excluded is not None:
+        information = np.where(np.asarray(excluded, dtype=bool), -np.inf, information)
+
+    k = min(k, int(np.isfinite(information).sum()))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-information, k - 1)[:k]
+    return top[np.argsort(-information[top])]
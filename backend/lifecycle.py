@@ -0,0 +1,51 @@
+"""Readiness and graceful draining for rolling restarts.
+
+A worker is ready once startup (indexes, migrations) has finished and
+stops being ready as soon as draining begins, either from a preStop hook
+calling POST /api/health/drain or from shutdown itself. Shutdown then
+waits up to SHUTDOWN_DRAIN_TIMEOUT seconds for LLM calls already in
+flight, so their answers are still saved before the Mongo client closes.
+"""
+import asyncio
+from contextlib import contextmanager
+
+from metrics import LLM_INFLIGHT
+
+
+class Lifecycle:
+    def __init__(self):
+        self.ready = False
+        self.draining = False
+        self._inflight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    @contextmanager
+    def track(self):
+        """Count a call as in flight until the block exits"""
+        self._inflight += 1
+        self._idle.clear()
+        LLM_INFLIGHT.set(self._inflight)
+        try:
+            yield
+        finally:
+            self._inflight -= 1
+            LLM_INFLIGHT.set(self._inflight)
+            if not self._inflight:
+                self._idle.set()
+
+    def begin_drain(self):
+        self.draining = True
+
+    async def drain(self, timeout: float) -> bool:
+        """Stop advertising readiness and wait for in-flight calls; False if some were still running"""
+        self.begin_drain()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
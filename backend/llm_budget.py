@@ -0,0 +1,167 @@
+"""Token accounting and budgets for LLM calls.
+
+Two limits apply per (user, route):
+
+* a token bucket of requests that refills continuously, stored as one
+  document updated with an aggregation-pipeline update so the refill and
+  the take happen atomically in Mongo;
+* a daily token budget, reserved up front with a conditional upsert
+  (a duplicate key on the upsert means the budget is spent) and corrected
+  with the actual usage once the response is back.
+
+Each route also has a daily token cap shared by all users.
+"""
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+
+class BudgetExceeded(Exception):
+    def __init__(self, scope: str, retry_after: int):
+        super().__init__(f"LLM budget exceeded ({scope})")
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+class RoutePolicy:
+    def __init__(self, user_daily_tokens: int, route_daily_tokens: int, burst: int, per_minute: float,
+                 expected_completion_tokens: int):
+        self.user_daily_tokens = user_daily_tokens
+        self.route_daily_tokens = route_daily_tokens
+        self.burst = burst
+        self.per_minute = per_minute
+        self.expected_completion_tokens = expected_completion_tokens
+
+
+DEFAULT_POLICIES = {
+    "tutor_chat": RoutePolicy(60_000, 20_000_000, burst=20, per_minute=6, expected_completion_tokens=600),
+    "create_learning_path": RoutePolicy(40_000, 5_000_000, burst=5, per_minute=1, expected_completion_tokens=2_500),
+    "generate_quiz": RoutePolicy(30_000, 5_000_000, burst=10, per_minute=3, expected_completion_tokens=900),
+    "analyze_career": RoutePolicy(15_000, 2_000_000, burst=5, per_minute=1, expected_completion_tokens=900),
+    "fetch_jobs": RoutePolicy(200_000, 1_000_000, burst=30, per_minute=10, expected_completion_tokens=1_200),
+}
+
+
+def load_policies(environ=os.environ) -> Dict[str, RoutePolicy]:
+    """Defaults, overridden per route by LLM_BUDGETS='{"tutor_chat": {"user_daily_tokens": 1000}}'"""
+    policies = dict(DEFAULT_POLICIES)
+    overrides = json.loads(environ.get('LLM_BUDGETS') or '{}')
+    for route, fields in overrides.items():
+        base = policies.get(route, DEFAULT_POLICIES["tutor_chat"])
+        policies[route] = RoutePolicy(**{**vars(base), **fields})
+    return policies
+
+
+_encoder = None
+
+
+def estimate_tokens(text: str) -> int:
+    """Token count from tiktoken when LLM_TOKENIZER=tiktoken, else ~4 characters per token"""
+    global _encoder
+    if _encoder is None:
+        _encoder = False
+        if os.environ.get('LLM_TOKENIZER') == 'tiktoken':
+            try:
+                import tiktoken
+                _encoder = tiktoken.get_encoding('o200k_base')
+            except Exception:
+                _encoder = False
+    if _encoder:
+        return len(_encoder.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+class TokenBudgetGovernor:
+    def __init__(self, policies: Optional[Dict[str, RoutePolicy]] = None, enabled: bool = True):
+        self.policies = policies or load_policies()
+        self.enabled = enabled
+
+    def policy(self, route: str) -> RoutePolicy:
+        return self.policies.get(route, self.policies["tutor_chat"])
+
+    async def acquire(self, db, user_id: str, route: str, prompt_tokens: int) -> int:
+        """Take a rate-limit token and reserve budget; returns the reserved token count"""
+        if not self.enabled:
+            return 0
+        policy = self.policy(route)
+        await self._take_bucket_token(db, f"{route}:{user_id}", policy)
+
+        reserved = prompt_tokens + policy.expected_completion_tokens
+        now = datetime.now(timezone.utc)
+        day = now.strftime('%Y-%m-%d')
+        retry_after = int((datetime(now.year, now.month, now.day, tzinfo=timezone.utc) + timedelta(days=1) - now).total_seconds())
+
+        user_key = f"{day}:{route}:{user_id}"
+        if not await self._reserve(db, user_key, policy.user_daily_tokens, reserved, now):
+            raise BudgetExceeded("user", retry_after)
+        if not await self._reserve(db, f"{day}:{route}:*", policy.route_daily_tokens, reserved, now):
+            await db.llm_usage.update_one({"_id": user_key}, {"$inc": {"tokens": -reserved}})
+            raise BudgetExceeded("route", retry_after)
+        return reserved
+
+    async def record(self, db, user_id: str, route: str, reserved: int, actual_tokens: int):
+        """Replace the up-front reservation with what the call actually used"""
+        if not self.enabled or not reserved:
+            return
+        day = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+        delta = actual_tokens - reserved
+        if delta:
+            await db.llm_usage.update_one({"_id": f"{day}:{route}:{user_id}"}, {"$inc": {"tokens": delta}})
+            await db.llm_usage.update_one({"_id": f"{day}:{route}:*"}, {"$inc": {"tokens": delta}})
+
+    async def usage(self, db, user_id: str) -> Dict[str, Dict[str, int]]:
+        day = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+        docs = await db.llm_usage.find({"_id": {"$in": [f"{day}:{route}:{user_id}" for route in self.policies]}}).to_list(None)
+        used = {doc['_id'].split(':')[1]: doc.get('tokens', 0) for doc in docs}
+        return {
+            route: {"used": max(0, used.get(route, 0)), "limit": policy.user_daily_tokens}
+            for route, policy in self.policies.items()
+        }
+
+    async def _reserve(self, db, key: str, limit: int, tokens: int, now: datetime) -> bool:
+        # Matches only while there is room; an existing over-budget doc makes the upsert collide
+        if tokens > limit:
+            return False
+        try:
+            await db.llm_usage.update_one(
+                {"_id": key, "tokens": {"$lte": limit - tokens}},
+                {"$inc": {"tokens": tokens}, "$setOnInsert": {"expires_at": now + timedelta(days=2)}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def _take_bucket_token(self, db, key: str, policy: RoutePolicy):
+        now = datetime.now(timezone.utc)
+        rate = policy.per_minute / 60.0
+        bucket = await db.llm_rate_buckets.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {
+                    "tokens": {"$min": [
+                        policy.burst,
+                        {"$add": [
+                            {"$ifNull": ["$tokens", policy.burst]},
+                            {"$multiply": [
+                                {"$divide": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, 1000]},
+                                rate
+                            ]}
+                        ]}
+                    ]},
+                    "updated_at": now,
+                    "expires_at": now + timedelta(days=1)
+                }},
+                {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+                {"$set": {"tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]}}}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        if not bucket.get('allowed'):
+            missing = 1 - bucket.get('tokens', 0)
+            raise BudgetExceeded("rate", max(1, int(missing / rate) + 1) if rate else 60)
@@ -0,0 +1,741 @@
+"""Local solver for the calculations students send to the tutor.
+
+Arithmetic, percentages, unit conversions and linear equations in one
+variable are parsed with `ast` and computed exactly with Fractions in the
+request, in microseconds. Other algebra (quadratics and higher, systems,
+derivatives, integrals, factor/expand/simplify) goes to SymPy in a process
+pool when the `sympy` package is installed. Each symbolic solve is
+stopped after MATH_SOLVER_CPU_LIMIT seconds of CPU time by a profiling
+timer in the worker; one stuck in a single C call, which the timer
+cannot interrupt, is killed by RLIMIT_CPU a second later. Workers are
+also capped at MATH_SOLVER_MEMORY_LIMIT of address space. A wall-clock
+backstop terminates the pool's processes if a worker stops responding.
+Powers nested inside powers (9^9^9) are refused before reaching SymPy.
+
+Only expressions built from digits, operators and a short list of
+variable and function names are accepted. That list is checked before
+SymPy parses anything, so a question can never reach eval with arbitrary
+names.
+
+Only standalone questions are solved: the message has to open with a
+verb such as "solve", "what is" or "factor", or end with a question mark,
+and the tutor must not be waiting on an answer to an exercise it set
+(its reply ended by asking for a calculation, as in "What is 3 × 4?").
+Messages that only state a value ("x = 5") are answers, not problems, and
+are left to the LLM to mark.
+
+With MATH_SOLVER=auto, bare calculations ("what is 15% of 240",
+"convert 5 km to miles") are answered without the LLM. Equations,
+symbolic problems, questions that ask for an explanation and results
+too long to read at a glance still go to the LLM, with the verified
+result included as grounding. A lone "9/11", "24/7" or "2020-2021" is
+as often a date, an idiom or a range as a sum, so it only counts as a
+calculation with a cue: "calculate", a trailing "=", or spaces around
+the operator.
+
+Configuration:
+    MATH_SOLVER               auto, ground (never answer directly) or off (default auto)
+    MATH_SOLVER_CPU_LIMIT     CPU seconds per symbolic solve (default 2)
+    MATH_SOLVER_WORKERS       processes for symbolic solves (default 1)
+    MATH_SOLVER_MEMORY_LIMIT  address space per solver process in MiB (default 1024, 0 for no limit)
+"""
+import ast
+import asyncio
+import importlib.util
+import logging
+import math
+import multiprocessing
+import operator
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from fractions import Fraction
+from typing import Dict, Optional, Tuple, Union
+
+from metrics import MATH_SOLVE_LATENCY, MATH_SOLVES
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; the wall-clock backstop still applies there
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+MAX_QUESTION_LENGTH = 200
+MAX_EXPONENT = 1000
+MAX_RESULT_BITS = 20_000
+# Longer numbers are handed to the LLM to present rather than sent as the whole reply
+MAX_DIRECT_DIGITS = 24
+# Backstop on top of the CPU limit, covering a worker's first SymPy import
+WALL_ALLOWANCE = 5.0
+
+Number = Union[Fraction, float]
+
+VARIABLES = frozenset('abcmnpqrtuvwxyz')
+FUNCTIONS = {
+    'sqrt': math.sqrt, 'sin': math.sin, 'cos': math.cos, 'tan': math.tan, 'log': math.log10, 'ln': math.log,
+    'exp': math.exp, 'abs': abs, 'factorial': math.factorial,
+}
+CONSTANTS = {'pi': math.pi, 'e': math.e}
+TRIGONOMETRY = frozenset({'sin', 'cos', 'tan'})
+SYMBOLIC_OPERATIONS = {
+    'derivative': 'derivative', 'differentiate': 'derivative', 'integrate': 'integral', 'integral': 'integral',
+    'factor': 'factor', 'factorise': 'factor', 'factorize': 'factor', 'expand': 'expand', 'simplify': 'simplify',
+}
+
+_LEAD_IN = re.compile(
+    r"^(?:(?:please|can you|could you|help me|pls)\s+)*(?:explain\s+)?"
+    r"(?:(?:how\s+(?:do|can|would|to)\s+(?:i\s+|you\s+|we\s+)?)?"
+    r"(?:solve|calculate|compute|evaluate|find|work\s+out|convert)|what\s+is|what's|whats|how\s+much\s+is)"
+    r"\s*(?:the\s+value\s+of\s+)?[:,]?\s*"
+)
+_TRAILER = re.compile(r"[\s,]*(?:step[\s-]+by[\s-]+step|with\s+steps|and\s+explain(?:\s+it|\s+why)?|please)\s*$")
+_CALCULATE = re.compile(r"\b(?:solve|calculate|compute|evaluate|work\s+out)\b")
+_BARE_PAIR = re.compile(r"^\d+[/-]\d+$")
+_EXPLAIN = re.compile(r"\b(?:explain|why|how\s+(?:do|does|can|would|to)|steps?|show|working|teach|understand)\b")
+_FOR_VARIABLE = re.compile(r"\s+for\s+([a-z])$")
+_SYMBOLIC = re.compile(
+    r"^(?:the\s+)?(derivative|differentiate|integrate|integral|factor|factorise|factorize|expand|simplify)"
+    r"(?:\s+of)?\s+(.+?)(?:\s+(?:with\s+respect\s+to|wrt|d)\s*([a-z]))?$"
+)
+# A unit is one word, or two as in "degrees c"
+_UNIT = r"([a-z°/]+(?:\s(?!(?:are|there|in|into|to)\b)[a-z]+)?)"
+_CONVERSION = re.compile(rf"^(-?\d+(?:\.\d+)?)\s*{_UNIT}\s+(?:to|in|into|in\s+to)\s+{_UNIT}$")
+_HOW_MANY = re.compile(rf"^how\s+many\s+{_UNIT}\s+(?:are\s+)?(?:there\s+)?in\s+(-?\d+(?:\.\d+)?)\s*{_UNIT}$")
+_ALLOWED_CHARS = re.compile(r"^[0-9a-z+\-*/%().,=!\s]+$")
+
+_SYMBOL_REPLACEMENTS = (
+    ('×', '*'), ('÷', '/'), ('−', '-'), ('–', '-'), ('²', '^2'), ('³', '^3'), ('√', 'sqrt'), ('π', 'pi'),
+)
+_WORD_REPLACEMENTS = (
+    (re.compile(r"\bsquare\s+root\s+of\b"), 'sqrt'),
+    (re.compile(r"\bsqrt\s+(\d+(?:\.\d+)?)"), r'sqrt(\1)'),
+    (re.compile(r"\bto\s+the\s+power\s+of\b"), '^'),
+    (re.compile(r"\bmultiplied\s+by\b"), '*'),
+    (re.compile(r"\bdivided\s+by\b"), '/'),
+    (re.compile(r"\bplus\b"), '+'),
+    (re.compile(r"\bminus\b"), '-'),
+    (re.compile(r"\btimes\b"), '*'),
+    (re.compile(r"\bsquared\b"), '^2'),
+    (re.compile(r"\bcubed\b"), '^3'),
+)
+_THOUSANDS = re.compile(r"(?<=\d),(?=\d{3}\b)")
+_PERCENT_OF = re.compile(r"(\d+(?:\.\d+)?)\s*%\s*of\s*")
+_PERCENT = re.compile(r"(\d+(?:\.\d+)?)\s*%")
+_MOD = re.compile(r"\bmod(?:ulo)?\b")
+_FACTORIAL = re.compile(r"(\d+|\))\s*!")
+_TIMES_X = re.compile(r"(?<=\d)\s*x\s*(?=\d)")
+_IMPLICIT = (
+    (re.compile(r"(?<=[\d)])\s*(?=[a-z(])"), '*'),
+    (re.compile(r"(?<![a-z])([a-z])\s*(?=\()"), r'\1*'),
+    (re.compile(r"(?<=\))\s*(?=\d)"), '*'),
+)
+_WORD = re.compile(r"[a-z]+")
+_TRIG_CALL = re.compile(r"\b(?:sin|cos|tan)\(")
+_LAST_SENTENCE = re.compile(r"(?<=[.!?:])\s+|\n+")
+_OPERATION = re.compile(r"[\d)a-z]\s*[-+*/×÷^=]\s*[\d(]")
+_MARKDOWN = re.compile(r"[*_`>]")
+# "Next, what is 15% of 80?" asks for the part after the comma
+_CLAUSE = re.compile(r"[,;]\s+")
+_ASKS_VALUE = re.compile(r"\b(?:what|find|solve\s+for)\b.*(?:\b[xyzn]\b|\banswer\b|\bresult\b|\bdo\s+you\s+get\b)")
+
+
+class SolveTimeout(Exception):
+    pass
+
+
+class Problem:
+    __slots__ = ('kind', 'expression', 'variable', 'operation', 'units', 'explain', 'text')
+
+    def __init__(self, kind: str, expression: str = '', variable: Optional[str] = None,
+                 operation: Optional[str] = None, units: Optional[Tuple[Fraction, str, str]] = None,
+                 explain: bool = False, text: str = ''):
+        # arithmetic, conversion, equation or symbolic
+        self.kind = kind
+        self.expression = expression
+        # The problem as the student wrote it, for the answer
+        self.text = text or expression
+        self.variable = variable
+        self.operation = operation
+        self.units = units
+        self.explain = explain
+
+
+class Solution:
+    __slots__ = ('kind', 'statement', 'direct')
+
+    def __init__(self, kind: str, statement: str, direct: bool):
+        self.kind = kind
+        # e.g. "15% of 240 = 36", "5 km = 3.106855961 mi", "x = 2"
+        self.statement = statement
+        # True when the statement is the whole answer and the LLM can be skipped
+        self.direct = direct
+
+    def grounded(self, message: str) -> str:
+        """The student's message with the verified result attached for the LLM"""
+        return (f"{message}\n\n[Verified by the math engine: {self.statement}. "
+                f"Use exactly this result and explain how to get there.]")
+
+
+# ========== UNITS ==========
+
+def _units() -> Dict[str, Tuple[str, Fraction, str]]:
+    """alias -> (dimension, factor to the base unit, symbol)"""
+    table = {
+        'length': [('mm', '0.001', 'millimeter millimetre'), ('cm', '0.01', 'centimeter centimetre'),
+                   ('m', '1', 'meter metre'), ('km', '1000', 'kilometer kilometre'),
+                   ('in', '0.0254', 'inch inches'), ('ft', '0.3048', 'foot feet'), ('yd', '0.9144', 'yard'),
+                   ('mi', '1609.344', 'mile')],
+        'mass': [('mg', '0.000001', 'milligram'), ('g', '0.001', 'gram gm'), ('kg', '1', 'kilogram kilo kgs'),
+                 ('t', '1000', 'tonne ton'), ('oz', '0.028349523125', 'ounce'), ('lb', '0.45359237', 'pound lbs')],
+        'time': [('ms', '0.001', 'millisecond'), ('s', '1', 'second sec'), ('min', '60', 'minute mins'),
+                 ('h', '3600', 'hour hr hrs'), ('day', '86400', 'days'), ('week', '604800', 'weeks wk'),
+                 ('year', '31557600', 'years yr')],
+        'volume': [('ml', '0.001', 'milliliter millilitre'), ('l', '1', 'liter litre'),
+                   ('gal', '3.785411784', 'gallon')],
+        'speed': [('m/s', '1', 'mps'), ('km/h', '5/18', 'kmph kph kmh'),
+                  ('mph', '0.44704', 'miles/hour')],
+        'data': [('B', '1', 'byte'), ('KB', '1000', 'kilobyte kb'), ('MB', '1000000', 'megabyte mb'),
+                 ('GB', '1000000000', 'gigabyte gb'), ('TB', '1000000000000', 'terabyte tb')],
+    }
+    units = {}
+    for dimension, entries in table.items():
+        for symbol, factor, names in entries:
+            factor = Fraction(factor)
+            for alias in [symbol.lower(), *names.split()]:
+                units[alias] = (dimension, factor, symbol)
+                if alias[-1].isalpha() and len(alias) > 3:
+                    units[alias + 's'] = (dimension, factor, symbol)
+    for symbol, names in (('°C', 'c celsius centigrade'), ('°F', 'f fahrenheit'), ('K', 'k kelvin kelvins')):
+        for alias in names.split():
+            units[alias] = ('temperature', Fraction(1), symbol)
+            units[f"°{alias}"] = units[f"degrees {alias}"] = units[f"degree {alias}"] = units[alias]
+    return units
+
+
+UNITS = _units()
+
+
+def _to_kelvin(value: Fraction, symbol: str) -> Fraction:
+    if symbol == '°C':
+        return value + Fraction('273.15')
+    if symbol == '°F':
+        return (value - 32) * Fraction(5, 9) + Fraction('273.15')
+    return value
+
+
+def _from_kelvin(value: Fraction, symbol: str) -> Fraction:
+    if symbol == '°C':
+        return value - Fraction('273.15')
+    if symbol == '°F':
+        return (value - Fraction('273.15')) * Fraction(9, 5) + 32
+    return value
+
+
+def convert(value: Fraction, source: str, target: str) -> Optional[Tuple[Fraction, str, str]]:
+    """(converted value, source symbol, target symbol), or None for unknown or mismatched units"""
+    source, target = UNITS.get(source.strip()), UNITS.get(target.strip())
+    if source is None or target is None or source[0] != target[0]:
+        return None
+    if source[0] == 'temperature':
+        return _from_kelvin(_to_kelvin(value, source[2]), target[2]), source[2], target[2]
+    return value * source[1] / target[1], source[2], target[2]
+
+
+# ========== EXACT ARITHMETIC ==========
+
+def format_number(value: Number) -> str:
+    if isinstance(value, Fraction):
+        if value.denominator == 1:
+            return str(value.numerator)
+        decimal = f"{float(value):.10g}"
+        if value.denominator <= 1000 and Fraction(decimal) != value:
+            return f"{value} ≈ {decimal}"
+        return decimal
+    if abs(value) < 1e-12:
+        return "0"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return f"{value:.10g}"
+
+
+_BINARY = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod,
+}
+
+
+def _power(base: Number, exponent: Number) -> Number:
+    if isinstance(exponent, Fraction) and exponent.denominator == 1:
+        if abs(exponent) > MAX_EXPONENT:
+            raise ValueError("exponent too large")
+        if isinstance(base, Fraction):
+            bits = max(base.numerator.bit_length(), base.denominator.bit_length())
+            if bits * abs(exponent.numerator) > MAX_RESULT_BITS:
+                raise ValueError("result too large")
+            if base == 0 and exponent < 0:
+                raise ZeroDivisionError
+            return base ** exponent.numerator
+    result = float(base) ** float(exponent)
+    if isinstance(result, complex):
+        raise ValueError("complex result")
+    return result
+
+
+def evaluate(node: ast.AST, variables: Optional[Dict[str, Number]] = None, degrees: bool = False) -> Number:
+    """Exact value of a parsed arithmetic expression; raises ValueError for anything else
+
+    degrees: read the arguments of sin, cos and tan as degrees instead of radians.
+    """
+    if isinstance(node, ast.Expression):
+        return evaluate(node.body, variables, degrees)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return Fraction(str(node.value))
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+        value = evaluate(node.operand, variables, degrees)
+        return -value if isinstance(node.op, ast.USub) else value
+    if isinstance(node, ast.BinOp):
+        left, right = evaluate(node.left, variables, degrees), evaluate(node.right, variables, degrees)
+        if isinstance(node.op, ast.Pow):
+            return _power(left, right)
+        if type(node.op) in _BINARY:
+            return _BINARY[type(node.op)](left, right)
+    if isinstance(node, ast.Name):
+        if variables and node.id in variables:
+            return variables[node.id]
+        if node.id in CONSTANTS:
+            return CONSTANTS[node.id]
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS \
+            and len(node.args) == 1 and not node.keywords:
+        argument = evaluate(node.args[0], variables, degrees)
+        if node.func.id == 'factorial':
+            if not (isinstance(argument, Fraction) and argument.denominator == 1 and 0 <= argument <= MAX_EXPONENT):
+                raise ValueError("factorial needs a whole number up to 1000")
+            return Fraction(math.factorial(argument.numerator))
+        if node.func.id == 'abs':
+            return abs(argument)
+        if node.func.id == 'sqrt' and isinstance(argument, Fraction) and argument >= 0:
+            root = Fraction(math.isqrt(argument.numerator), math.isqrt(argument.denominator))
+            if root * root == argument:
+                return root
+        if degrees and node.func.id in TRIGONOMETRY:
+            return FUNCTIONS[node.func.id](math.radians(float(argument)))
+        return FUNCTIONS[node.func.id](float(argument))
+    raise ValueError(f"unsupported expression: {ast.dump(node)[:60]}")
+
+
+class Linear:
+    """a * variable + b with exact coefficients, for one-variable linear equations"""
+    __slots__ = ('a', 'b')
+
+    def __init__(self, a: Fraction, b: Fraction):
+        self.a, self.b = a, b
+
+
+def _linear(node: ast.AST, variable: str) -> Linear:
+    if isinstance(node, ast.Name) and node.id == variable:
+        return Linear(Fraction(1), Fraction(0))
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+        value = _linear(node.operand, variable)
+        return Linear(-value.a, -value.b) if isinstance(node.op, ast.USub) else value
+    if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Add, ast.Sub, ast.Mult, ast.Div)):
+        left, right = _linear(node.left, variable), _linear(node.right, variable)
+        if isinstance(node.op, ast.Add):
+            return Linear(left.a + right.a, left.b + right.b)
+        if isinstance(node.op, ast.Sub):
+            return Linear(left.a - right.a, left.b - right.b)
+        if isinstance(node.op, ast.Mult):
+            if left.a and right.a:
+                raise ValueError("not linear")
+            return Linear(left.a * right.b + right.a * left.b, left.b * right.b)
+        if right.a or not right.b:
+            raise ValueError("not linear")
+        return Linear(left.a / right.b, left.b / right.b)
+    value = evaluate(node)
+    if not isinstance(value, Fraction):
+        raise ValueError("inexact coefficient")
+    return Linear(Fraction(0), value)
+
+
+def solve_linear(left: str, right: str, variable: str) -> Optional[str]:
+    try:
+        lhs = _linear(ast.parse(left.strip(), mode='eval').body, variable)
+        rhs = _linear(ast.parse(right.strip(), mode='eval').body, variable)
+    except (SyntaxError, ValueError, ZeroDivisionError, OverflowError):
+        return None
+    a, b = lhs.a - rhs.a, rhs.b - lhs.b
+    if a == 0:
+        return "every value of " + variable + " is a solution" if b == 0 else "there is no solution"
+    return f"{variable} = {format_number(b / a)}"
+
+
+# ========== PARSING ==========
+
+def _split_product(match: re.Match) -> str:
+    # "xy" is x*y, but function and constant names stay whole
+    word = match.group()
+    if word in FUNCTIONS or word in CONSTANTS or len(word) > 3 or not set(word) <= VARIABLES:
+        return word
+    return '*'.join(word)
+
+
+def normalize_expression(text: str, variables: bool) -> str:
+    for symbol, replacement in _SYMBOL_REPLACEMENTS:
+        text = text.replace(symbol, replacement)
+    for pattern, replacement in _WORD_REPLACEMENTS:
+        text = pattern.sub(replacement, text)
+    text = _THOUSANDS.sub('', text)
+    text = _PERCENT_OF.sub(r'(\1/100)*', text)
+    text = _PERCENT.sub(r'(\1/100)', text)
+    text = _MOD.sub('%', text)
+    if not variables:
+        text = _TIMES_X.sub('*', text)
+    text = text.replace('^', '**')
+    for pattern, replacement in _IMPLICIT:
+        text = pattern.sub(replacement, text)
+    if variables:
+        text = _WORD.sub(_split_product, text)
+    text = _FACTORIAL.sub(r'factorial(\1)', text)
+    return ' '.join(text.split())
+
+
+def _small_powers(node: ast.AST) -> bool:
+    """No power inside another power's base or exponent, and constant exponents up to MAX_EXPONENT
+
+    SymPy works out 9^9^9 as one huge integer power inside a single C call,
+    which neither the CPU timer nor anything else short of killing the
+    worker can stop, so such towers never reach it.
+    """
+    for power in ast.walk(node):
+        if not (isinstance(power, ast.BinOp) and isinstance(power.op, ast.Pow)):
+            continue
+        if any(isinstance(inner, ast.BinOp) and isinstance(inner.op, ast.Pow)
+               for side in (power.left, power.right) for inner in ast.walk(side)):
+            return False
+        if not any(isinstance(name, ast.Name) and name.id in VARIABLES for name in ast.walk(power.right)):
+            try:
+                exponent = evaluate(power.right)
+            except (ValueError, ZeroDivisionError, OverflowError, TypeError):
+                return False
+            if abs(exponent) > MAX_EXPONENT:
+                return False
+    return True
+
+
+def allowed(expression: str) -> bool:
+    """Only digits, operators, single-letter variables and known functions, with small, unnested powers"""
+    if not expression or len(expression) > MAX_QUESTION_LENGTH or not _ALLOWED_CHARS.match(expression):
+        return False
+    names = re.findall(r'[a-z]+', expression)
+    if any(name not in FUNCTIONS and name not in CONSTANTS and name not in VARIABLES for name in names):
+        return False
+    if expression.count('**') > 3:
+        return False
+    for part in re.split(r'[=,]', expression):
+        try:
+            if not _small_powers(ast.parse(part.strip(), mode='eval')):
+                return False
+        except SyntaxError:
+            return False
+    return True
+
+
+def _states_values(expression: str) -> bool:
+    """True for "x = 5" or "x = 1, y = 2": a student giving an answer rather than asking"""
+    for part in expression.split(','):
+        sides = [side.strip() for side in part.split('=')]
+        if len(sides) != 2:
+            return False
+        for name, value in (sides, sides[::-1]):
+            if name in VARIABLES:
+                try:
+                    evaluate(ast.parse(value, mode='eval'))
+                    break
+                except (SyntaxError, ValueError, ZeroDivisionError, OverflowError, TypeError):
+                    pass
+        else:
+            return False
+    return True
+
+
+def parse_question(message: str) -> Optional[Problem]:
+    """Recognize a calculation, conversion, equation or symbolic problem in a tutor message"""
+    asked = message.rstrip().endswith('?')
+    text = ' '.join(message.casefold().split()).rstrip('?. ')
+    if text.endswith('!') and not re.search(r'[\d)]\s*!$', text):
+        text = text.rstrip('! ')
+    if not text or len(text) > MAX_QUESTION_LENGTH:
+        return None
+    explain = bool(_EXPLAIN.search(text))
+    lead_in = _LEAD_IN.match(text)
+    body = _TRAILER.sub('', text[lead_in.end():] if lead_in else text).strip()
+
+    symbolic = _SYMBOLIC.match(body)
+    # "factor ...", "how many ..." and a trailing "=" ask for something on their own
+    if not (asked or lead_in or symbolic or body.startswith('how many ') or body.endswith('=')):
+        return None
+
+    conversion = _CONVERSION.match(body)
+    if conversion:
+        value, source, target = conversion.groups()
+        return Problem('conversion', units=(Fraction(value), source, target), explain=explain)
+    how_many = _HOW_MANY.match(body)
+    if how_many:
+        target, value, source = how_many.groups()
+        return Problem('conversion', units=(Fraction(value), source, target), explain=explain)
+
+    if symbolic:
+        operation, expression, variable = symbolic.groups()
+        expression = normalize_expression(expression, variables=True)
+        if not allowed(expression) or '=' in expression:
+            return None
+        return Problem('symbolic', expression, variable, SYMBOLIC_OPERATIONS[operation], explain=explain)
+
+    equals = body.endswith('=')
+    body = re.sub(r"\s*=\s*\??$", '', body)
+    if '=' in body:
+        variable = _FOR_VARIABLE.search(body)
+        if variable:
+            body = body[:variable.start()]
+        expression = normalize_expression(body, variables=True)
+        names = {name for name in re.findall(r'[a-z]+', expression) if name in VARIABLES}
+        if not allowed(expression) or not names or _states_values(expression):
+            return None
+        chosen = variable.group(1) if variable else ('x' if 'x' in names else min(names))
+        return Problem('equation', expression, chosen, explain=explain)
+
+    if _BARE_PAIR.match(body) and not (equals or (lead_in and _CALCULATE.search(lead_in.group()))):
+        return None
+    expression = normalize_expression(body, variables=False)
+    if not allowed(expression) or not re.search(r'[-+*/%]|\b(?:' + '|'.join(FUNCTIONS) + r')\(', expression.lstrip('-')):
+        return None
+    if any(name in VARIABLES for name in re.findall(r'[a-z]+', expression)):
+        return None
+    return Problem('arithmetic', expression, explain=explain, text=body)
+
+
+def poses_exercise(reply: str) -> bool:
+    """True when a tutor reply ends by asking for a calculation, not just a guiding question"""
+    last = _MARKDOWN.sub('', _LAST_SENTENCE.split((reply or '').strip())[-1]).strip().casefold()
+    if not last.endswith('?'):
+        return False
+    if _OPERATION.search(last) or parse_question(_CLAUSE.split(last)[-1]) is not None:
+        return True
+    # "Solve 2x + 3 = 7. What is x?"
+    return bool(_ASKS_VALUE.search(last)) and bool(_OPERATION.search(reply.casefold()))
+
+
+def solve_locally(problem: Problem) -> Optional[str]:
+    """Statement for problems that need no SymPy, or None"""
+    if problem.kind == 'conversion':
+        value, source, target = problem.units
+        converted = convert(value, source, target)
+        if converted is None:
+            return None
+        result, source_symbol, target_symbol = converted
+        return f"{format_number(value)} {source_symbol} = {format_number(result)} {target_symbol}"
+    if problem.kind == 'arithmetic':
+        try:
+            tree = ast.parse(problem.expression, mode='eval')
+            value = evaluate(tree)
+            # "sin(30)" almost always means degrees; state the unit rather than guess silently
+            in_degrees = evaluate(tree, degrees=True) if _TRIG_CALL.search(problem.expression) else None
+        except (SyntaxError, ValueError, ZeroDivisionError, OverflowError, TypeError):
+            return None
+        if in_degrees is not None:
+            if 'pi' in problem.expression:
+                return f"{problem.text} = {format_number(value)} with the angle in radians"
+            return (f"{problem.text} = {format_number(in_degrees)} with the angle in degrees, "
+                    f"or {format_number(value)} in radians")
+        result = format_number(value)
+        if result.startswith(f"{problem.text} ≈ "):
+            return result
+        return f"{problem.text} = {result}"
+    if problem.kind == 'equation' and problem.expression.count('=') == 1:
+        left, right = problem.expression.split('=')
+        others = {name for name in re.findall(r'[a-z]+', problem.expression) if name in VARIABLES} - {problem.variable}
+        if not others:
+            return solve_linear(left, right, problem.variable)
+    return None
+
+
+# ========== SYMBOLIC (worker process) ==========
+
+def _raise_timeout(signum, frame):
+    raise SolveTimeout()
+
+
+def limit_worker(memory_limit: int):
+    """Pool initializer: cap the worker's address space so a runaway result raises MemoryError"""
+    if resource is None or memory_limit <= 0:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        memory_limit = min(memory_limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (memory_limit, hard))
+
+
+def solve_symbolic(kind: str, expression: str, variable: Optional[str], operation: Optional[str],
+                   cpu_limit: float) -> Optional[str]:
+    """Runs in a pool worker: SymPy solve stopped after cpu_limit seconds of CPU time
+
+    The profiling timer only fires between bytecodes. A second later
+    RLIMIT_CPU's SIGXCPU ends the worker even inside a long C call.
+    """
+    import signal
+
+    limits = None
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        limits = resource.getrlimit(resource.RLIMIT_CPU)
+        ceiling = math.ceil(usage.ru_utime + usage.ru_stime + cpu_limit) + 1
+        if limits[1] != resource.RLIM_INFINITY:
+            ceiling = min(ceiling, limits[1])
+        resource.setrlimit(resource.RLIMIT_CPU, (ceiling, limits[1]))
+    signal.signal(signal.SIGPROF, _raise_timeout)
+    signal.setitimer(signal.ITIMER_PROF, cpu_limit)
+    try:
+        return _sympy_statement(kind, expression, variable, operation)
+    finally:
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        if limits is not None:
+            resource.setrlimit(resource.RLIMIT_CPU, limits)
+
+
+def _sympy_statement(kind, expression, variable, operation):
+    import sympy
+    from sympy.parsing.sympy_parser import parse_expr, standard_transformations
+
+    names = {name: sympy.Symbol(name) for name in VARIABLES}
+    names.update({'ln': sympy.log, 'log': lambda value: sympy.log(value, 10), 'e': sympy.E, 'pi': sympy.pi,
+                  'sqrt': sympy.sqrt, 'sin': sympy.sin, 'cos': sympy.cos, 'tan': sympy.tan, 'exp': sympy.exp,
+                  'abs': sympy.Abs, 'factorial': sympy.factorial})
+
+    def parse(text):
+        # Safe only because allowed() has already limited the text to these names
+        return parse_expr(text, local_dict=names, transformations=standard_transformations)
+
+    if kind == 'equation':
+        sides = expression.split(',')
+        equations = [sympy.Eq(*(parse(part.strip()) for part in side.split('='))) for side in sides]
+        unknowns = sorted(set().union(*(equation.free_symbols for equation in equations)), key=str)
+        if len(equations) == 1 and variable:
+            roots = sympy.solve(equations[0], names[variable])
+            if not roots:
+                return "there is no solution"
+            # Roots without a closed form come back as CRootOf; a decimal is more use to a student
+            return ', '.join(f"{variable} = {sympy.sstr(root.evalf(10) if root.has(sympy.CRootOf) else root)}"
+                             for root in roots)
+        solutions = sympy.solve(equations, unknowns, dict=True)
+        if not solutions:
+            return "there is no solution"
+        return '; '.join(', '.join(f"{symbol} = {sympy.sstr(value)}" for symbol, value in solution.items())
+                         for solution in solutions)
+
+    expr = parse(expression)
+    symbol = names[variable] if variable else (sorted(expr.free_symbols, key=str) or [names['x']])[0]
+    if operation == 'derivative':
+        result = sympy.diff(expr, symbol)
+        return f"d/d{symbol} ({sympy.sstr(expr)}) = {sympy.sstr(sympy.simplify(result))}"
+    if operation == 'integral':
+        result = sympy.integrate(expr, symbol)
+        if result.has(sympy.Integral):
+            return None
+        return f"∫ {sympy.sstr(expr)} d{symbol} = {sympy.sstr(result)} + C"
+    transform = {'factor': sympy.factor, 'expand': sympy.expand, 'simplify': sympy.simplify}[operation]
+    return f"{operation}({sympy.sstr(expr)}) = {sympy.sstr(transform(expr))}"
+
+
+# ========== SOLVER ==========
+
+class MathSolver:
+    def __init__(self, mode: Optional[str] = None, cpu_limit: Optional[float] = None,
+                 workers: Optional[int] = None):
+        self.mode = (mode or os.environ.get('MATH_SOLVER', 'auto')).lower()
+        if self.mode not in ('auto', 'ground', 'off'):
+            raise ValueError(f"MATH_SOLVER must be auto, ground or off, not {self.mode}")
+        self.cpu_limit = cpu_limit or float(os.environ.get('MATH_SOLVER_CPU_LIMIT', '2'))
+        self.workers = workers or int(os.environ.get('MATH_SOLVER_WORKERS', '1'))
+        self.memory_limit = int(os.environ.get('MATH_SOLVER_MEMORY_LIMIT', '1024')) * 1024 * 1024
+        self.symbolic = importlib.util.find_spec('sympy') is not None
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != 'off'
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a process that runs an event loop and driver threads is unsafe
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                             initializer=limit_worker, initargs=(self.memory_limit,))
+        return self._pool
+
+    def _reset_pool(self):
+        if self._pool is not None:
+            # shutdown() leaves a running solve to finish; one stuck in a C call would keep its CPU and memory
+            workers = list((self._pool._processes or {}).values())
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            for process in workers:
+                process.terminate()
+            self._pool = None
+
+    async def _solve_symbolic(self, problem: Problem) -> Optional[str]:
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor(), solve_symbolic, problem.kind, problem.expression,
+                                      problem.variable, problem.operation, self.cpu_limit)
+        try:
+            return await asyncio.wait_for(future, self.cpu_limit + WALL_ALLOWANCE)
+        except asyncio.TimeoutError:
+            # A worker stuck inside one long C call never sees its CPU timer; give up on it
+            self._reset_pool()
+            raise SolveTimeout()
+        except BrokenProcessPool:
+            # Most often the CPU rlimit ending a worker stuck in one long C call
+            self._reset_pool()
+            raise SolveTimeout()
+
+    async def solve(self, message: Optional[str], awaiting_answer: bool = False) -> Optional[Solution]:
+        """Verified result for a math question, or None when it is not one this solver handles
+
+        awaiting_answer: the tutor's last turn set an exercise (see poses_exercise),
+        so the message is most likely an attempt to be marked, not a question.
+        """
+        if not self.enabled or not message or awaiting_answer:
+            return None
+        problem = parse_question(message)
+        if problem is None:
+            return None
+        start = time.perf_counter()
+        statement, outcome = None, 'solved'
+        try:
+            statement = solve_locally(problem)
+            if statement is None and problem.kind in ('equation', 'symbolic') and self.symbolic:
+                statement = await self._solve_symbolic(problem)
+        except SolveTimeout:
+            outcome = 'timeout'
+        except Exception as e:
+            logger.warning(f"Math solver failed on {problem.kind} problem: {e}")
+            outcome = 'error'
+        if statement is None and outcome == 'solved':
+            outcome = 'unsolved'
+        MATH_SOLVE_LATENCY.observe(time.perf_counter() - start, kind=problem.kind)
+        MATH_SOLVES.inc(kind=problem.kind, outcome=outcome)
+        if statement is None:
+            return None
+        # Trigonometry depends on the angle unit the student meant, so the LLM words that answer
+        direct = self.mode == 'auto' and problem.kind in ('arithmetic', 'conversion') and not problem.explain \
+            and not _TRIG_CALL.search(problem.expression) \
+            and max(map(len, re.findall(r'\d+', statement)), default=0) <= MAX_DIRECT_DIGITS
+        return Solution(problem.kind, statement, direct)
+
+    async def prewarm(self):
+        """Start a worker and import SymPy in it, so the first symbolic question is not the slow one"""
+        if self.enabled and self.symbolic:
+            await self._solve_symbolic(Problem('symbolic', 'x', 'x', 'expand'))
+
+    def close(self):
+        self._reset_pool()
@@ -0,0 +1,276 @@
+"""Process-local metrics rendered in the Prometheus text exposition format.
+
+Counters and histograms are plain dicts keyed by label tuples behind one
+lock, because pymongo command listeners run on Motor's executor threads.
+"""
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Tuple
+
+from pymongo import monitoring
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple:
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def total(self) -> float:
+        with self._lock:
+            return sum(self._values.values())
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # label key -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, **labels) -> int:
+        series = self._values.get(self._key(labels))
+        return sum(series[:-1]) if series else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._values.items()]
+        lines = self.header()
+        for key, series in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), series[:-1]):
+                cumulative += bucket_count
+                le = 'le="' + _format_number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-1]!r}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HTTP_LATENCY = REGISTRY.histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route template', ('method', 'route', 'status')
+)
+MONGO_LATENCY = REGISTRY.histogram(
+    'mongo_command_duration_seconds', 'MongoDB command latency', ('command', 'outcome')
+)
+LLM_LATENCY = REGISTRY.histogram(
+    'llm_request_duration_seconds', 'LLM call latency by endpoint and model', ('endpoint', 'model', 'outcome')
+)
+LLM_TOKENS = REGISTRY.counter(
+    'llm_tokens_total', 'Estimated LLM tokens by endpoint, model and direction', ('endpoint', 'model', 'kind')
+)
+LLM_ESCALATIONS = REGISTRY.counter(
+    'llm_escalations_total', 'Structured-output retries moved to a larger model tier', ('endpoint', 'source', 'target')
+)
+LLM_FAILURES = REGISTRY.counter(
+    'llm_failures_total', 'LLM calls that raised or returned unusable output', ('endpoint', 'reason')
+)
+BUDGET_REJECTIONS = REGISTRY.counter(
+    'llm_budget_rejections_total', 'LLM calls refused by the token budget governor', ('endpoint', 'scope')
+)
+PROMPT_BUILD_LATENCY = REGISTRY.histogram(
+    'llm_prompt_build_seconds', 'Time to render a prompt template', ('prompt',),
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005)
+)
+PROMPT_TOKENS = REGISTRY.counter(
+    'llm_prompt_tokens_total', 'Estimated prompt tokens by template and static/dynamic segment', ('prompt', 'segment')
+)
+PROMPT_CACHEABLE_TOKENS = REGISTRY.counter(
+    'llm_prompt_cacheable_tokens_total', 'Estimated prompt tokens a provider prefix cache can serve', ('prompt',)
+)
+LLM_CALL_OUTCOMES = REGISTRY.counter(
+    'llm_call_outcomes_total', 'How resilient LLM calls ended: ok, fallback, deadline, error, or late when the call '
+    'finished after its fallback was served', ('endpoint', 'outcome')
+)
+LLM_RETRIES = REGISTRY.counter(
+    'llm_retries_total', 'LLM attempts retried after an upstream error', ('endpoint',)
+)
+LLM_HEDGES = REGISTRY.counter(
+    'llm_hedges_total', 'Duplicate LLM requests sent after the p95 hedge delay', ('endpoint',)
+)
+LLM_HEDGE_WINS = REGISTRY.counter(
+    'llm_hedge_wins_total', 'Hedged requests that answered before the original', ('endpoint',)
+)
+TUTOR_CACHE_LOOKUPS = REGISTRY.counter(
+    'tutor_answer_cache_lookups_total', 'Tutor answer cache lookups by result: exact, near or miss', ('result',)
+)
+LLM_INFLIGHT = REGISTRY.gauge(
+    'llm_inflight_calls', 'LLM calls in progress on this worker'
+)
+MATH_SOLVES = REGISTRY.counter(
+    'math_solver_results_total', 'Tutor math questions by kind and outcome: solved, unsolved, timeout or error',
+    ('kind', 'outcome')
+)
+MATH_SOLVE_LATENCY = REGISTRY.histogram(
+    'math_solver_duration_seconds', 'Time to solve a recognized tutor math question', ('kind',),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.0, 5.0)
+)
+IMPORTED_ROWS = REGISTRY.counter(
+    'bulk_import_rows_total', 'Rows processed by bulk imports', ('kind', 'outcome')
+)
+RESPONSE_ENCODE_LATENCY = REGISTRY.histogram(
+    'response_encode_duration_seconds', 'Time serializing response bodies by format: json or msgpack', ('format',),
+    buckets=(0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5)
+)
+RESPONSE_BYTES = REGISTRY.counter(
+    'http_response_body_bytes_total', 'Compressible response bytes before (raw) and after (sent) content encoding',
+    ('encoding', 'stage')
+)
+TRANSCRIPTION_QUEUE_DEPTH = REGISTRY.gauge(
+    'voice_transcription_queue_depth', 'Voice clips waiting for or being transcribed on this worker'
+)
+TRANSCRIPTION_LATENCY = REGISTRY.histogram(
+    'voice_transcription_duration_seconds', 'Time from queueing a voice clip to its transcript, by outcome',
+    ('outcome',), buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+)
+FALLBACKS = REGISTRY.counter(
+    'fallback_responses_total', 'Responses served from deterministic fallback content', ('kind',)
+)
+PASSWORD_HASH_LATENCY = REGISTRY.histogram(
+    'password_hash_duration_seconds', 'bcrypt hash and verify latency', ('operation',),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.0)
+)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """pymongo listener that times every command Motor sends"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_LATENCY.observe(event.duration_micros / 1e6, command=event.command_name, outcome='ok')
+
+    def failed(self, event):
+        MONGO_LATENCY.observe(event.duration_micros / 1e6, command=event.command_name, outcome='error')
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency per route template, not per raw path"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = {'code': 500}
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get('route')
+            HTTP_LATENCY.observe(
+                time.perf_counter() - start,
+                method=scope['method'],
+                route=getattr(route, 'path', 'unmatched'),
+                status=status['code']
+            )
@@ -0,0 +1,183 @@
+"""Resumable, batched background migrations.
+
+A Migration walks one collection in _id order, a batch at a time, and
+turns each matching document into a `$set`. Progress (last _id and
+counts) is checkpointed in the `migrations` collection after every
+batch, so a restarted worker resumes where it stopped and later runs
+first look at documents inserted since (for example by workers still on
+the previous release during a rolling deploy). Since _ids are not
+strictly increasing across processes, each run then sweeps the query once
+more from the start for documents that landed below the checkpoint. Each
+update is conditional on the migrated fields still holding the values
+that were read, so it never overwrites a concurrent write from the app.
+
+Configuration:
+    MIGRATION_BATCH_SIZE   documents per batch (default 500)
+    MIGRATION_PAUSE        seconds between batches, to leave room for traffic (default 0.05)
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+
+def parse_timestamp(value: str) -> Optional[datetime]:
+    """Aware UTC datetime from an ISO-8601 string (naive values are UTC), or None"""
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def as_utc(value: Any) -> Optional[datetime]:
+    """Aware UTC datetime from a stored timestamp, whether or not it has been migrated yet"""
+    if isinstance(value, str):
+        return parse_timestamp(value)
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+class Migration:
+    def __init__(self, name: str, collection: str, query: Dict[str, Any], fields: Iterable[str],
+                 transform: Callable[[Dict[str, Any]], Dict[str, Any]]):
+        self.name = name
+        self.collection = collection
+        self.query = query
+        self.fields = tuple(fields)
+        # Returns the fields to $set on a document; empty to leave it alone
+        self.transform = transform
+
+
+def native_dates(collection: str, fields: Iterable[str]) -> Migration:
+    """Rewrite ISO-string timestamps as BSON dates so sorts and ranges compare dates, not strings"""
+    fields = tuple(fields)
+
+    def transform(doc):
+        changes = {}
+        for field in fields:
+            if isinstance(doc.get(field), str):
+                parsed = parse_timestamp(doc[field])
+                if parsed is not None:
+                    changes[field] = parsed
+        return changes
+
+    return Migration(
+        f"native_dates:{collection}", collection,
+        {"$or": [{field: {"$type": "string"}} for field in fields]}, fields, transform
+    )
+
+
+# Every timestamp the app used to store as .isoformat()
+NATIVE_DATE_FIELDS = {
+    "users": ("created_at",),
+    "chat_messages": ("timestamp",),
+    "learning_paths": ("created_at", "last_updated"),
+    "quizzes": ("created_at",),
+    "quiz_results": ("completed_at",),
+    "career_profiles": ("created_at",),
+    "password_resets": ("created_at", "expires_at"),
+}
+
+MIGRATIONS = [native_dates(collection, fields) for collection, fields in NATIVE_DATE_FIELDS.items()]
+
+
+async def _migrate_batch(db, collection, migration: Migration, batch) -> int:
+    """Apply one batch and return how many documents were rewritten"""
+    updates = []
+    for doc in batch:
+        changes = migration.transform(doc)
+        if changes:
+            # A field the document did not have yet is matched as null, which also matches missing
+            updates.append(UpdateOne(
+                {"_id": doc["_id"], **{field: doc.get(field) for field in changes}},
+                {"$set": changes}
+            ))
+    if not updates:
+        return 0
+    return (await collection.bulk_write(updates, ordered=False)).modified_count
+
+
+async def run_migration(db, migration: Migration, batch_size: Optional[int] = None,
+                        pause: Optional[float] = None) -> Dict[str, Any]:
+    batch_size = batch_size or int(os.environ.get('MIGRATION_BATCH_SIZE', '500'))
+    pause = float(os.environ.get('MIGRATION_PAUSE', '0.05')) if pause is None else pause
+    collection = db[migration.collection]
+    state = await db.migrations.find_one({"_id": migration.name}) or {}
+    last_id = state.get('last_id')
+    projection = {field: 1 for field in migration.fields}
+    migrated = skipped = 0
+
+    # First the documents past the checkpoint, checkpointing as it goes; then one sweep of
+    # whatever still matches below it. _ids are generated by clients and are not strictly
+    # increasing across processes, so a document written by a worker still on the previous
+    # release can land under the checkpoint and would otherwise never be migrated.
+    for sweep in (False, True):
+        floor = None if sweep else last_id
+        while True:
+            query = migration.query if floor is None else {"$and": [{"_id": {"$gt": floor}}, migration.query]}
+            batch = await collection.find(query, projection).sort("_id", 1).limit(batch_size).to_list(batch_size)
+            if not batch:
+                break
+            modified = await _migrate_batch(db, collection, migration, batch)
+            migrated += modified
+            skipped += len(batch) - modified
+            floor = batch[-1]["_id"]
+            progress = {"updated_at": datetime.now(timezone.utc)}
+            if not sweep:
+                last_id = progress["last_id"] = floor
+            await db.migrations.update_one(
+                {"_id": migration.name},
+                {"$set": progress, "$inc": {"migrated": modified, "skipped": len(batch) - modified}},
+                upsert=True
+            )
+            if pause:
+                await asyncio.sleep(pause)
+        if last_id is None:
+            # The first pass already started from the beginning
+            break
+
+    await db.migrations.update_one(
+        {"_id": migration.name},
+        {"$set": {"finished_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+    if migrated or skipped:
+        logger.info(f"Migration {migration.name}: {migrated} documents updated, {skipped} skipped")
+    return {"name": migration.name, "migrated": migrated, "skipped": skipped}
+
+
+async def run_migrations(db, migrations: Iterable[Migration] = MIGRATIONS):
+    return [await run_migration(db, migration) for migration in migrations]
+
+
+async def run_once(db, name: str, job: Callable[[], Awaitable[Any]]) -> Any:
+    """Run a one-off job unless the migrations collection already records it as finished"""
+    if await db.migrations.find_one({"_id": name, "finished_at": {"$exists": True}}, {"_id": 1}):
+        return None
+    result = await job()
+    await db.migrations.update_one(
+        {"_id": name},
+        {"$set": {"finished_at": datetime.now(timezone.utc), "result": result}},
+        upsert=True
+    )
+    return result
+
+
+if __name__ == '__main__':
+    # Run outside the app, e.g. before the first deploy of a release: python migrations.py
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from chat_search import CHAT_SEARCH_MIGRATIONS
+
+    logging.basicConfig(level=logging.INFO)
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    for summary in asyncio.run(run_migrations(client[os.environ['DB_NAME']], MIGRATIONS + CHAT_SEARCH_MIGRATIONS)):
+        print(summary)
@@ -0,0 +1,88 @@
+"""Routes each LLM request to a small or large model tier.
+
+Structured, low-stakes prompts (job listings, career suggestions) and
+short factual tutor questions go to the small tier; roadmaps, quizzes and
+tutor questions that look like multi-step reasoning stay on the large one.
+Callers that parse JSON escalate to the large tier when the small model's
+output does not parse.
+
+Configuration:
+    LLM_MODEL_SMALL         provider/model for the small tier (openai/gpt-4o-mini)
+    LLM_MODEL_LARGE         provider/model for the large tier (openai/gpt-4o)
+    LLM_ROUTING_ENABLED     false sends everything to the large tier
+    LLM_SMALL_MAX_TOKENS    longest prompt (estimated tokens) the small tier takes (1500)
+"""
+import os
+import re
+from typing import Dict, Optional, Tuple
+
+from llm_budget import estimate_tokens
+
+SMALL = 'small'
+LARGE = 'large'
+
+# Endpoints not listed here are classified per prompt
+ENDPOINT_TIERS = {
+    "create_learning_path": LARGE,
+    "generate_quiz": LARGE,
+    "analyze_career": SMALL,
+    "fetch_jobs": SMALL,
+}
+
+# Signals that a tutor question needs multi-step reasoning rather than recall
+COMPLEX_PATTERNS = re.compile(
+    r"```|\bprove\b|\bderive\b|\bderivation\b|step[- ]by[- ]step|\bcompare\b|\bdebug\b"
+    r"|\boptimi[sz]e\b|\bintegral\b|\bintegrate\b|\bdifferentiate\b|\bderivative\b|\bmatrix\b|\bcomplexity\b"
+    r"|\bessay\b|\banaly[sz]e\b|[=<>^]\s*\S+.*[=<>^]|\\frac|\\int|∫|∑|√",
+    re.IGNORECASE
+)
+
+
+def parse_model(value: str, default: Tuple[str, str]) -> Tuple[str, str]:
+    """'openai/gpt-4o-mini' -> ('openai', 'gpt-4o-mini'); a bare model name keeps the default provider"""
+    if not value:
+        return default
+    if '/' in value:
+        provider, model = value.split('/', 1)
+        return provider, model
+    return default[0], value
+
+
+class ModelRouter:
+    def __init__(self, tiers: Dict[str, Tuple[str, str]], enabled: bool = True, small_max_tokens: int = 1500):
+        self.tiers = tiers
+        self.enabled = enabled
+        self.small_max_tokens = small_max_tokens
+
+    @classmethod
+    def from_env(cls, environ=os.environ) -> "ModelRouter":
+        return cls(
+            {
+                SMALL: parse_model(environ.get('LLM_MODEL_SMALL', ''), ('openai', 'gpt-4o-mini')),
+                LARGE: parse_model(environ.get('LLM_MODEL_LARGE', ''), ('openai', 'gpt-4o')),
+            },
+            enabled=environ.get('LLM_ROUTING_ENABLED', 'true').lower() != 'false',
+            small_max_tokens=int(environ.get('LLM_SMALL_MAX_TOKENS', '1500'))
+        )
+
+    def model(self, tier: str) -> Tuple[str, str]:
+        return self.tiers[tier]
+
+    def classify(self, endpoint: str, prompt: str) -> str:
+        """Pick a tier from the endpoint, the prompt length and how complex the prompt looks"""
+        if not self.enabled:
+            return LARGE
+        tier = ENDPOINT_TIERS.get(endpoint)
+        if tier is not None:
+            return tier
+        if estimate_tokens(prompt) > self.small_max_tokens:
+            return LARGE
+        if COMPLEX_PATTERNS.search(prompt) or prompt.count('?') > 2:
+            return LARGE
+        return SMALL
+
+    def escalation(self, tier: str) -> Optional[str]:
+        """Tier to retry on when structured output from `tier` is unusable"""
+        if tier == SMALL and self.tiers[SMALL] != self.tiers[LARGE]:
+            return LARGE
+        return None
@@ -0,0 +1,277 @@
+"""Versioned prompt templates laid out for provider-side prefix caching.
+
+Providers cache the longest prompt prefix they have seen before, so every
+template keeps its instructions and output schema in the system message
+and puts request-specific values at the end of the user message. The
+user part is split into literal and field pieces once at import time;
+rendering just joins them.
+
+Rendering records build time plus static vs dynamic token counts per
+template, and how many of those tokens a prefix cache could serve
+(PROMPT_CACHE_MIN_TOKENS, 1024 by default, in 128-token steps as OpenAI
+does).
+"""
+import hashlib
+import os
+import time
+from string import Formatter
+from typing import Dict, List, Optional, Tuple
+
+from llm_budget import estimate_tokens
+from metrics import PROMPT_BUILD_LATENCY, PROMPT_CACHEABLE_TOKENS, PROMPT_TOKENS
+
+CACHE_MIN_TOKENS = int(os.environ.get('PROMPT_CACHE_MIN_TOKENS', '1024'))
+CACHE_INCREMENT = 128
+
+
+def cacheable_tokens(static_tokens: int) -> int:
+    """Prefix tokens a provider cache can serve once the static prefix has been seen"""
+    if static_tokens < CACHE_MIN_TOKENS:
+        return 0
+    return static_tokens - static_tokens % CACHE_INCREMENT
+
+
+class RenderedPrompt:
+    __slots__ = ('name', 'version', 'system', 'user', 'static_tokens', 'total_tokens')
+
+    def __init__(self, name: str, version: str, system: str, user: str, static_tokens: int, total_tokens: int):
+        self.name = name
+        self.version = version
+        self.system = system
+        self.user = user
+        self.static_tokens = static_tokens
+        self.total_tokens = total_tokens
+
+
+class PromptTemplate:
+    def __init__(self, name: str, version: int, system: str, user: str):
+        self.name = name
+        self.system = system
+        # [(literal, field or None), ...] parsed once instead of per request
+        self._pieces: List[Tuple[str, Optional[str]]] = [
+            (literal, field) for literal, field, _, _ in Formatter().parse(user)
+        ]
+        self.fields = tuple(dict.fromkeys(field for _, field in self._pieces if field))
+        if any(not field.isidentifier() for field in self.fields):
+            raise ValueError(f"Prompt {name} uses positional or nested fields")
+        fingerprint = hashlib.sha1((system + '\0' + user).encode('utf-8')).hexdigest()[:8]
+        self.version = f"{name}@v{version}-{fingerprint}"
+        self.static_tokens = estimate_tokens(system) + estimate_tokens(self._pieces[0][0] if self._pieces else '')
+
+    def render(self, **values) -> RenderedPrompt:
+        start = time.perf_counter()
+        missing = [field for field in self.fields if field not in values]
+        if missing:
+            raise KeyError(f"Prompt {self.name} missing fields: {', '.join(missing)}")
+        parts = []
+        for literal, field in self._pieces:
+            parts.append(literal)
+            if field:
+                parts.append(str(values[field]))
+        user = ''.join(parts)
+        total_tokens = estimate_tokens(self.system) + estimate_tokens(user)
+        PROMPT_BUILD_LATENCY.observe(time.perf_counter() - start, prompt=self.name)
+        PROMPT_TOKENS.inc(self.static_tokens, prompt=self.name, segment='static')
+        PROMPT_TOKENS.inc(max(0, total_tokens - self.static_tokens), prompt=self.name, segment='dynamic')
+        PROMPT_CACHEABLE_TOKENS.inc(cacheable_tokens(self.static_tokens), prompt=self.name)
+        return RenderedPrompt(self.name, self.version, self.system, user, self.static_tokens, total_tokens)
+
+
+class PromptRegistry:
+    def __init__(self):
+        self._templates: Dict[str, PromptTemplate] = {}
+
+    def register(self, name: str, version: int, system: str, user: str) -> PromptTemplate:
+        template = PromptTemplate(name, version, system, user)
+        self._templates[name] = template
+        return template
+
+    def get(self, name: str) -> PromptTemplate:
+        return self._templates[name]
+
+    def render(self, name: str, **values) -> RenderedPrompt:
+        return self._templates[name].render(**values)
+
+    def versions(self) -> Dict[str, str]:
+        return {name: template.version for name, template in self._templates.items()}
+
+
+PROMPTS = PromptRegistry()
+
+TUTOR_SYSTEM = """You are an expert AI tutor at Eduntra AI platform. Your role is to help students learn effectively and master concepts.
+
+CORE PRINCIPLES:
+1. **Language Matching**: ALWAYS respond in the EXACT SAME LANGUAGE the student uses. If they write in Hindi, respond in Hindi. If in Spanish, respond in Spanish. Detect and match their language automatically.
+
+2. **Accuracy**: Provide factually correct, up-to-date information. If unsure, acknowledge it and guide students to verified resources.
+
+3. **Clear Explanations**:
+   - Break down complex topics into simple, digestible parts
+   - Use analogies and real-world examples
+   - Provide step-by-step explanations for problems
+
+4. **Educational Approach**:
+   - Ask guiding questions to encourage critical thinking
+   - Don't just give answers - help students understand WHY
+   - Adapt difficulty based on student's level
+   - Celebrate progress and encourage learning
+
+5. **Engagement**:
+   - Be friendly, patient, and encouraging
+   - Use appropriate examples for the student's age/level
+   - Make learning interactive and interesting
+
+6. **Subject Expertise**: You are knowledgeable in:
+   - Mathematics (all levels)
+   - Science (Physics, Chemistry, Biology)
+   - Programming & Computer Science
+   - Languages & Literature
+   - History & Social Studies
+   - Business & Economics
+   - And all other academic subjects
+
+Remember: Match the student's language, be accurate, and make learning enjoyable!
+
+When the message includes previous conversation context, build on it. Always respond in the SAME LANGUAGE as the current question."""
+
+PROMPTS.register("tutor_question", 2, TUTOR_SYSTEM, "Student's question: {message}")
+
+PROMPTS.register("tutor_followup", 2, TUTOR_SYSTEM, """Previous conversation context:
+{context}
+
+Current question: {message}""")
+
+PROMPTS.register("roadmap", 2, """You are RoadmapGPT, an elite expert in designing structured, professional, customized roadmaps for ANY topic.
+You think clearly, organize information perfectly, and produce actionable, step-by-step learning paths.
+
+Your outputs must be:
+- Clear and structured
+- Beginner-friendly yet comprehensive
+- Detailed with time estimates
+- Highly practical with real projects
+- Motivating and achievable
+
+You MUST respond as a world-class expert teacher.
+
+The user message gives the subject, the learner's profile and the depth to aim for.
+Create a professional roadmap with phases. For EACH phase include:
+
+1. Phase name and duration
+2. Clear learning objectives
+3. Topics to master (3-5 topics)
+4. Detailed description of what they'll learn
+5. Practical exercises/mini-projects
+6. Recommended tools, resources, websites, or books
+7. Common mistakes to avoid
+8. Success metrics (how to know you've mastered this phase)
+
+Return ONLY valid JSON (no markdown), using the learner's timeline as total_duration and their level as difficulty:
+{
+  "overview": {
+    "total_duration": "4 weeks",
+    "total_phases": 4,
+    "estimated_hours": 60,
+    "difficulty": "beginner"
+  },
+  "lessons": [
+    {
+      "phase": 1,
+      "title": "Foundation & Basics",
+      "duration": "Week 1",
+      "objectives": ["Master fundamental concepts", "Build first project"],
+      "topics": ["Core concept 1", "Core concept 2", "Core concept 3"],
+      "description": "Detailed description of what you'll learn",
+      "practice": "Build a beginner project",
+      "resources": ["Resource 1", "Resource 2"],
+      "tools": ["Tool 1", "Tool 2"],
+      "common_mistakes": ["Mistake 1", "Mistake 2"],
+      "success_metrics": ["Can do X", "Understand Y"],
+      "duration_minutes": 300
+    }
+  ],
+  "final_checklist": [
+    "Skill checkpoint 1",
+    "Skill checkpoint 2",
+    "Can build X from scratch"
+  ],
+  "next_steps": [
+    "Advanced topic 1",
+    "Advanced topic 2"
+  ]
+}""", """Create a COMPREHENSIVE roadmap for: {subject}
+
+USER PROFILE:
+- Current Level: {skill_level}
+- Final Goal: {final_goal}
+- Daily Study Time: {daily_time}
+- Timeline: {timeline}
+
+Make it {detail_level} and perfectly suited for {skill_level} level.""")
+
+PROMPTS.register("phase_quiz", 2, """You are an expert educational assessment designer. Create challenging but fair quizzes to test understanding.
+
+The user message names a learning phase with its topics and objectives. Generate 5 multiple-choice questions that test:
+1. Understanding of core concepts
+2. Practical application
+3. Problem-solving ability
+
+For each question provide:
+- question: Clear, specific question text
+- options: Array of 4 options (A, B, C, D)
+- correct_answer: The letter of correct option (A/B/C/D)
+- explanation: Brief explanation of the correct answer
+
+Return ONLY valid JSON, with the title in the form "Phase <number> Quiz: <phase title>":
+{
+  "title": "Phase 1 Quiz: Foundation & Basics",
+  "questions": [
+    {
+      "question": "Question text here?",
+      "options": ["Option A", "Option B", "Option C", "Option D"],
+      "correct_answer": "A",
+      "explanation": "Explanation here"
+    }
+  ]
+}""", """Create a quiz to test mastery of Phase {phase}: {title}
+
+Topics covered: {topics}
+Learning objectives: {objectives}""")
+
+PROMPTS.register("career_analysis", 2, """You are a professional career counselor. Provide detailed, realistic career recommendations.
+
+Recommend 5 suitable career paths for the interests and skills in the user message.
+
+For each career, provide:
+- title: Career title
+- description: Brief description (2-3 sentences)
+- salary_range: Expected salary (e.g., "$50k-$80k per year" or "₹6-12 LPA")
+- required_skills: List of 4-6 key skills needed
+- roadmap: List of 5-7 specific steps to reach this career
+
+Return ONLY valid JSON in this exact format, no markdown:
+{"careers": [{"title": "Software Developer", "description": "Build applications and software", "salary_range": "$60k-$100k", "required_skills": ["Python", "JavaScript", "Problem Solving"], "roadmap": ["Learn programming basics", "Build portfolio projects", "Get internship"]}]}""",
+                 """Interests: {interests}
+Skills: {skills}""")
+
+PROMPTS.register("job_listings", 2, """You are a job market analyst. Generate realistic job listings.
+
+Generate 10 realistic listings of the type and market given in the user message, as of right now.
+
+Include trending roles in:
+- Technology (AI/ML, Web Dev, Data Science)
+- Digital Marketing
+- Business Development
+- Design (UI/UX)
+- Content Creation
+
+Return JSON array, with location set to the requested market:
+[{
+    "title": "Job title",
+    "company": "Real-sounding company name",
+    "location": "Bangalore",
+    "required_skills": ["skill1", "skill2", "skill3"],
+    "salary": "Realistic salary range in INR",
+    "description": "Brief 2-sentence description",
+    "experience_level": "Entry/Mid/Senior"
+}]""", """Listing type: {job_type}
+Market: {location}""")
@@ -0,0 +1,326 @@
+"""Real-time class room channel.
+
+Every worker keeps its own sockets in a ClassRoomHub and fans messages out
+through a Broker, so a chat line or status change published on one uvicorn
+worker reaches sockets held by the others. The in-memory broker covers a
+single process and tests; RedisBroker works with redis or a compatible fake
+such as fakeredis.
+"""
+import asyncio
+import json
+import logging
+from abc import ABC, abstractmethod
+from collections import Counter, defaultdict
+from typing import Any, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[Dict[str, Any]], None]
+
+
+def room_channel(class_id: str) -> str:
+    return f"class:{class_id}"
+
+
+class Broker(ABC):
+    """Pub/sub plus a presence counter shared by all workers"""
+
+    @abstractmethod
+    async def publish(self, channel: str, message: Dict[str, Any]):
+        ...
+
+    @abstractmethod
+    async def subscribe(self, channel: str, handler: Handler):
+        ...
+
+    @abstractmethod
+    async def unsubscribe(self, channel: str, handler: Handler):
+        ...
+
+    @abstractmethod
+    async def presence_add(self, room: str, member: str):
+        ...
+
+    @abstractmethod
+    async def presence_remove(self, room: str, member: str):
+        ...
+
+    @abstractmethod
+    async def presence_members(self, room: str) -> List[str]:
+        ...
+
+    async def close(self):
+        pass
+
+
+class InMemoryBroker(Broker):
+    """Process-local broker; hubs sharing one instance behave like separate workers"""
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Handler]] = defaultdict(list)
+        self._presence: Dict[str, Counter] = defaultdict(Counter)
+
+    async def publish(self, channel: str, message: Dict[str, Any]):
+        for handler in list(self._handlers.get(channel, ())):
+            handler(message)
+
+    async def subscribe(self, channel: str, handler: Handler):
+        self._handlers[channel].append(handler)
+
+    async def unsubscribe(self, channel: str, handler: Handler):
+        handlers = self._handlers.get(channel)
+        if handlers and handler in handlers:
+            handlers.remove(handler)
+        if not handlers:
+            self._handlers.pop(channel, None)
+
+    async def presence_add(self, room: str, member: str):
+        self._presence[room][member] += 1
+
+    async def presence_remove(self, room: str, member: str):
+        counts = self._presence.get(room)
+        if counts is None:
+            return
+        counts[member] -= 1
+        if counts[member] <= 0:
+            del counts[member]
+        if not counts:
+            del self._presence[room]
+
+    async def presence_members(self, room: str) -> List[str]:
+        return sorted(self._presence.get(room, ()))
+
+
+class RedisBroker(Broker):
+    """Broker on Redis pub/sub and hashes; `redis` may be any redis.asyncio-compatible client"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self._pubsub = redis.pubsub()
+        self._handlers: Dict[str, List[Handler]] = defaultdict(list)
+        self._reader: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisBroker":
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError as e:
+            raise RuntimeError("REALTIME_BROKER_URL points at Redis but the redis package is not installed") from e
+        return cls(redis_asyncio.from_url(url))
+
+    async def publish(self, channel: str, message: Dict[str, Any]):
+        await self.redis.publish(channel, json.dumps(message, default=str))
+
+    async def subscribe(self, channel: str, handler: Handler):
+        if not self._handlers.get(channel):
+            await self._pubsub.subscribe(channel)
+        self._handlers[channel].append(handler)
+        if self._reader is None:
+            self._reader = asyncio.create_task(self._read())
+
+    async def unsubscribe(self, channel: str, handler: Handler):
+        handlers = self._handlers.get(channel)
+        if handlers and handler in handlers:
+            handlers.remove(handler)
+        if not handlers:
+            self._handlers.pop(channel, None)
+            await self._pubsub.unsubscribe(channel)
+
+    async def _read(self):
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Realtime broker read failed: {e}")
+                await asyncio.sleep(1.0)
+                continue
+            if not message:
+                continue
+            channel = message['channel']
+            if isinstance(channel, bytes):
+                channel = channel.decode()
+            payload = json.loads(message['data'])
+            for handler in list(self._handlers.get(channel, ())):
+                handler(payload)
+
+    async def presence_add(self, room: str, member: str):
+        await self.redis.hincrby(f"presence:{room}", member, 1)
+
+    async def presence_remove(self, room: str, member: str):
+        key = f"presence:{room}"
+        if await self.redis.hincrby(key, member, -1) <= 0:
+            await self.redis.hdel(key, member)
+
+    async def presence_members(self, room: str) -> List[str]:
+        members = await self.redis.hgetall(f"presence:{room}")
+        return sorted(
+            (m.decode() if isinstance(m, bytes) else m)
+            for m, count in members.items()
+            if int(count) > 0
+        )
+
+    async def close(self):
+        if self._reader is not None:
+            self._reader.cancel()
+        await self._pubsub.close()
+        await self.redis.close()
+
+
+def create_broker(url: Optional[str]) -> Broker:
+    if not url or url.startswith('memory://'):
+        return InMemoryBroker()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBroker.from_url(url)
+    raise ValueError(f"Unsupported realtime broker URL: {url}")
+
+
+class Connection:
+    """One socket with a bounded outbox drained by its own sender task.
+
+    When the outbox is full the oldest message is dropped, so a slow client
+    never stalls fan-out to the rest of the room. Clients that keep falling
+    behind are disconnected.
+    """
+
+    def __init__(self, websocket, user_id: str, role: str, queue_size: int = 100, max_dropped: int = 200):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.role = role
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.max_dropped = max_dropped
+        self.dropped = 0
+        self.closed = asyncio.Event()
+        self._sender: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._sender = asyncio.create_task(self._send_loop())
+
+    def offer(self, message: Dict[str, Any]) -> bool:
+        if self.closed.is_set():
+            return False
+        try:
+            self.outbox.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            self.outbox.get_nowait()
+            self.outbox.put_nowait(message)
+            self.dropped += 1
+            if self.dropped > self.max_dropped:
+                self.closed.set()
+            return False
+
+    async def _send_loop(self):
+        try:
+            while not self.closed.is_set():
+                message = await self.outbox.get()
+                await self.websocket.send_json(message)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            # The receive loop notices the dead socket and cleans up
+            self.closed.set()
+
+    async def stop(self):
+        self.closed.set()
+        if self._sender is not None:
+            self._sender.cancel()
+            try:
+                await self._sender
+            except asyncio.CancelledError:
+                pass
+
+
+class ClassRoomHub:
+    """Tracks this worker's sockets per class and relays broker traffic to them"""
+
+    def __init__(self, broker: Broker, queue_size: int = 100, max_dropped: int = 200, presence_interval: float = 0.25):
+        self.broker = broker
+        self.queue_size = queue_size
+        self.max_dropped = max_dropped
+        # Joins and leaves are batched per room so a join storm is O(n), not O(n^2)
+        self.presence_interval = presence_interval
+        self.rooms: Dict[str, Set[Connection]] = defaultdict(set)
+        self._relays: Dict[str, Handler] = {}
+        self._pending_presence: Dict[str, Dict[str, List[Dict[str, str]]]] = {}
+        self._flushes: Set[asyncio.Task] = set()
+        self.delivered = 0
+        self.dropped = 0
+
+    def connection(self, websocket, user_id: str, role: str) -> Connection:
+        return Connection(websocket, user_id, role, self.queue_size, self.max_dropped)
+
+    async def connect(self, class_id: str, conn: Connection):
+        if class_id not in self._relays:
+            relay = self._relay_for(class_id)
+            self._relays[class_id] = relay
+            await self.broker.subscribe(room_channel(class_id), relay)
+        self.rooms[class_id].add(conn)
+        conn.start()
+        await self.broker.presence_add(class_id, conn.user_id)
+        await self._presence_changed(class_id, "joined", conn)
+
+    async def disconnect(self, class_id: str, conn: Connection):
+        await conn.stop()
+        room = self.rooms.get(class_id)
+        if room is None or conn not in room:
+            return
+        room.discard(conn)
+        await self.broker.presence_remove(class_id, conn.user_id)
+        await self._presence_changed(class_id, "left", conn)
+        if not room:
+            del self.rooms[class_id]
+            relay = self._relays.pop(class_id, None)
+            if relay is not None:
+                await self.broker.unsubscribe(room_channel(class_id), relay)
+
+    async def publish(self, class_id: str, message: Dict[str, Any]):
+        await self.broker.publish(room_channel(class_id), message)
+
+    async def presence(self, class_id: str) -> List[str]:
+        return await self.broker.presence_members(class_id)
+
+    def local_connections(self) -> int:
+        return sum(len(room) for room in self.rooms.values())
+
+    async def _presence_changed(self, class_id: str, change: str, conn: Connection):
+        member = {"user_id": conn.user_id, "role": conn.role}
+        if self.presence_interval <= 0:
+            await self.publish(class_id, {"type": "presence", "joined": [], "left": [], change: [member]})
+            return
+        pending = self._pending_presence.get(class_id)
+        if pending is None:
+            pending = self._pending_presence[class_id] = {"joined": [], "left": []}
+            flush = asyncio.create_task(self._flush_presence(class_id))
+            self._flushes.add(flush)
+            flush.add_done_callback(self._flushes.discard)
+        pending[change].append(member)
+
+    async def _flush_presence(self, class_id: str):
+        await asyncio.sleep(self.presence_interval)
+        pending = self._pending_presence.pop(class_id, None)
+        if pending:
+            await self.publish(class_id, {"type": "presence", **pending})
+
+    def _relay_for(self, class_id: str) -> Handler:
+        def relay(message: Dict[str, Any]):
+            for conn in tuple(self.rooms.get(class_id, ())):
+                if conn.offer(message):
+                    self.delivered += 1
+                else:
+                    self.dropped += 1
+        return relay
+
+    async def close(self):
+        for flush in list(self._flushes):
+            flush.cancel()
+        for class_id, room in list(self.rooms.items()):
+            for conn in list(room):
+                await conn.stop()
+                try:
+                    await conn.websocket.close(code=1012)
+                except Exception:
+                    pass
+        self.rooms.clear()
+        await self.broker.close()
@@ -0,0 +1,243 @@
+"""Deadlines, retries, hedging and fallback racing for LLM calls.
+
+Every call gets a per-endpoint deadline. Inside it:
+
+* an attempt that has not finished after the endpoint's rolling p95
+  latency gets one duplicate ("hedge") request, and whichever answers
+  first wins while the other is cancelled;
+* upstream errors are retried with full-jitter exponential backoff while
+  time remains;
+* endpoints with a deterministic fallback return it once the call has
+  run past the endpoint's SLO (or retries run out), so the user gets an
+  answer within the SLO. Without an `on_late` callback the LLM call is
+  then cancelled; with one it keeps going in the background until the
+  deadline, without further hedges or retries, so the callback can keep
+  the answer for next time.
+
+Budget refusals and unusable output are not retried; callers handle them.
+Policies can be overridden per endpoint with
+LLM_RESILIENCE='{"tutor_chat": {"deadline": 20, "hedge": false}, "analyze_career": {"slo": 5}}'.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Type
+
+from metrics import LLM_CALL_OUTCOMES, LLM_HEDGE_WINS, LLM_HEDGES, LLM_RETRIES
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceeded(TimeoutError):
+    def __init__(self, endpoint: str, deadline: float):
+        super().__init__(f"{endpoint} did not answer within {deadline:g}s")
+        self.endpoint = endpoint
+        self.deadline = deadline
+
+
+class CallPolicy:
+    def __init__(self, deadline: float, attempts: int = 2, backoff: float = 0.5, backoff_cap: float = 4.0,
+                 hedge: bool = True, hedge_delay: float = 10.0, min_hedge_delay: float = 1.0,
+                 slo: Optional[float] = None):
+        self.deadline = deadline
+        self.attempts = attempts
+        self.backoff = backoff
+        self.backoff_cap = backoff_cap
+        self.hedge = hedge
+        # Used until the endpoint has enough samples for a p95
+        self.hedge_delay = hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        # Seconds before a fallback is served while the call finishes in the background;
+        # None waits for the hedge delay
+        self.slo = slo
+
+
+DEFAULT_POLICIES = {
+    "tutor_chat": CallPolicy(deadline=40, hedge_delay=12),
+    "create_learning_path": CallPolicy(deadline=45, hedge_delay=25, slo=15),
+    "generate_quiz": CallPolicy(deadline=40, hedge_delay=15, slo=15),
+    "analyze_career": CallPolicy(deadline=20, hedge_delay=10, slo=8),
+    "fetch_jobs": CallPolicy(deadline=30, attempts=1, hedge=False),
+}
+
+
+def load_policies(environ=os.environ) -> Dict[str, CallPolicy]:
+    policies = dict(DEFAULT_POLICIES)
+    overrides = json.loads(environ.get('LLM_RESILIENCE') or '{}')
+    for endpoint, fields in overrides.items():
+        base = policies.get(endpoint, DEFAULT_POLICIES["tutor_chat"])
+        policies[endpoint] = CallPolicy(**{**vars(base), **fields})
+    return policies
+
+
+class LatencyWindow:
+    """Latencies of the last `size` successful calls"""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self._samples = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ResilientCaller:
+    def __init__(self, policies: Optional[Dict[str, CallPolicy]] = None,
+                 non_retryable: Tuple[Type[BaseException], ...] = (), rng: Optional[random.Random] = None):
+        self.policies = policies or load_policies()
+        self.non_retryable = non_retryable
+        self.rng = rng or random.Random()
+        self.windows: Dict[str, LatencyWindow] = {}
+        # Calls still running after their fallback was served
+        self._background = set()
+
+    def policy(self, endpoint: str) -> CallPolicy:
+        return self.policies.get(endpoint, self.policies["tutor_chat"])
+
+    def window(self, endpoint: str) -> LatencyWindow:
+        window = self.windows.get(endpoint)
+        if window is None:
+            window = self.windows[endpoint] = LatencyWindow()
+        return window
+
+    def hedge_delay(self, endpoint: str, policy: CallPolicy) -> Optional[float]:
+        if not policy.hedge:
+            return None
+        p95 = self.window(endpoint).quantile(0.95)
+        delay = policy.hedge_delay if p95 is None else p95
+        return min(max(delay, policy.min_hedge_delay), policy.deadline / 2)
+
+    def slo(self, endpoint: str, policy: CallPolicy) -> float:
+        """Seconds to wait before serving a fallback"""
+        slo = policy.slo if policy.slo is not None else self.hedge_delay(endpoint, policy)
+        return policy.deadline if slo is None else min(slo, policy.deadline)
+
+    async def call(self, endpoint: str, make_call: Callable[[], Awaitable[Any]],
+                   fallback: Optional[Callable[[], Any]] = None,
+                   on_late: Optional[Callable[[Any], Awaitable[Any]]] = None) -> Any:
+        """Run make_call under the endpoint's policy; fallback() answers when the LLM cannot in time
+
+        on_late(result) is awaited if the call succeeds after its fallback was served.
+        """
+        policy = self.policy(endpoint)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + policy.deadline
+        # Set once a fallback has answered, so a call left running stops hedging and retrying
+        served = asyncio.Event()
+        runner = asyncio.ensure_future(self._attempts(endpoint, make_call, policy, deadline, served))
+        wait = policy.deadline if fallback is None else self.slo(endpoint, policy)
+        try:
+            done, _ = await asyncio.wait({runner}, timeout=wait)
+        except asyncio.CancelledError:
+            runner.cancel()
+            raise
+
+        if not done:
+            if fallback is None:
+                runner.cancel()
+                LLM_CALL_OUTCOMES.inc(endpoint=endpoint, outcome='deadline')
+                raise DeadlineExceeded(endpoint, policy.deadline)
+            if on_late is None:
+                # Nothing would use the answer
+                runner.cancel()
+            else:
+                served.set()
+                self._finish_in_background(endpoint, runner, deadline, on_late)
+            LLM_CALL_OUTCOMES.inc(endpoint=endpoint, outcome='fallback')
+            return fallback()
+
+        error = runner.exception()
+        if error is None:
+            LLM_CALL_OUTCOMES.inc(endpoint=endpoint, outcome='ok')
+            return runner.result()
+        if fallback is not None and not isinstance(error, self.non_retryable):
+            LLM_CALL_OUTCOMES.inc(endpoint=endpoint, outcome='fallback')
+            return fallback()
+        LLM_CALL_OUTCOMES.inc(endpoint=endpoint, outcome='error')
+        raise error
+
+    def _finish_in_background(self, endpoint: str, runner: asyncio.Future, deadline: float,
+                              on_late: Callable[[Any], Awaitable[Any]]):
+        loop = asyncio.get_running_loop()
+        expire = loop.call_at(deadline, runner.cancel)
+        self._background.add(runner)
+
+        def finished(task: asyncio.Future):
+            expire.cancel()
+            self._background.discard(task)
+            if task.cancelled() or task.exception() is not None:
+                return
+            LLM_CALL_OUTCOMES.inc(endpoint=endpoint, outcome='late')
+            keep = asyncio.ensure_future(self._run_late(endpoint, on_late, task.result()))
+            self._background.add(keep)
+            keep.add_done_callback(self._background.discard)
+
+        runner.add_done_callback(finished)
+
+    @staticmethod
+    async def _run_late(endpoint: str, on_late, result):
+        try:
+            await on_late(result)
+        except Exception as e:
+            logger.warning(f"Keeping the late {endpoint} answer failed: {e}")
+
+    async def _attempts(self, endpoint: str, make_call, policy: CallPolicy, deadline: float,
+                        served: asyncio.Event):
+        loop = asyncio.get_running_loop()
+        for attempt in range(policy.attempts):
+            try:
+                return await self._hedged(endpoint, make_call, policy, served)
+            except self.non_retryable:
+                raise
+            except Exception:
+                if attempt + 1 >= policy.attempts or served.is_set():
+                    raise
+                # Full jitter keeps retries from many requests from arriving in lockstep
+                delay = self.rng.uniform(0, min(policy.backoff_cap, policy.backoff * 2 ** attempt))
+                if loop.time() + delay >= deadline:
+                    raise
+                LLM_RETRIES.inc(endpoint=endpoint)
+                await asyncio.sleep(delay)
+                if served.is_set():
+                    raise
+
+    async def _hedged(self, endpoint: str, make_call, policy: CallPolicy, served: asyncio.Event):
+        loop = asyncio.get_running_loop()
+        started: Dict[asyncio.Future, Tuple[str, float]] = {}
+        primary = asyncio.ensure_future(make_call())
+        started[primary] = ('primary', loop.time())
+        try:
+            hedge_delay = self.hedge_delay(endpoint, policy)
+            if hedge_delay is not None:
+                done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+                if not done and not served.is_set():
+                    LLM_HEDGES.inc(endpoint=endpoint)
+                    started[asyncio.ensure_future(make_call())] = ('hedge', loop.time())
+
+            pending = set(started)
+            first_error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                errors = [task.exception() for task in done]
+                for task, error in zip(done, errors):
+                    if error is None:
+                        role, start = started[task]
+                        self.window(endpoint).observe(loop.time() - start)
+                        if role == 'hedge':
+                            LLM_HEDGE_WINS.inc(endpoint=endpoint)
+                        return task.result()
+                first_error = first_error or errors[0]
+            raise first_error
+        finally:
+            for task in started:
+                if not task.done():
+                    task.cancel()
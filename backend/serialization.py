@@ -0,0 +1,334 @@
+"""Response encoding, content negotiation and compression for the API.
+
+Handlers keep returning plain dicts and lists. Routes on the API router
+use SerializingRoute, which hands those straight to ApiResponse instead
+of walking them through FastAPI's jsonable_encoder first; ApiResponse
+encodes with orjson when it is installed and the standard library
+otherwise, writing dates in ISO-8601 either way. Routes that declare a
+response_model are validated and dumped by pydantic as usual and only
+the final encoding goes through ApiResponse.
+
+Clients that send `Accept: application/msgpack` get MessagePack bodies
+(same shape, dates as ISO strings) when the `msgpack` package is
+installed, and may send MessagePack request bodies too; those are
+translated to JSON before FastAPI parses them. Error responses stay JSON.
+
+Responses of a compressible type and at least RESPONSE_COMPRESSION_MIN_BYTES
+long are compressed with brotli (when the `brotli` package is installed)
+or gzip, whichever the client's Accept-Encoding prefers. Streamed
+responses are passed through untouched.
+
+Configuration:
+    RESPONSE_MSGPACK                     offer MessagePack to clients that ask for it (default true when installed)
+    RESPONSE_COMPRESSION_MIN_BYTES       smallest body worth compressing (default 1024, 0 disables compression)
+    RESPONSE_GZIP_LEVEL                  gzip level, 1-9 (default 6)
+    RESPONSE_BROTLI_QUALITY              brotli quality, 0-11 (default 4)
+"""
+import asyncio
+import functools
+import gzip
+import json
+import os
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+
+from metrics import RESPONSE_BYTES, RESPONSE_ENCODE_LATENCY
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+MSGPACK_TYPES = (MSGPACK, "application/x-msgpack", "application/vnd.msgpack")
+COMPRESSIBLE_TYPES = (JSON, "application/x-ndjson", "application/javascript", "image/svg+xml") + MSGPACK_TYPES
+MSGPACK_ENABLED = msgpack is not None and os.environ.get('RESPONSE_MSGPACK', 'true').lower() not in ('0', 'false', 'no')
+
+# Chosen per request by ContentNegotiationMiddleware; handlers and ApiResponse run in the same context
+_response_format: ContextVar = ContextVar('response_format', default='json')
+
+
+def json_default(value: Any) -> Any:
+    """Stored dates go out in ISO-8601, as FastAPI's own encoder writes them"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode='json')
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    return str(value)
+
+
+def dumps(payload: Any) -> bytes:
+    """Compact UTF-8 JSON"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # Integers past 64 bits and other values orjson refuses; the standard library copes
+            pass
+    return json.dumps(payload, separators=(',', ':'), ensure_ascii=False, default=json_default).encode('utf-8')
+
+
+def packb(payload: Any) -> bytes:
+    return msgpack.packb(payload, default=json_default, use_bin_type=True)
+
+
+def response_format() -> str:
+    """json or msgpack, as negotiated for the current request"""
+    return _response_format.get()
+
+
+def encode(payload: Any, fmt: Optional[str] = None) -> Tuple[bytes, str]:
+    """(body, media type) for payload in the requested or negotiated format"""
+    fmt = fmt or _response_format.get()
+    start = time.perf_counter()
+    if fmt == 'msgpack':
+        body, media_type = packb(payload), MSGPACK
+    else:
+        fmt, body, media_type = 'json', dumps(payload), JSON
+    RESPONSE_ENCODE_LATENCY.observe(time.perf_counter() - start, format=fmt)
+    return body, media_type
+
+
+def weights(header: str) -> Dict[str, float]:
+    """Media types or codings from an Accept-style header, with their q values"""
+    result = {}
+    for part in header.split(','):
+        name, _, params = part.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        result[name] = max(q, result.get(name, 0.0))
+    return result
+
+
+def negotiate_format(accept: str) -> str:
+    """msgpack when the client ranks it at least as high as JSON, json otherwise"""
+    if not MSGPACK_ENABLED or not accept:
+        return 'json'
+    accepted = weights(accept)
+    wanted = max(accepted.get(media_type, 0.0) for media_type in MSGPACK_TYPES)
+    return 'msgpack' if wanted > 0 and wanted >= accepted.get(JSON, 0.0) else 'json'
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """br, gzip or None for the client's Accept-Encoding"""
+    accepted = weights(accept_encoding)
+    wildcard = accepted.get('*', 0.0)
+    br = accepted.get('br', wildcard) if brotli is not None else 0.0
+    gz = accepted.get('gzip', wildcard)
+    if br > 0 and br >= gz:
+        return 'br'
+    return 'gzip' if gz > 0 else None
+
+
+class ApiResponse(Response):
+    """JSON through orjson, or MessagePack when the request negotiated it"""
+
+    media_type = JSON
+
+    def __init__(self, content: Any = None, status_code: int = 200, headers: Optional[Dict[str, str]] = None,
+                 media_type: Optional[str] = None, background=None):
+        self.format = _response_format.get()
+        super().__init__(content, status_code, headers, media_type, background)
+        if MSGPACK_ENABLED:
+            self.headers.add_vary_header('Accept')
+
+    def render(self, content: Any) -> bytes:
+        body, self.media_type = encode(content, self.format)
+        return body
+
+
+def _direct(endpoint: Callable, status_code: int) -> Callable:
+    """Wrap an endpoint so a plain return value becomes an ApiResponse without jsonable_encoder"""
+    if asyncio.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def call(**kwargs):
+            result = await endpoint(**kwargs)
+            return result if isinstance(result, Response) else ApiResponse(result, status_code=status_code)
+    else:
+        @functools.wraps(endpoint)
+        def call(**kwargs):
+            result = endpoint(**kwargs)
+            return result if isinstance(result, Response) else ApiResponse(result, status_code=status_code)
+    call.direct = True
+    return call
+
+
+class SerializingRoute(APIRoute):
+    """APIRoute that encodes plain return values once, with ApiResponse
+
+    Routes with a response_model keep FastAPI's validation, and so do
+    handlers that take the Response parameter to set headers or cookies,
+    since FastAPI only copies those onto responses it builds itself.
+    """
+
+    def get_route_handler(self):
+        dependant = self.dependant
+        if self.response_field is None and dependant.response_param_name is None \
+                and not getattr(dependant.call, 'direct', False):
+            dependant.call = _direct(dependant.call, self.status_code or 200)
+        return super().get_route_handler()
+
+
+async def _read_body(receive) -> Tuple[bytes, bool]:
+    """The whole request body, and whether the client disconnected first"""
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return b''.join(chunks), True
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks), False
+
+
+class ContentNegotiationMiddleware:
+    """ASGI middleware choosing the response format and accepting MessagePack request bodies"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        token = _response_format.set(negotiate_format(headers.get('accept', '')))
+        try:
+            content_type = headers.get('content-type', '').split(';')[0].strip().lower()
+            if content_type in MSGPACK_TYPES:
+                if not MSGPACK_ENABLED:
+                    await self._reject(scope, receive, send, 415, "MessagePack request bodies are not supported")
+                    return
+                raw, disconnected = await _read_body(receive)
+                if disconnected:
+                    return
+                try:
+                    body = dumps(msgpack.unpackb(raw, timestamp=3, strict_map_key=False)) if raw else b''
+                except (ValueError, TypeError) as e:
+                    reason = str(e) or e.__class__.__name__
+                    await self._reject(scope, receive, send, 400, f"Invalid MessagePack body: {reason}")
+                    return
+                scope = dict(scope, headers=[
+                    (key, value) for key, value in scope['headers'] if key not in (b'content-type', b'content-length')
+                ] + [(b'content-type', JSON.encode()), (b'content-length', str(len(body)).encode())])
+                receive = self._replay(body, receive)
+            await self.app(scope, receive, send)
+        finally:
+            _response_format.reset(token)
+
+    @staticmethod
+    def _replay(body: bytes, receive):
+        sent = False
+
+        async def replay():
+            nonlocal sent
+            if sent:
+                return await receive()
+            sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        return replay
+
+    @staticmethod
+    async def _reject(scope, receive, send, status_code: int, detail: str):
+        _response_format.set('json')
+        await ApiResponse({"detail": detail}, status_code=status_code)(scope, receive, send)
+
+
+def compressible(content_type: str) -> bool:
+    media_type = content_type.split(';')[0].strip().lower()
+    return media_type.startswith('text/') or media_type.endswith('+json') or media_type in COMPRESSIBLE_TYPES
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing whole response bodies with brotli or gzip above a size threshold"""
+
+    def __init__(self, app, minimum_size: Optional[int] = None, gzip_level: Optional[int] = None,
+                 brotli_quality: Optional[int] = None):
+        self.app = app
+        self.minimum_size = minimum_size if minimum_size is not None else \
+            int(os.environ.get('RESPONSE_COMPRESSION_MIN_BYTES', '1024'))
+        self.gzip_level = gzip_level or int(os.environ.get('RESPONSE_GZIP_LEVEL', '6'))
+        self.brotli_quality = brotli_quality if brotli_quality is not None else \
+            int(os.environ.get('RESPONSE_BROTLI_QUALITY', '4'))
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == 'br':
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or self.minimum_size <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get('accept-encoding', ''))
+        start = None
+        streaming = False
+
+        async def send_compressed(message):
+            nonlocal start, streaming
+            if message['type'] == 'http.response.start':
+                # Held back until the first body message shows whether the response is worth compressing
+                start = message
+                return
+            if message['type'] != 'http.response.body' or start is None or streaming:
+                await send(message)
+                return
+
+            headers = MutableHeaders(raw=list(start['headers']))
+            response_start, start = start, None
+            body = message.get('body', b'')
+            eligible = compressible(headers.get('content-type', '')) and 'content-encoding' not in headers
+            if eligible:
+                headers.add_vary_header('Accept-Encoding')
+            if message.get('more_body'):
+                streaming = True
+            if not eligible or streaming or encoding is None or len(body) < self.minimum_size:
+                await send({**response_start, 'headers': headers.raw})
+                await send(message)
+                return
+
+            compressed = self.compress(body, encoding)
+            RESPONSE_BYTES.inc(len(body), encoding=encoding, stage='raw')
+            RESPONSE_BYTES.inc(len(compressed), encoding=encoding, stage='sent')
+            headers['Content-Encoding'] = encoding
+            headers['Content-Length'] = str(len(compressed))
+            etag = headers.get('etag')
+            if etag and not etag.startswith('W/'):
+                # The compressed bytes differ from the identity representation the tag names
+                headers['ETag'] = 'W/' + etag
+            await send({**response_start, 'headers': headers.raw})
+            await send({**message, 'body': compressed})
+
+        await self.app(scope, receive, send_compressed)
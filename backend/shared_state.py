@@ -0,0 +1,216 @@
+"""Cache, counters and locks shared by every worker.
+
+Each uvicorn/gunicorn worker is a separate process, so anything that has
+to be coordinated across them (a single upstream fetch for many waiting
+requests, a rate limit, a one-at-a-time startup migration) goes through a
+SharedState. MongoSharedState keeps entries in the `shared_state`
+collection with a TTL index on `expires_at`; InMemorySharedState covers a
+single process and tests.
+
+Select the backend with SHARED_STATE_BACKEND=mongo (default) or memory.
+"""
+import asyncio
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+
+class SharedState(ABC):
+    """Expiring values, counters and locks; values must be BSON/JSON friendly"""
+
+    def __init__(self):
+        self._flights: Dict[str, asyncio.Future] = {}
+
+    @abstractmethod
+    async def get(self, key: str) -> Any:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: float):
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str):
+        ...
+
+    @abstractmethod
+    async def incr(self, key: str, ttl: float, amount: int = 1) -> int:
+        """Add to a counter that starts at zero and resets `ttl` seconds after its first increment"""
+        ...
+
+    @abstractmethod
+    async def try_lock(self, name: str, ttl: float) -> Optional[str]:
+        """Take the lock without waiting; returns an owner token, or None if someone else holds it"""
+        ...
+
+    @abstractmethod
+    async def unlock(self, name: str, token: str):
+        ...
+
+    async def close(self):
+        pass
+
+    @asynccontextmanager
+    async def lock(self, name: str, ttl: float = 30.0, wait: float = 10.0):
+        """Hold `name` for at most `ttl` seconds, polling up to `wait` seconds for it; yields whether it was taken"""
+        loop = asyncio.get_running_loop()
+        give_up = loop.time() + wait
+        delay = 0.05
+        token = await self.try_lock(name, ttl)
+        while token is None and loop.time() < give_up:
+            await asyncio.sleep(min(delay, max(0.0, give_up - loop.time())))
+            delay = min(delay * 2, 1.0)
+            token = await self.try_lock(name, ttl)
+        try:
+            yield token is not None
+        finally:
+            if token is not None:
+                await self.unlock(name, token)
+
+    async def single_flight(self, key: str, ttl: float, produce: Callable[[], Awaitable[Any]],
+                            wait: float = 30.0) -> Any:
+        """Cached value for `key`, or produce() it once for all waiting requests on every worker.
+
+        Concurrent callers in this process share one task; other workers wait
+        on a shared lock and then read what the first one stored. A None
+        result is returned but not cached.
+        """
+        value = await self.get(key)
+        if value is not None:
+            return value
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = asyncio.ensure_future(self._fill(key, ttl, produce, wait))
+            flight.add_done_callback(lambda _: self._flights.pop(key, None))
+        return await asyncio.shield(flight)
+
+    async def _fill(self, key: str, ttl: float, produce, wait: float):
+        async with self.lock(f"fill:{key}", ttl=wait, wait=wait):
+            # Whether or not the lock was taken, another worker may have filled it meanwhile
+            value = await self.get(key)
+            if value is None:
+                value = await produce()
+                if value is not None:
+                    await self.set(key, value, ttl)
+            return value
+
+
+class InMemorySharedState(SharedState):
+    """Process-local stand-in with the same semantics"""
+
+    def __init__(self, clock=time.monotonic):
+        super().__init__()
+        self.clock = clock
+        self._values: Dict[str, Tuple[Any, float]] = {}
+        self._locks: Dict[str, Tuple[str, float]] = {}
+
+    def _live(self, store: Dict[str, Tuple[Any, float]], key: str):
+        entry = store.get(key)
+        if entry is not None and entry[1] <= self.clock():
+            del store[key]
+            return None
+        return entry
+
+    async def get(self, key: str) -> Any:
+        entry = self._live(self._values, key)
+        return entry[0] if entry else None
+
+    async def set(self, key: str, value: Any, ttl: float):
+        self._values[key] = (value, self.clock() + ttl)
+
+    async def delete(self, key: str):
+        self._values.pop(key, None)
+
+    async def incr(self, key: str, ttl: float, amount: int = 1) -> int:
+        entry = self._live(self._values, key)
+        value, expires_at = entry if entry else (0, self.clock() + ttl)
+        self._values[key] = (value + amount, expires_at)
+        return value + amount
+
+    async def try_lock(self, name: str, ttl: float) -> Optional[str]:
+        if self._live(self._locks, name):
+            return None
+        token = uuid.uuid4().hex
+        self._locks[name] = (token, self.clock() + ttl)
+        return token
+
+    async def unlock(self, name: str, token: str):
+        entry = self._locks.get(name)
+        if entry and entry[0] == token:
+            del self._locks[name]
+
+
+class MongoSharedState(SharedState):
+    """Entries are documents {_id, value, expires_at}; locks are `lock:<name>` documents with an owner"""
+
+    def __init__(self, collection):
+        super().__init__()
+        self.collection = collection
+
+    async def create_indexes(self):
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def get(self, key: str) -> Any:
+        doc = await self.collection.find_one({"_id": key, "expires_at": {"$gt": datetime.now(timezone.utc)}})
+        return doc['value'] if doc else None
+
+    async def set(self, key: str, value: Any, ttl: float):
+        await self.collection.update_one(
+            {"_id": key},
+            {"$set": {"value": value, "expires_at": datetime.now(timezone.utc) + timedelta(seconds=ttl)}},
+            upsert=True
+        )
+
+    async def delete(self, key: str):
+        await self.collection.delete_one({"_id": key})
+
+    async def incr(self, key: str, ttl: float, amount: int = 1) -> int:
+        now = datetime.now(timezone.utc)
+        # One pipeline update restarts an expired window (the TTL monitor only runs once a minute) or adds to it
+        live = {"$gt": ["$expires_at", now]}
+        doc = await self.collection.find_one_and_update(
+            {"_id": key},
+            [{"$set": {
+                "value": {"$cond": [live, {"$add": ["$value", amount]}, amount]},
+                "expires_at": {"$cond": [live, "$expires_at", now + timedelta(seconds=ttl)]}
+            }}],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return doc['value']
+
+    async def try_lock(self, name: str, ttl: float) -> Optional[str]:
+        key = f"lock:{name}"
+        token = uuid.uuid4().hex
+        now = datetime.now(timezone.utc)
+        expires_at = now + timedelta(seconds=ttl)
+        try:
+            await self.collection.insert_one({"_id": key, "owner": token, "expires_at": expires_at})
+            return token
+        except DuplicateKeyError:
+            pass
+        # Take over a lock whose holder died without releasing it
+        result = await self.collection.update_one(
+            {"_id": key, "expires_at": {"$lte": now}},
+            {"$set": {"owner": token, "expires_at": expires_at}}
+        )
+        return token if result.modified_count else None
+
+    async def unlock(self, name: str, token: str):
+        await self.collection.delete_one({"_id": f"lock:{name}", "owner": token})
+
+
+def create_shared_state(backend: Optional[str], db=None) -> SharedState:
+    if not backend or backend == 'memory':
+        return InMemorySharedState()
+    if backend == 'mongo':
+        if db is None:
+            raise ValueError("SHARED_STATE_BACKEND=mongo needs a database")
+        return MongoSharedState(db.shared_state)
+    raise ValueError(f"Unsupported shared state backend: {backend}")
@@ -0,0 +1,149 @@
+"""Multilingual tokenization for the per-user chat search index.
+
+Text is NFKC-normalized and case-folded, then split into runs of
+letters, digits and combining marks (so Devanagari, Tamil or Arabic
+words with vowel signs stay whole). Scripts written without spaces
+(Chinese, Japanese, Korean, Thai, Lao, Khmer, Myanmar) have no word
+boundaries to split on, so their runs are indexed as overlapping
+character bigrams plus single characters, the usual approach of
+search engines without a dictionary segmenter; a query for 光合作用
+becomes 光合, 合作, 作用 and matches wherever those pairs all occur.
+English plurals are folded ("equations" finds "equation") and a short
+stopword list is dropped.
+
+`search_terms` is what a document stores (unique terms, capped) and
+`merged_terms` their union over several texts; `query_terms` applies
+the same analysis to a query, most selective term first; `highlights`
+finds the spans of a text that match.
+
+Configuration:
+    CHAT_SEARCH_MAX_TERMS    unique terms indexed per message (default 1024)
+"""
+import os
+import re
+import unicodedata
+from typing import Dict, Iterable, Iterator, List, Sequence, Set, Tuple
+
+MAX_TERMS = int(os.environ.get('CHAT_SEARCH_MAX_TERMS', '1024'))
+
+# \w covers letters and digits; these ranges add the combining marks (vowel signs, viramas, diacritics)
+_MARKS = (
+    '\u0300-\u036f\u0483-\u0489\u0591-\u05c7\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed'
+    '\u0900-\u0dff\u0e00-\u0eff\u0f00-\u0fff\u1000-\u109f\u1780-\u17ff\u1ab0-\u1aff\u1dc0-\u1dff'
+    '\u20d0-\u20ff\u3099\u309a\ufe20-\ufe2f'
+)
+_TOKEN = re.compile(rf"(?:[^\W_]|[{_MARKS}])+")
+# Thai, Lao, Myanmar, Khmer, kana, CJK ideographs and Hangul syllables
+_UNSPACED = re.compile(
+    '[\u0e00-\u0eff\u1000-\u109f\u1780-\u17ff\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+'
+)
+
+# Bump when tokenization changes, so CHAT_SEARCH_MIGRATIONS rebuild stored terms
+TERMS_VERSION = 2
+
+# Plurals the suffix rules get wrong, among words students often search for
+IRREGULAR_PLURALS = {'quizzes': 'quiz', 'buses': 'bus', 'gases': 'gas', 'indices': 'index', 'matrices': 'matrix'}
+
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'do', 'does', 'for', 'from', 'has', 'have', 'i',
+    'if', 'in', 'into', 'is', 'it', 'its', 'me', 'my', 'of', 'on', 'or', 'so', 'that', 'the', 'their', 'then',
+    'there', 'these', 'this', 'to', 'was', 'we', 'were', 'will', 'with', 'you', 'your',
+    # Question words, so "what is osmosis" finds answers that never say "what"
+    'how', 'what', 'when', 'where', 'which', 'who', 'why',
+}
+
+
+def fold(word: str) -> str:
+    """Singular form of an English plural; other words unchanged"""
+    if not word.isascii() or len(word) <= 3 or word[-1] != 's' or word.isdigit():
+        return word
+    if word in IRREGULAR_PLURALS:
+        return IRREGULAR_PLURALS[word]
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    # "classes", "boxes", "matches", "wishes"; "uses", "causes" and "sizes" only lose the s
+    if word.endswith(('sses', 'xes', 'zzes', 'ches', 'shes')):
+        return word[:-2]
+    if word.endswith(('ss', 'us', 'is')):
+        return word
+    return word[:-1]
+
+
+def normalize(text: str) -> str:
+    return unicodedata.normalize('NFKC', text).casefold()
+
+
+def _tokens(word: str, unigrams: bool) -> Iterator[str]:
+    """Terms of one folded token: whole words, and bigrams for runs of unspaced scripts"""
+    position = 0
+    for run in _UNSPACED.finditer(word):
+        if run.start() > position:
+            yield fold(word[position:run.start()])
+        chars = run.group()
+        if len(chars) == 1 or unigrams:
+            yield from chars
+        for i in range(len(chars) - 1):
+            yield chars[i:i + 2]
+        position = run.end()
+    if position < len(word):
+        yield fold(word[position:])
+
+
+def tokenize(text: str, unigrams: bool = True) -> Iterator[str]:
+    for match in _TOKEN.finditer(normalize(text)):
+        yield from _tokens(match.group(), unigrams)
+
+
+def search_terms(text: str) -> List[str]:
+    """Unique index terms of a text in order of first appearance, capped at MAX_TERMS"""
+    terms = dict.fromkeys(term for term in tokenize(text or '') if term not in STOPWORDS)
+    return list(terms)[:MAX_TERMS]
+
+
+def merged_terms(texts: Iterable[str]) -> List[str]:
+    """Union of the index terms of several texts, such as an archived session, uncapped"""
+    terms: Dict[str, None] = {}
+    for text in texts:
+        terms.update(dict.fromkeys(search_terms(text)))
+    return list(terms)
+
+
+def query_terms(query: str) -> List[str]:
+    """Terms a matching document must all contain, longest (usually rarest) first"""
+    # Single characters of unspaced scripts only stand alone when the query has nothing longer
+    terms = dict.fromkeys(term for term in tokenize(query, unigrams=False) if term not in STOPWORDS)
+    return sorted(terms, key=len, reverse=True)
+
+
+def highlights(text: str, terms: Sequence[str]) -> List[Tuple[int, int]]:
+    """Merged (start, end) spans of `text` whose terms are in `terms`"""
+    wanted: Set[str] = set(terms)
+    spans = []
+    for match in _TOKEN.finditer(text):
+        word = match.group()
+        folded = normalize(word)
+        if len(folded) != len(word):
+            # NFKC or case folding changed the length (ß, ligatures); mark the whole word on any hit
+            if wanted.intersection(_tokens(folded, True)):
+                spans.append((match.start(), match.end()))
+            continue
+        position = 0
+        for run in _UNSPACED.finditer(folded):
+            if run.start() > position and fold(folded[position:run.start()]) in wanted:
+                spans.append((match.start() + position, match.start() + run.start()))
+            for i in range(run.start(), run.end()):
+                if folded[i:i + 2] in wanted and i + 1 < run.end():
+                    spans.append((match.start() + i, match.start() + i + 2))
+                elif folded[i] in wanted:
+                    spans.append((match.start() + i, match.start() + i + 1))
+            position = run.end()
+        if position < len(folded) and fold(folded[position:]) in wanted:
+            spans.append((match.start() + position, match.end()))
+    spans.sort()
+    merged: List[Tuple[int, int]] = []
+    for start, end in spans:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    return merged
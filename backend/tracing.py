@@ -0,0 +1,332 @@
+"""Lightweight OpenTelemetry-compatible tracing.
+
+Spans carry W3C trace context (`traceparent`), nest through a contextvar
+(Motor copies the context into its executor threads, so command listener
+spans land under the handler span), and are exported as OTLP-shaped JSON
+lines to stderr or a local file for offline inspection. An incoming
+traceparent with the sampled flag set is always recorded; one without it,
+like those the web app sends, is sampled by TRACING_SAMPLE_RATIO.
+
+Configuration:
+    TRACING_EXPORTER      none (default), console or file
+    TRACING_FILE          output path for the file exporter (traces.jsonl)
+    TRACING_SAMPLE_RATIO  fraction of new or unsampled incoming traces to record (1.0)
+"""
+import contextvars
+import json
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from pymongo import monitoring
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar('current_span', default=None)
+
+
+class SpanContext:
+    __slots__ = ('trace_id', 'span_id', 'sampled')
+
+    def __init__(self, trace_id: str, span_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[SpanContext]:
+    """Parse a W3C traceparent header: 00-<trace id>-<parent id>-<flags>"""
+    if not header:
+        return None
+    parts = header.strip().split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    version, trace_id, span_id, flags = parts
+    if version == 'ff' or trace_id == '0' * 32 or span_id == '0' * 16:
+        return None
+    try:
+        sampled = bool(int(flags, 16) & 1)
+        int(trace_id, 16)
+        int(span_id, 16)
+    except ValueError:
+        return None
+    return SpanContext(trace_id, span_id, sampled)
+
+
+def format_traceparent(context: SpanContext) -> str:
+    return f"00-{context.trace_id}-{context.span_id}-{'01' if context.sampled else '00'}"
+
+
+class Span:
+    __slots__ = ('tracer', 'name', 'kind', 'context', 'parent_id', 'start_ns', 'end_ns',
+                 'attributes', 'status', 'events')
+
+    def __init__(self, tracer, name: str, kind: str, context: SpanContext, parent_id: Optional[str],
+                 attributes: Optional[Dict[str, Any]] = None, start_ns: Optional[int] = None):
+        self.tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.context = context
+        self.parent_id = parent_id
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+        self.status = 'UNSET'
+        self.events: List[Dict[str, Any]] = []
+
+    @property
+    def recording(self) -> bool:
+        return self.context.sampled
+
+    def set_attribute(self, key: str, value: Any):
+        if self.context.sampled:
+            self.attributes[key] = value
+
+    def record_exception(self, error: BaseException):
+        if self.context.sampled:
+            self.status = 'ERROR'
+            self.events.append({
+                "name": "exception",
+                "timeUnixNano": time.time_ns(),
+                "attributes": {"exception.type": type(error).__name__, "exception.message": str(error)}
+            })
+
+    def end(self, end_ns: Optional[int] = None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = end_ns or time.time_ns()
+        if self.context.sampled:
+            self.tracer.export(self)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        return {
+            "traceId": self.context.trace_id,
+            "spanId": self.context.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "kind": f"SPAN_KIND_{self.kind}",
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "durationMs": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "status": {"code": f"STATUS_CODE_{self.status}"},
+            "events": self.events,
+        }
+
+
+class ConsoleSpanExporter:
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stderr
+
+    def export(self, spans: List[Span]):
+        for span in spans:
+            self.stream.write(json.dumps(span.to_otlp(), default=str) + '\n')
+        self.stream.flush()
+
+    def shutdown(self):
+        pass
+
+
+class FileSpanExporter:
+    """Appends one OTLP-shaped JSON object per span to a local file"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: List[Span]):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for span in spans:
+                f.write(json.dumps(span.to_otlp(), default=str) + '\n')
+
+    def shutdown(self):
+        pass
+
+
+class Tracer:
+    def __init__(self, exporter=None, sample_ratio: float = 1.0, service_name: str = 'eduntra-backend',
+                 batch_size: int = 64):
+        self.exporter = exporter
+        self.sample_ratio = max(0.0, min(1.0, sample_ratio))
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self._pending: List[Span] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, environ=os.environ) -> "Tracer":
+        kind = environ.get('TRACING_EXPORTER', 'none').lower()
+        exporter = None
+        if kind == 'console':
+            exporter = ConsoleSpanExporter()
+        elif kind == 'file':
+            exporter = FileSpanExporter(environ.get('TRACING_FILE', 'traces.jsonl'))
+        # Spans are exported per span with the console exporter so they show up immediately
+        return cls(exporter, float(environ.get('TRACING_SAMPLE_RATIO', '1.0')),
+                   batch_size=1 if kind == 'console' else 64)
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def _should_sample(self, trace_id: str) -> bool:
+        # Same rule as OpenTelemetry's TraceIdRatioBased sampler
+        return int(trace_id[16:], 16) < self.sample_ratio * (1 << 64)
+
+    def start_span(self, name: str, kind: str = 'INTERNAL', attributes: Optional[Dict[str, Any]] = None,
+                   parent: Optional[SpanContext] = None, start_ns: Optional[int] = None) -> Span:
+        if parent is None:
+            current = _current_span.get()
+            parent = current.context if current is not None else None
+
+        span_id = f"{random.getrandbits(64):016x}"
+        if parent is not None:
+            # A sampled parent is always followed; an unsampled one (browsers send their trace ids
+            # unsampled) gets the ratio, which is keyed on the trace id so every span agrees
+            sampled = self.enabled and (parent.sampled or self._should_sample(parent.trace_id))
+            context = SpanContext(parent.trace_id, span_id, sampled)
+            parent_id = parent.span_id
+        else:
+            trace_id = f"{random.getrandbits(128):032x}"
+            context = SpanContext(trace_id, span_id, self.enabled and self._should_sample(trace_id))
+            parent_id = None
+        return Span(self, name, kind, context, parent_id, attributes, start_ns)
+
+    @contextmanager
+    def span(self, name: str, kind: str = 'INTERNAL', attributes: Optional[Dict[str, Any]] = None,
+             parent: Optional[SpanContext] = None):
+        span = self.start_span(name, kind, attributes, parent)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_exception(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+    def export(self, span: Span):
+        span.attributes.setdefault('service.name', self.service_name)
+        with self._lock:
+            self._pending.append(span)
+            if len(self._pending) < self.batch_size:
+                return
+            batch, self._pending = self._pending, []
+        self.exporter.export(batch)
+
+    def flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if batch and self.exporter is not None:
+            self.exporter.export(batch)
+
+    def shutdown(self):
+        self.flush()
+        if self.exporter is not None:
+            self.exporter.shutdown()
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+class MongoCommandTracer(monitoring.CommandListener):
+    """Turns pymongo command events into client spans under the active span"""
+
+    def __init__(self, tracer: Tracer):
+        self.tracer = tracer
+        self._inflight: Dict[tuple, Span] = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        if _current_span.get() is None or not self.tracer.enabled:
+            return
+        collection = event.command.get(event.command_name)
+        span = self.tracer.start_span(f"mongodb.{event.command_name}", kind='CLIENT', attributes={
+            "db.system": "mongodb",
+            "db.name": event.database_name,
+            "db.operation": event.command_name,
+            "db.mongodb.collection": collection if isinstance(collection, str) else "",
+        })
+        with self._lock:
+            self._inflight[(event.request_id, event.operation_id)] = span
+
+    def _finish(self, event, error: Optional[str] = None):
+        with self._lock:
+            span = self._inflight.pop((event.request_id, event.operation_id), None)
+        if span is None:
+            return
+        if error:
+            span.status = 'ERROR'
+            span.set_attribute("db.mongodb.error", error)
+        span.end(span.start_ns + event.duration_micros * 1000)
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event, str(event.failure.get('errmsg', 'command failed')))
+
+
+def aiohttp_trace_config(tracer: Tracer):
+    """aiohttp TraceConfig that wraps upstream requests in client spans and forwards traceparent"""
+    import aiohttp
+
+    async def on_request_start(session, ctx, params):
+        ctx.span = tracer.start_span(f"HTTP {params.method}", kind='CLIENT', attributes={
+            "http.method": params.method,
+            "http.url": str(params.url),
+        })
+        if ctx.span.recording:
+            params.headers['traceparent'] = format_traceparent(ctx.span.context)
+
+    async def on_request_end(session, ctx, params):
+        ctx.span.set_attribute("http.status_code", params.response.status)
+        ctx.span.end()
+
+    async def on_request_exception(session, ctx, params):
+        ctx.span.record_exception(params.exception)
+        ctx.span.end()
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_exception)
+    return trace_config
+
+
+class TracingMiddleware:
+    """ASGI middleware that opens the server span and joins the caller's trace"""
+
+    def __init__(self, app, tracer: Tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self.tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get('headers') or ())
+        parent = parse_traceparent(headers.get(b'traceparent', b'').decode('latin-1'))
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                span.set_attribute("http.status_code", message['status'])
+                if message['status'] >= 500:
+                    span.status = 'ERROR'
+            await send(message)
+
+        with self.tracer.span(f"{scope['method']} {scope['path']}", kind='SERVER', parent=parent, attributes={
+            "http.method": scope['method'],
+            "http.target": scope['path'],
+        }) as span:
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                route = scope.get('route')
+                if route is not None:
+                    span.name = f"{scope['method']} {route.path}"
+                    span.set_attribute("http.route", route.path)
@@ -0,0 +1,323 @@
+"""Voice questions: spooled audio uploads and an offline transcription pool.
+
+Recordings arrive as the raw request body and are written to a temporary
+file in VOICE_UPLOAD_DIR as the chunks come in, so a worker never holds
+more than one write buffer of audio in memory however long the clip is.
+Uploads past VOICE_MAX_BYTES are cut off as soon as the limit is crossed.
+
+Transcription is CPU-bound, so it runs in TRANSCRIBER_WORKERS spawned
+worker processes, each loading the transcriber once. A clip waits for an
+idle worker and then runs on it alone. At most TRANSCRIBER_MAX_PENDING
+clips wait or run per API worker; past that, callers are told to retry
+instead of piling up. A clip still running TRANSCRIBER_TIMEOUT seconds
+after it started is abandoned and only its worker is terminated and
+replaced, since a decoder stuck in native code cannot be interrupted any
+other way; time spent waiting for a worker does not count.
+
+TRANSCRIBER picks the engine:
+    whisper   faster-whisper on the CPU (int8), when the package is installed
+    stub      fixed text (TRANSCRIBER_STUB_TEXT) for tests and benchmarks,
+              burning TRANSCRIBER_STUB_RTF seconds of CPU per second of audio
+    off       voice questions are refused
+    module:factory   any importable factory returning transcribe(path, language) -> dict
+
+Configuration:
+    TRANSCRIBER               whisper, stub, off or module:factory (default whisper when installed, else off)
+    TRANSCRIBER_MODEL         faster-whisper model name or path (default base)
+    TRANSCRIBER_THREADS       CPU threads per transcription worker (default 1)
+    TRANSCRIBER_WORKERS       transcription processes (default 1)
+    TRANSCRIBER_MAX_PENDING   clips queued or running per API worker (default 4 per transcription worker)
+    TRANSCRIBER_TIMEOUT       seconds a clip may run before it is abandoned (default 60)
+    VOICE_UPLOAD_DIR          where uploads are spooled (default <tmp>/eduntra-voice)
+    VOICE_MAX_BYTES           largest accepted recording (default 10 MiB)
+"""
+import asyncio
+import importlib
+import importlib.util
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Set, Tuple
+
+from metrics import TRANSCRIPTION_LATENCY, TRANSCRIPTION_QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+# Audio is written to disk in buffers of this size
+WRITE_BUFFER = 256 * 1024
+BUSY_RETRY_AFTER = 5
+# Recording formats accepted as the body, and the file suffix decoders use to recognize them
+AUDIO_TYPES = {
+    'audio/wav': '.wav', 'audio/x-wav': '.wav', 'audio/wave': '.wav', 'audio/webm': '.webm',
+    'audio/ogg': '.ogg', 'audio/mpeg': '.mp3', 'audio/mp4': '.m4a', 'audio/x-m4a': '.m4a',
+    'audio/aac': '.aac', 'audio/flac': '.flac', 'application/octet-stream': '',
+}
+BACKENDS = {'whisper': 'voice:whisper_transcriber', 'stub': 'voice:stub_transcriber'}
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class TranscriberBusy(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("Too many voice questions are waiting to be transcribed")
+        self.retry_after = retry_after
+
+
+class TranscriptionTimeout(Exception):
+    pass
+
+
+class TranscriptionFailed(Exception):
+    pass
+
+
+class Transcript:
+    __slots__ = ('text', 'language', 'duration')
+
+    def __init__(self, text: str, language: Optional[str] = None, duration: Optional[float] = None):
+        self.text = text
+        # Language the transcriber heard, e.g. "en" or "hi", when it detects one
+        self.language = language
+        # Seconds of audio
+        self.duration = duration
+
+
+# ========== TRANSCRIBERS (run in the pool workers) ==========
+
+def wav_duration(path: str) -> Optional[float]:
+    try:
+        with wave.open(path, 'rb') as audio:
+            return audio.getnframes() / float(audio.getframerate() or 1)
+    except (wave.Error, EOFError):
+        return None
+
+
+def stub_transcriber() -> Callable[[str, Optional[str]], Dict[str, Any]]:
+    """Deterministic stand-in: the configured text, after CPU work proportional to the clip length"""
+    text = os.environ.get('TRANSCRIBER_STUB_TEXT', 'What is photosynthesis?')
+    real_time_factor = float(os.environ.get('TRANSCRIBER_STUB_RTF', '0'))
+
+    def transcribe(path: str, language: Optional[str]) -> Dict[str, Any]:
+        # Undecodable clips are timed as 16 kHz 16-bit mono
+        duration = wav_duration(path)
+        if duration is None:
+            duration = os.path.getsize(path) / 32000
+        deadline = time.process_time() + duration * real_time_factor
+        while time.process_time() < deadline:
+            pass
+        return {"text": text, "language": language or 'en', "duration": duration}
+
+    return transcribe
+
+
+def whisper_transcriber() -> Callable[[str, Optional[str]], Dict[str, Any]]:
+    from faster_whisper import WhisperModel
+
+    model = WhisperModel(os.environ.get('TRANSCRIBER_MODEL', 'base'), device='cpu', compute_type='int8',
+                         cpu_threads=int(os.environ.get('TRANSCRIBER_THREADS', '1')))
+
+    def transcribe(path: str, language: Optional[str]) -> Dict[str, Any]:
+        segments, info = model.transcribe(path, language=language, beam_size=1, vad_filter=True)
+        text = ' '.join(segment.text.strip() for segment in segments)
+        return {"text": text, "language": info.language, "duration": info.duration}
+
+    return transcribe
+
+
+_worker_transcribe: Optional[Callable[[str, Optional[str]], Dict[str, Any]]] = None
+
+
+def load_transcriber(factory: str):
+    """Pool initializer: build the transcriber once per worker process"""
+    global _worker_transcribe
+    module, _, name = factory.partition(':')
+    _worker_transcribe = getattr(importlib.import_module(module), name)()
+
+
+def transcribe_file(path: str, language: Optional[str]) -> Dict[str, Any]:
+    """Runs in a pool worker"""
+    return _worker_transcribe(path, language)
+
+
+# ========== UPLOADS ==========
+
+class VoiceSpool:
+    def __init__(self, directory: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.directory = directory or os.environ.get('VOICE_UPLOAD_DIR') or \
+            os.path.join(tempfile.gettempdir(), 'eduntra-voice')
+        self.max_bytes = max_bytes or int(os.environ.get('VOICE_MAX_BYTES', str(10 * 1024 * 1024)))
+
+    @staticmethod
+    def suffix(content_type: Optional[str]) -> Optional[str]:
+        """File suffix for an accepted recording type, None for anything else"""
+        return AUDIO_TYPES.get((content_type or '').split(';')[0].strip().lower())
+
+    async def write(self, chunks: AsyncIterator[bytes], suffix: str = '') -> Tuple[str, int]:
+        """Spool an upload to a new file; returns its path and size"""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix='voice-', suffix=suffix, dir=self.directory)
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                buffer = bytearray()
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise UploadTooLarge(f"Recordings are limited to {self.max_bytes / (1024 * 1024):g} MiB")
+                    buffer += chunk
+                    if len(buffer) >= WRITE_BUFFER:
+                        await asyncio.to_thread(out.write, bytes(buffer))
+                        buffer.clear()
+                if buffer:
+                    await asyncio.to_thread(out.write, bytes(buffer))
+        except BaseException:
+            self.discard(path)
+            raise
+        return path, size
+
+    @staticmethod
+    def discard(path: str):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def purge(self, older_than: float = 3600) -> int:
+        """Remove recordings left behind by a worker that died mid-request"""
+        if not os.path.isdir(self.directory):
+            return 0
+        cutoff = time.time() - older_than
+        removed = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith('voice-') and entry.stat().st_mtime < cutoff:
+                self.discard(entry.path)
+                removed += 1
+        return removed
+
+
+# ========== TRANSCRIPTION POOL ==========
+
+def default_backend() -> str:
+    return os.environ.get('TRANSCRIBER') or ('whisper' if importlib.util.find_spec('faster_whisper') else 'off')
+
+
+class Transcriber:
+    def __init__(self, backend: Optional[str] = None, workers: Optional[int] = None,
+                 max_pending: Optional[int] = None, timeout: Optional[float] = None):
+        self.backend = (backend or default_backend()).strip()
+        self.workers = workers or int(os.environ.get('TRANSCRIBER_WORKERS', '1'))
+        self.max_pending = max_pending or int(os.environ.get('TRANSCRIBER_MAX_PENDING', str(4 * self.workers)))
+        self.timeout = timeout or float(os.environ.get('TRANSCRIBER_TIMEOUT', '60'))
+        self.pending = 0
+        self._idle: Optional[asyncio.Queue] = None
+        self._running: Set[ProcessPoolExecutor] = set()
+
+    @property
+    def available(self) -> bool:
+        return self.backend != 'off'
+
+    @property
+    def factory(self) -> str:
+        if self.backend in BACKENDS:
+            return BACKENDS[self.backend]
+        if ':' not in self.backend:
+            raise ValueError(f"TRANSCRIBER must be whisper, stub, off or module:factory, not {self.backend}")
+        return self.backend
+
+    def _idle_workers(self) -> asyncio.Queue:
+        """Workers free to take a clip; None stands for one not started yet"""
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+            for _ in range(self.workers):
+                self._idle.put_nowait(None)
+        return self._idle
+
+    def _spawn(self) -> ProcessPoolExecutor:
+        # One process per executor, so a stuck clip can be killed without touching the others.
+        # spawn: forking a process that runs an event loop and driver threads is unsafe
+        worker = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'),
+                                     initializer=load_transcriber, initargs=(self.factory,))
+        self._running.add(worker)
+        return worker
+
+    def _terminate(self, worker: ProcessPoolExecutor):
+        # shutdown() leaves a running clip to finish; a stuck decoder would never let the process exit
+        processes = list((worker._processes or {}).values())
+        worker.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+        self._running.discard(worker)
+
+    async def transcribe(self, path: str, language: Optional[str] = None) -> Transcript:
+        if self.pending >= self.max_pending:
+            raise TranscriberBusy(BUSY_RETRY_AFTER)
+        self.pending += 1
+        TRANSCRIPTION_QUEUE_DEPTH.set(self.pending)
+        start = time.perf_counter()
+        outcome = 'ok'
+        idle = self._idle_workers()
+        loop = asyncio.get_running_loop()
+        worker = job = None
+        taken = False
+        try:
+            worker = await idle.get()
+            taken = True
+            if worker is None:
+                worker = self._spawn()
+            # The worker is idle, so the clip starts now and the timeout measures only its own run
+            job = worker.submit(transcribe_file, path, language)
+            result = await asyncio.wait_for(asyncio.wrap_future(job), self.timeout)
+        except asyncio.TimeoutError:
+            outcome = 'timeout'
+            self._terminate(worker)
+            worker = None
+            raise TranscriptionTimeout()
+        except BrokenProcessPool:
+            outcome = 'error'
+            self._terminate(worker)
+            worker = None
+            raise TranscriptionFailed("The transcription worker stopped")
+        except asyncio.CancelledError:
+            if job is not None and not job.done():
+                # The client went away mid-clip; the worker is free again once the clip finishes
+                job.add_done_callback(lambda _, worker=worker: loop.call_soon_threadsafe(idle.put_nowait, worker))
+                taken = False
+            raise
+        except Exception as e:
+            outcome = 'error'
+            logger.warning(f"Transcription failed: {e}")
+            raise TranscriptionFailed(str(e) or e.__class__.__name__) from e
+        finally:
+            if taken:
+                # Back to the idle queue, or an empty slot in place of a terminated worker
+                idle.put_nowait(worker)
+            self.pending -= 1
+            TRANSCRIPTION_QUEUE_DEPTH.set(self.pending)
+            TRANSCRIPTION_LATENCY.observe(time.perf_counter() - start, outcome=outcome)
+        return Transcript((result.get('text') or '').strip(), result.get('language'), result.get('duration'))
+
+    async def prewarm(self):
+        """Start the workers and load the model, so the first voice question is not the slow one"""
+        if not self.available:
+            return
+        idle = self._idle_workers()
+        loop = asyncio.get_running_loop()
+        workers = [await idle.get() for _ in range(self.workers)]
+        workers = [worker or self._spawn() for worker in workers]
+        try:
+            await asyncio.gather(*(loop.run_in_executor(worker, time.sleep, 0) for worker in workers))
+        finally:
+            for worker in workers:
+                idle.put_nowait(worker)
+
+    def close(self):
+        for worker in list(self._running):
+            self._terminate(worker)
+        self._idle = None
@@ -217,7 +217,7 @@ const LiveClasses = () => {
                     </div>
                     <div className="flex items-center gap-2 text-gray-300">
                       <Users className="h-4 w-4 text-green-400" />
-                      {classItem.students?.length || 0} students
+                      {classItem.enrolled_count ?? classItem.students?.length ?? 0} students
                     </div>
                     <div className="flex items-center gap-2 text-gray-300">
                       <Clock className="h-4 w-4 text-orange-400" />
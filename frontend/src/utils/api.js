@@ -10,12 +10,23 @@ const api = axios.create({
   }
 });
 
+const randomHex = (bytes) => {
+  const values = new Uint8Array(bytes);
+  window.crypto.getRandomValues(values);
+  return Array.from(values, (b) => b.toString(16).padStart(2, '0')).join('');
+};
+
+// W3C trace context so backend spans can be tied to the UI action. Left unsampled (-00)
+// so the backend applies its own sample ratio instead of recording every request.
+const traceparent = () => `00-${randomHex(16)}-${randomHex(8)}-00`;
+
 // Add auth token to requests
 api.interceptors.request.use((config) => {
   const token = localStorage.getItem('eduntra_token');
   if (token) {
     config.headers.Authorization = `Bearer ${token}`;
   }
+  config.headers.traceparent = traceparent();
   return config;
 });
 
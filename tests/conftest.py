@@ -0,0 +1,52 @@
+"""Fixtures shared by the backend tests.
+
+The tests drive the backend modules with the benchmark harness's fake
+LlmChat (configurable latency, slow calls and injected faults), so they
+need the packages in backend/benchmarks/requirements.txt.
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / 'backend'
+sys.path.insert(0, str(BACKEND_DIR / 'benchmarks'))
+sys.path.insert(0, str(BACKEND_DIR))
+
+from harness import FakeLlmConfig, build_fake_llm, fake_database, import_server  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return 'asyncio'
+
+
+@pytest.fixture
+def fake_llm():
+    """Fake LLM settings; tests change latency, slow_rate or fault_rate as they go"""
+    return FakeLlmConfig(latency=0.01, token_rate=1e6, jitter=0.0)
+
+
+@pytest.fixture
+def server(fake_llm):
+    """The server module answering with fake_llm on an empty in-memory database"""
+    server = import_server(*build_fake_llm(fake_llm))
+    server.db = fake_database('eduntra_test')
+    return server
+
+
+@pytest.fixture
+async def client(server):
+    import httpx
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://test', timeout=30) as client:
+        yield client
+
+
+@pytest.fixture
+async def student(client):
+    """Authorization headers of a newly registered student"""
+    response = await client.post('/api/auth/register', json={
+        "email": "student@example.com", "name": "Student", "password": "correct horse", "role": "student"
+    })
+    return {"Authorization": f"Bearer {response.json()['token']}"}
@@ -0,0 +1,74 @@
+import pytest
+
+from metrics import LLM_ESCALATIONS
+from model_router import LARGE, SMALL, ModelRouter
+
+CAREER_SYSTEM = "You are a career counselor for students."
+
+
+@pytest.fixture
+def router():
+    return ModelRouter.from_env({})
+
+
+def test_short_factual_tutor_questions_use_the_small_tier(router):
+    assert router.classify("tutor_chat", "What is photosynthesis?") == SMALL
+
+
+@pytest.mark.parametrize("prompt", [
+    "Prove that the square root of 2 is irrational",
+    "Explain step by step how to differentiate x^2 sin(x)",
+    "Solve x^2 + 3 = 12 where y = 2x",
+    "Why? How? What? Which one?",
+    "Summarize this: " + "word " * 2000,
+])
+def test_long_or_complex_tutor_questions_use_the_large_tier(router, prompt):
+    assert router.classify("tutor_chat", prompt) == LARGE
+
+
+def test_endpoint_tiers_override_the_prompt(router):
+    assert router.classify("create_learning_path", "Python") == LARGE
+    assert router.classify("analyze_career", "Prove and derive " * 5) == SMALL
+
+
+def test_disabled_routing_sends_everything_to_the_large_tier():
+    router = ModelRouter.from_env({"LLM_ROUTING_ENABLED": "false"})
+    assert router.classify("fetch_jobs", "Python developer jobs") == LARGE
+
+
+def test_escalation_needs_a_distinct_large_model():
+    assert ModelRouter.from_env({}).escalation(SMALL) == LARGE
+    assert ModelRouter.from_env({}).escalation(LARGE) is None
+    assert ModelRouter.from_env({"LLM_MODEL_SMALL": "openai/gpt-4o"}).escalation(SMALL) is None
+
+
+@pytest.mark.anyio
+async def test_ask_llm_sends_each_tier_to_its_model(server, fake_llm):
+    await server.ask_llm("tutor_chat", "router-small", "You are a tutor", "What is photosynthesis?")
+    await server.ask_llm("tutor_chat", "router-large", "You are a tutor", "Prove that there are infinitely many primes")
+
+    assert [call["model"] for call in fake_llm.calls] == ["gpt-4o-mini", "gpt-4o"]
+
+
+@pytest.mark.anyio
+async def test_malformed_json_from_the_small_tier_escalates(server, fake_llm):
+    fake_llm.malformed = {"gpt-4o-mini": 1.0}
+    escalations = LLM_ESCALATIONS.value(endpoint="analyze_career", source=SMALL, target=LARGE)
+
+    data = await server.ask_llm_json("analyze_career", "router-escalate", CAREER_SYSTEM, "Interests: coding",
+                                     required="careers")
+
+    assert len(data["careers"]) == 5
+    assert [call["model"] for call in fake_llm.calls] == ["gpt-4o-mini", "gpt-4o"]
+    assert LLM_ESCALATIONS.value(endpoint="analyze_career", source=SMALL, target=LARGE) == escalations + 1
+
+
+@pytest.mark.anyio
+async def test_malformed_json_from_the_large_tier_is_not_retried(server, fake_llm):
+    fake_llm.malformed = {"gpt-4o-mini": 1.0, "gpt-4o": 1.0}
+
+    with pytest.raises(ValueError):
+        await server.ask_llm_json("analyze_career", "router-fail", CAREER_SYSTEM, "Interests: coding",
+                                  required="careers")
+
+    assert [call["model"] for call in fake_llm.calls] == ["gpt-4o-mini", "gpt-4o"]
@@ -0,0 +1,114 @@
+import asyncio
+import random
+import time
+
+import pytest
+
+from harness import build_fake_llm
+from metrics import LLM_CALL_OUTCOMES, LLM_HEDGE_WINS, LLM_HEDGES, LLM_RETRIES
+from resilience import CallPolicy, DeadlineExceeded, ResilientCaller
+
+pytestmark = pytest.mark.anyio
+
+
+def llm_call(config, model='gpt-4o'):
+    chat_class, message_class = build_fake_llm(config)
+
+    def make_call():
+        chat = chat_class(session_id='test', system_message='You are a tutor').with_model('openai', model)
+        return chat.send_message(message_class('Explain recursion'))
+
+    return make_call
+
+
+def after_first_call(make_call, config, **changes):
+    """make_call, with config fields changed once the first call has drawn its latency and fault"""
+    async def call():
+        started = asyncio.ensure_future(make_call())
+        await asyncio.sleep(0)
+        for name, value in changes.items():
+            setattr(config, name, value)
+        return await started
+
+    return call
+
+
+def caller(endpoint, **policy):
+    policy = CallPolicy(**policy)
+    return ResilientCaller({"tutor_chat": policy, endpoint: policy}, rng=random.Random(0))
+
+
+async def test_retries_after_a_fault(fake_llm):
+    fake_llm.fault_rate = 1.0
+    make_call = after_first_call(llm_call(fake_llm), fake_llm, fault_rate=0.0)
+    retries = LLM_RETRIES.value(endpoint='test_retry')
+
+    result = await caller('test_retry', deadline=2, backoff=0.01, hedge=False).call('test_retry', make_call)
+
+    assert result.startswith('Here is a clear explanation')
+    assert [call.get('fault', False) for call in fake_llm.calls] == [True, False]
+    assert LLM_RETRIES.value(endpoint='test_retry') == retries + 1
+
+
+async def test_hedges_a_slow_call_after_the_hedge_delay(fake_llm):
+    fake_llm.slow_rate, fake_llm.slow_factor = 1.0, 100
+    make_call = after_first_call(llm_call(fake_llm), fake_llm, slow_rate=0.0)
+    hedges, wins = LLM_HEDGES.value(endpoint='test_hedge'), LLM_HEDGE_WINS.value(endpoint='test_hedge')
+
+    start = time.perf_counter()
+    result = await caller('test_hedge', deadline=5, attempts=1, hedge_delay=0.1, min_hedge_delay=0.1).call(
+        'test_hedge', make_call)
+    elapsed = time.perf_counter() - start
+
+    assert result.startswith('Here is a clear explanation')
+    assert 0.1 <= elapsed < 0.5
+    assert LLM_HEDGES.value(endpoint='test_hedge') == hedges + 1
+    assert LLM_HEDGE_WINS.value(endpoint='test_hedge') == wins + 1
+
+
+async def test_serves_the_fallback_at_the_slo_and_cancels_the_call(fake_llm):
+    fake_llm.latency = 0.3
+    late = LLM_CALL_OUTCOMES.value(endpoint='test_fallback', outcome='late')
+
+    start = time.perf_counter()
+    result = await caller('test_fallback', deadline=2, slo=0.05, hedge=False).call(
+        'test_fallback', llm_call(fake_llm), fallback=lambda: 'fallback')
+
+    assert result == 'fallback'
+    assert time.perf_counter() - start < 0.2
+    # Nothing asked for the answer, so the call is not left running
+    await asyncio.sleep(0.5)
+    assert fake_llm.calls == []
+    assert LLM_CALL_OUTCOMES.value(endpoint='test_fallback', outcome='late') == late
+
+
+async def test_hands_a_late_answer_to_on_late_without_hedging(fake_llm):
+    fake_llm.latency = 0.2
+    kept = asyncio.Event()
+    answers = []
+
+    async def on_late(result):
+        answers.append(result)
+        kept.set()
+
+    hedges = LLM_HEDGES.value(endpoint='test_late')
+    result = await caller('test_late', deadline=2, slo=0.05, hedge_delay=0.1, min_hedge_delay=0.1).call(
+        'test_late', llm_call(fake_llm), fallback=lambda: 'fallback', on_late=on_late)
+
+    assert result == 'fallback'
+    await asyncio.wait_for(kept.wait(), 1)
+    assert answers[0].startswith('Here is a clear explanation')
+    assert len(fake_llm.calls) == 1
+    assert LLM_HEDGES.value(endpoint='test_late') == hedges
+
+
+async def test_raises_deadline_exceeded_without_a_fallback(fake_llm):
+    fake_llm.latency = 1.0
+    deadlines = LLM_CALL_OUTCOMES.value(endpoint='test_deadline', outcome='deadline')
+
+    start = time.perf_counter()
+    with pytest.raises(DeadlineExceeded):
+        await caller('test_deadline', deadline=0.1, hedge=False).call('test_deadline', llm_call(fake_llm))
+
+    assert time.perf_counter() - start < 0.5
+    assert LLM_CALL_OUTCOMES.value(endpoint='test_deadline', outcome='deadline') == deadlines + 1
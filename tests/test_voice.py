@@ -0,0 +1,108 @@
+import asyncio
+import io
+import os
+import wave
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+QUESTION = "What is photosynthesis?"
+
+
+def recording(seconds: float) -> bytes:
+    """16 kHz 16-bit mono WAV of silence"""
+    out = io.BytesIO()
+    with wave.open(out, 'wb') as audio:
+        audio.setnchannels(1)
+        audio.setsampwidth(2)
+        audio.setframerate(16000)
+        audio.writeframes(b'\0\0' * int(16000 * seconds))
+    return out.getvalue()
+
+
+@pytest.fixture
+def voice(server, tmp_path, monkeypatch):
+    """The stub transcriber in one worker process, spooling to tmp_path"""
+    from voice import Transcriber, VoiceSpool
+    monkeypatch.setenv('TRANSCRIBER', 'stub')
+    monkeypatch.setenv('TRANSCRIBER_STUB_TEXT', QUESTION)
+    spool = VoiceSpool(directory=str(tmp_path), max_bytes=64 * 1024)
+    transcriber = Transcriber(workers=1, max_pending=1)
+    monkeypatch.setattr(server, 'voice_spool', spool)
+    monkeypatch.setattr(server, 'transcriber', transcriber)
+    yield transcriber
+    transcriber.close()
+
+
+async def post_clip(client, headers, body, content_type='audio/wav'):
+    return await client.post('/api/tutor/voice?session_id=voice', content=body,
+                             headers={**headers, 'Content-Type': content_type})
+
+
+async def test_spools_the_clip_and_answers_the_transcript(server, client, student, voice, tmp_path, monkeypatch):
+    clip = recording(0.5)
+    spooled = []
+    transcribe = voice.transcribe
+
+    async def spy(path, language=None):
+        spooled.append((path, os.path.getsize(path)))
+        return await transcribe(path, language)
+
+    monkeypatch.setattr(voice, 'transcribe', spy)
+    response = await post_clip(client, student, clip)
+
+    assert response.status_code == 200
+    assert response.json()["transcript"] == QUESTION
+    assert response.json()["duration"] == pytest.approx(0.5, abs=0.01)
+    [(path, size)] = spooled
+    assert os.path.dirname(path) == str(tmp_path) and size == len(clip)
+    assert os.listdir(tmp_path) == []
+    # The transcript goes through the same tutor turn as a typed question
+    asked = await server.db.chat_messages.find_one({"session_id": "voice", "role": "user"})
+    assert asked["content"] == QUESTION and asked["source"] == "voice"
+    assert await server.db.chat_messages.count_documents({"session_id": "voice", "role": "assistant"}) == 1
+
+
+async def test_refuses_a_declared_oversized_body(client, student, voice, tmp_path):
+    response = await post_clip(client, student, b'\0' * (128 * 1024))
+
+    assert response.status_code == 413
+    assert os.listdir(tmp_path) == []
+
+
+async def test_refuses_a_streamed_body_once_it_grows_too_large(client, student, voice, tmp_path):
+    async def chunks():
+        for _ in range(8):
+            yield b'\0' * (16 * 1024)
+
+    response = await post_clip(client, student, chunks())
+
+    assert response.status_code == 413
+    assert os.listdir(tmp_path) == []
+
+
+async def test_refuses_an_empty_body(client, student, voice, tmp_path):
+    response = await post_clip(client, student, b'')
+
+    assert response.status_code == 400
+    assert os.listdir(tmp_path) == []
+
+
+async def test_refuses_a_non_audio_content_type(client, student, voice):
+    response = await post_clip(client, student, recording(0.5), content_type='text/plain')
+
+    assert response.status_code == 415
+
+
+async def test_answers_503_with_retry_after_when_the_pool_is_full(client, student, voice):
+    first = asyncio.ensure_future(post_clip(client, student, recording(0.5)))
+    # The first clip holds the only pending slot while its worker process starts
+    while voice.pending < voice.max_pending:
+        await asyncio.sleep(0.01)
+
+    busy = await post_clip(client, student, recording(0.5))
+
+    assert busy.status_code == 503
+    assert int(busy.headers['Retry-After']) > 0
+    assert (await first).status_code == 200